@@ -1,17 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g, has_app_context, has_request_context, stream_with_context
 from flask_mail import Mail, Message
 import sqlite3
 import psycopg2
-from psycopg2 import pool
-import pandas as pd
+from psycopg2 import pool, extras
 import numpy as np
+from scipy.optimize import linear_sum_assignment
+import csv
+import io
+import json
 import os
-from model.no_show_model import predict_no_show, predict_reschedule, calculate_no_show_history, calculate_priority_score
+import queue
+import subprocess
+import sys
+import threading
+import uuid
+from appointment_time import (SLOT_MINUTES, to_day, today_day, day_to_date, format_day, is_weekend,
+                              to_slot_minute, format_slot, is_morning)
+from migrations import apply_migrations, rebuild_patient_stats
+from overbooking import simulate_day, SIMULATION_RUNS, MAX_SIMULATION_RUNS, OVERFLOW_TARGET
+from model.no_show_model import score_appointment, score_appointments, calculate_priority_score, model_registry
 from dateutil.relativedelta import relativedelta
-from datetime import datetime, timedelta, date
 from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from functools import wraps, lru_cache
+from contextlib import contextmanager
+import hashlib
 import logging
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
 
@@ -48,35 +64,129 @@ def login_required(role):
 # Database configuration
 DB_TYPE = os.getenv("DB_TYPE", "sqlite")
 
+# Rows per transaction for execute_many() and AppointmentBatch
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+
+# SQLite tuning: WAL lets readers run alongside the writer and, with synchronous=NORMAL,
+# only fsyncs at checkpoints; cache_size is in KiB (negative), mmap_size in bytes
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    'cache_size': -int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000")),
+    'mmap_size': int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    'temp_store': 'MEMORY',
+    'busy_timeout': int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+}
+
 def get_sqlite_conn():
     try:
-        conn = sqlite3.connect("database.db")
+        # Connections move between request threads through sqlite_pool, one thread at a time
+        conn = sqlite3.connect("database.db", check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE)
         conn.row_factory = sqlite3.Row
+        for pragma, value in SQLITE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
         return conn
     except sqlite3.Error as e:
         app.logger.error(f"Failed to connect to SQLite database: {e}")
         raise
 
+# Keeps SQLite connections open between queries so each one keeps its page cache, mmap
+# and prepared-statement cache. Same getconn/putconn interface as the PostgreSQL pool;
+# past maxconn idle connections, returned ones are closed instead of kept.
+class SQLiteConnectionPool:
+    def __init__(self, maxconn):
+        self._idle = queue.LifoQueue(maxsize=maxconn)
+
+    def getconn(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return get_sqlite_conn()
+
+    def putconn(self, conn):
+        # Never hand the next caller a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def closeall(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+# psycopg2's ThreadedConnectionPool is safe to share between threads but raises
+# PoolError the moment every connection is checked out. This one makes the caller wait
+# up to timeout seconds for a connection instead, so a gunicorn worker running more
+# threads than PG_POOL_MAX_SIZE queues requests rather than failing them.
+class PostgresConnectionPool(pool.ThreadedConnectionPool):
+    def __init__(self, minconn, maxconn, timeout, **kwargs):
+        super().__init__(minconn, maxconn, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise pool.PoolError(f"No PostgreSQL connection became free within {self._timeout}s")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+# Size the pool to at least the number of threads per worker (gunicorn --threads)
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "20"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))
+# Rows per round-trip when iter_query() streams a large read
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "2000"))
+
+PG_CONNECT_PARAMS = {
+    'dbname': os.getenv("DB_NAME"),
+    'user': os.getenv("DB_USER"),
+    'password': os.getenv("DB_PASSWORD"),
+    'host': os.getenv("DB_HOST"),
+    'port': os.getenv("DB_PORT"),
+}
+
 if DB_TYPE == "postgresql":
     try:
-        db_pool = psycopg2.pool.SimpleConnectionPool(
-            1, 20,
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT")
-        )
+        db_pool = PostgresConnectionPool(PG_POOL_MIN_SIZE, PG_POOL_MAX_SIZE, PG_POOL_TIMEOUT, **PG_CONNECT_PARAMS)
     except Exception as e:
         app.logger.error(f"Failed to initialize PostgreSQL pool: {e}")
         db_pool = None
 else:
     db_pool = None
 
+sqlite_pool = SQLiteConnectionPool(SQLITE_POOL_SIZE) if DB_TYPE == "sqlite" else None
+
+# patient_stats (migration 5) is kept in step by every appointment write, so startup only
+# recounts it when it is empty while appointments exist. After writing appointments
+# outside the app, run `python migrations.py --rebuild-patient-stats`.
+def ensure_patient_stats(conn):
+    c = conn.cursor()
+    c.execute("SELECT EXISTS (SELECT 1 FROM patient_stats), EXISTS (SELECT 1 FROM appointments WHERE patient_id IS NOT NULL)")
+    has_stats, has_appointments = c.fetchone()
+    if has_appointments and not has_stats:
+        rebuild_patient_stats(conn)
+        app.logger.info("Rebuilt empty patient_stats from appointments")
+
 # Database initialization
 def init_db():
     if DB_TYPE == "sqlite":
-        conn = get_sqlite_conn()
+        conn = sqlite_pool.getconn()
         try:
             c = conn.cursor()
             c.execute('''CREATE TABLE IF NOT EXISTS users 
@@ -90,6 +200,8 @@ def init_db():
                          (id INTEGER PRIMARY KEY AUTOINCREMENT, hospital_id INTEGER, department_id INTEGER, name TEXT,
                           FOREIGN KEY (hospital_id) REFERENCES hospitals(id),
                           FOREIGN KEY (department_id) REFERENCES departments(id))''')
+            # Baseline schema: apply_migrations() below brings appointments up to date
+            # (appointment_day/slot_minute instead of the date/slot_time text columns)
             c.execute('''CREATE TABLE IF NOT EXISTS appointments 
                          (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id INTEGER, hospital_id INTEGER, department_id INTEGER, 
                           doctor_id INTEGER, slot_time TEXT, date TEXT, no_show_prob REAL, reschedule_prob REAL, status TEXT,
@@ -97,6 +209,11 @@ def init_db():
                           FOREIGN KEY (hospital_id) REFERENCES hospitals(id),
                           FOREIGN KEY (department_id) REFERENCES departments(id),
                           FOREIGN KEY (doctor_id) REFERENCES doctors(id))''')
+            conn.commit()
+            applied = apply_migrations(conn, DB_TYPE)
+            if applied:
+                app.logger.info(f"Applied schema migrations {applied}")
+            ensure_patient_stats(conn)
 
             # Seed hospitals, departments, and doctors
             hospitals = [
@@ -164,7 +281,7 @@ def init_db():
             app.logger.error(f"Failed to initialize SQLite database: {e}")
             raise
         finally:
-            conn.close()
+            sqlite_pool.putconn(conn)
     elif DB_TYPE == "postgresql" and db_pool:
         conn = db_pool.getconn()
         try:
@@ -180,6 +297,7 @@ def init_db():
                              (id SERIAL PRIMARY KEY, hospital_id INTEGER, department_id INTEGER, name TEXT,
                               FOREIGN KEY (hospital_id) REFERENCES hospitals(id),
                               FOREIGN KEY (department_id) REFERENCES departments(id))''')
+                # Baseline schema, brought up to date by apply_migrations() below
                 c.execute('''CREATE TABLE IF NOT EXISTS appointments 
                              (id SERIAL PRIMARY KEY, patient_id INTEGER, hospital_id INTEGER, department_id INTEGER, 
                               doctor_id INTEGER, slot_time TEXT, date TEXT, no_show_prob REAL, reschedule_prob REAL, status TEXT,
@@ -187,6 +305,11 @@ def init_db():
                               FOREIGN KEY (hospital_id) REFERENCES hospitals(id),
                               FOREIGN KEY (department_id) REFERENCES departments(id),
                               FOREIGN KEY (doctor_id) REFERENCES doctors(id))''')
+                conn.commit()
+                applied = apply_migrations(conn, DB_TYPE)
+                if applied:
+                    app.logger.info(f"Applied schema migrations {applied}")
+                ensure_patient_stats(conn)
 
                 hospitals = [
                     ("Lagos General Hospital", "Lagos"),
@@ -242,15 +365,82 @@ def init_db():
             raise
         finally:
             db_pool.putconn(conn)
-
-# Database query helper
+    reference_data.invalidate()
+    slot_occupancy.invalidate()
+
+# Request-scoped unit of work: every query_db call inside the block runs on one pooled
+# connection in one transaction, and their commit=True is deferred to a single commit
+# when the block exits (a rollback if it raises). SQLite takes the write lock up front
+# with BEGIN IMMEDIATE, so a slot check and the write that depends on it are atomic;
+# on PostgreSQL lock_doctor_schedule() does the same per doctor. Nested blocks join the
+# outer one. Slot occupancy changes recorded inside the block reach slot_occupancy
+# once it commits.
+@contextmanager
+def unit_of_work():
+    if g.get('db_conn') is not None:
+        yield g.db_conn
+        return
+    pool = sqlite_pool if DB_TYPE == "sqlite" else db_pool
+    if pool is None:
+        raise Exception("Database not configured properly")
+    conn = pool.getconn()
+    g.db_conn = conn
+    g.occupancy_changes = []
+    committed = False
+    try:
+        if DB_TYPE == "sqlite":
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.commit()
+        committed = True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        g.db_conn = None
+        pool.putconn(conn)
+        slot_occupancy.finish(g.pop('occupancy_changes'), committed)
+
+# Queries are written once with SQLite's ? placeholders. For psycopg2 each ? outside a
+# quoted literal becomes %s and every literal % is doubled.
+@lru_cache(maxsize=1024)
+def dialect(query):
+    if DB_TYPE != "postgresql":
+        return query
+    translated = []
+    quote = None
+    for ch in query:
+        if ch == '%':
+            translated.append('%%')
+        elif quote:
+            translated.append(ch)
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+            translated.append(ch)
+        elif ch == '?':
+            translated.append('%s')
+        else:
+            translated.append(ch)
+    return ''.join(translated)
+
+# Hold a doctor's schedule until the current unit of work commits, so two requests
+# cannot both see a slot as free. SQLite already holds the write lock.
+def lock_doctor_schedule(doctor_id):
+    if DB_TYPE == "postgresql":
+        query_db("SELECT id FROM doctors WHERE id = ? FOR UPDATE", (doctor_id,))
+
+# Database query helper. Inside unit_of_work() it reuses that connection and leaves
+# committing to the unit of work.
 def query_db(query, args=(), one=False, commit=False):
+    shared = g.get('db_conn') if has_app_context() else None
     if DB_TYPE == "sqlite":
-        conn = get_sqlite_conn()
+        conn = sqlite_pool.getconn() if shared is None else shared
         try:
             c = conn.cursor()
             c.execute(query, args)
-            if commit:
+            if commit and shared is None:
                 conn.commit()
             rv = c.fetchall()
             if rv:
@@ -262,15 +452,16 @@ def query_db(query, args=(), one=False, commit=False):
             app.logger.error(f"SQLite query error: {e}")
             raise
         finally:
-            conn.close()
+            if shared is None:
+                sqlite_pool.putconn(conn)
     elif DB_TYPE == "postgresql" and db_pool:
-        conn = db_pool.getconn()
+        conn = db_pool.getconn() if shared is None else shared
         try:
             with conn.cursor() as c:
-                c.execute(query, args)
-                if commit:
+                c.execute(dialect(query), args)
+                rv = c.fetchall() if c.description else None
+                if commit and shared is None:
                     conn.commit()
-                rv = c.fetchall() if not commit else None
                 if rv:
                     columns = [desc[0] for desc in c.description]
                     rv = [dict(zip(columns, row)) for row in rv]
@@ -280,10 +471,603 @@ def query_db(query, args=(), one=False, commit=False):
             app.logger.error(f"PostgreSQL query error: {e}")
             raise
         finally:
-            db_pool.putconn(conn)
+            if shared is None:
+                db_pool.putconn(conn)
     else:
         raise Exception("Database not configured properly")
 
+# Streams a large read as dict rows instead of materializing the whole result. On
+# PostgreSQL a named (server-side) cursor keeps the result on the server and fetches
+# chunk_size rows per round-trip; SQLite steps its cursor chunk_size rows at a time.
+# Like query_db it joins the current unit_of_work() if there is one.
+def iter_query(query, args=(), chunk_size=STREAM_CHUNK_SIZE):
+    shared = g.get('db_conn') if has_app_context() else None
+    db = sqlite_pool if DB_TYPE == "sqlite" else db_pool
+    if db is None:
+        raise Exception("Database not configured properly")
+    conn = db.getconn() if shared is None else shared
+    try:
+        if DB_TYPE == "postgresql":
+            c = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+            c.itersize = chunk_size
+        else:
+            c = conn.cursor()
+        try:
+            c.execute(dialect(query), args)
+            columns = None
+            while True:
+                rows = c.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [desc[0] for desc in c.description]
+                for row in rows:
+                    yield dict(zip(columns, row))
+        finally:
+            c.close()
+    finally:
+        if shared is None:
+            db.putconn(conn)
+
+# Bulk counterpart of query_db: runs query once per parameter row, committing every
+# chunk_size rows. Inside unit_of_work() all rows join that transaction instead.
+# PostgreSQL sends each chunk in pages of statements rather than one round-trip per row.
+def execute_many(query, rows, chunk_size=BULK_CHUNK_SIZE):
+    rows = list(rows)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        with unit_of_work() as conn:
+            if DB_TYPE == "sqlite":
+                conn.executemany(query, chunk)
+            else:
+                with conn.cursor() as c:
+                    extras.execute_batch(c, dialect(query), chunk, page_size=100)
+    return len(rows)
+
+# Adds a (total, no_show, scheduled, last_day) delta to a patient's patient_stats row
+PATIENT_STATS_UPSERT = """
+    INSERT INTO patient_stats (patient_id, total_appointments, no_show_count, scheduled_count, last_appointment_day)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (patient_id) DO UPDATE SET
+        total_appointments = patient_stats.total_appointments + excluded.total_appointments,
+        no_show_count = patient_stats.no_show_count + excluded.no_show_count,
+        scheduled_count = patient_stats.scheduled_count + excluded.scheduled_count,
+        last_appointment_day = CASE
+            WHEN patient_stats.last_appointment_day IS NULL
+              OR excluded.last_appointment_day > patient_stats.last_appointment_day
+            THEN excluded.last_appointment_day ELSE patient_stats.last_appointment_day END
+"""
+
+# patient_stats delta for one appointment write. old and new are the row's (day, status)
+# before and after the write; old=None for a new booking.
+def patient_stats_delta(old=None, new=None):
+    changes = [(-1, old), (1, new)]
+    changes = [(sign, row) for sign, row in changes if row is not None]
+    total = sum(sign for sign, _ in changes)
+    no_shows = sum(sign for sign, (_, status) in changes if status == 'no_show')
+    scheduled = sum(sign for sign, (_, status) in changes if status == 'scheduled')
+    last_day = new[0] if new is not None else None
+    return total, no_shows, scheduled, last_day
+
+# Apply one appointment write to patient_stats
+def update_patient_stats(patient_id, old=None, new=None):
+    if old == new:
+        return
+    query_db(PATIENT_STATS_UPSERT, (patient_id, *patient_stats_delta(old, new)), commit=True)
+
+# appointments.updated_at for a write happening now (Unix seconds); incremental
+# exports read rows in (updated_at, id) order
+def changed_at():
+    return int(time.time())
+
+# Collects appointment changes from a sweep or backfill and writes them in chunks: per
+# chunk, one executemany per set of changed columns plus one patient_stats upsert per
+# patient, all in one transaction. Thousands of rows commit tens of times instead of
+# once (plus once for patient_stats) per appointment.
+class AppointmentBatch:
+    COLUMNS = ('status', 'appointment_day', 'slot_minute', 'no_show_prob', 'reschedule_prob')
+
+    def __init__(self, chunk_size=BULK_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        # appt_id -> {column: value}, in the order appointments were first touched
+        self._changes = {}
+        # appt_id -> [(patient_id, old, new)]
+        self._stats = {}
+        # appt_id -> [(doctor_id, old, new)] slot occupancy moves
+        self._slots = {}
+
+    def __len__(self):
+        return len(self._changes)
+
+    # Queue column changes for an appointment; later calls for the same id overwrite
+    # earlier values. old/new (day, status) pairs also queue the patient_stats change,
+    # and slot=(doctor_id, old, new) records the slot_occupancy change for the old and
+    # new slots, applied once the chunk commits.
+    def update(self, appt_id, patient_id=None, old=None, new=None, slot=None, **changes):
+        unknown = set(changes) - set(self.COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot bulk update appointment columns: {', '.join(sorted(unknown))}")
+        self._changes.setdefault(appt_id, {}).update(changes)
+        if patient_id is not None and old != new:
+            self._stats.setdefault(appt_id, []).append((patient_id, old, new))
+        if slot is not None:
+            self._slots.setdefault(appt_id, []).append(slot)
+
+    # Write everything queued so far and return the number of appointments written
+    def flush(self):
+        appt_ids = list(self._changes)
+        for start in range(0, len(appt_ids), self.chunk_size):
+            chunk = appt_ids[start:start + self.chunk_size]
+            with unit_of_work():
+                for query, rows in self._update_statements(chunk):
+                    execute_many(query, rows)
+                stats_rows = self._stats_rows(chunk)
+                if stats_rows:
+                    execute_many(PATIENT_STATS_UPSERT, stats_rows)
+                for appt_id in chunk:
+                    for doctor_id, old, new in self._slots.get(appt_id, []):
+                        slot_occupancy.change(doctor_id, old, new)
+        self._changes.clear()
+        self._stats.clear()
+        self._slots.clear()
+        return len(appt_ids)
+
+    def _update_statements(self, appt_ids):
+        groups = {}
+        for appt_id in appt_ids:
+            changes = self._changes[appt_id]
+            columns = tuple(column for column in self.COLUMNS if column in changes)
+            if columns:
+                groups.setdefault(columns, []).append(tuple(changes[column] for column in columns) + (changed_at(), appt_id))
+        for columns, rows in groups.items():
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            yield f"UPDATE appointments SET {assignments}, updated_at = ? WHERE id = ?", rows
+
+    # Net patient_stats delta per patient across the chunk
+    def _stats_rows(self, appt_ids):
+        totals = {}
+        for appt_id in appt_ids:
+            for patient_id, old, new in self._stats.get(appt_id, []):
+                total, no_shows, scheduled, last_day = patient_stats_delta(old, new)
+                acc = totals.setdefault(patient_id, [0, 0, 0, None])
+                acc[0] += total
+                acc[1] += no_shows
+                acc[2] += scheduled
+                if last_day is not None and (acc[3] is None or last_day > acc[3]):
+                    acc[3] = last_day
+        return [(patient_id, *acc) for patient_id, acc in totals.items()]
+
+# patient_stats columns for queries that LEFT JOIN patient_stats ps, so a caller that
+# already reads the appointment or patient row can hand them to get_patient_history()
+PATIENT_STATS_COLUMNS = "ps.total_appointments, ps.no_show_count, ps.scheduled_count, ps.last_appointment_day"
+PATIENT_STATS_QUERY = "SELECT total_appointments, no_show_count, scheduled_count, last_appointment_day FROM patient_stats WHERE patient_id = ?"
+PATIENT_HISTORY_QUERY = """
+    SELECT COUNT(*) AS total_appointments,
+           COALESCE(SUM(CASE WHEN status = 'no_show' THEN 1 ELSE 0 END), 0) AS no_show_count,
+           COALESCE(SUM(CASE WHEN status = 'scheduled' THEN 1 ELSE 0 END), 0) AS scheduled_count
+    FROM appointments WHERE patient_id = ? AND appointment_day < ?
+"""
+
+# A patient's appointment totals before day number as_of. When every appointment the
+# patient has falls before as_of, patient_stats answers directly; older as-of dates
+# count the rows before as_of instead. stats is a row already holding
+# PATIENT_STATS_COLUMNS (all NULL when the patient has no stats row).
+def get_patient_history(patient_id, as_of, stats=None):
+    if stats is None:
+        stats = query_db(PATIENT_STATS_QUERY, (patient_id,), one=True)
+    history = history_from_stats(stats, as_of)
+    if history is None:
+        history = query_db(PATIENT_HISTORY_QUERY, (patient_id, as_of), one=True)
+    return history
+
+# The history patient_stats answers on its own, or None when the rows before as_of have
+# to be counted with PATIENT_HISTORY_QUERY
+def history_from_stats(stats, as_of):
+    if stats is None or stats['total_appointments'] is None:
+        return {'total_appointments': 0, 'no_show_count': 0, 'scheduled_count': 0}
+    if stats['last_appointment_day'] is not None and stats['last_appointment_day'] < as_of:
+        return stats
+    return None
+
+# No-show history score (0-1) computed as calculate_no_show_history does: past
+# appointments still 'scheduled' over all past appointments
+def no_show_history_score(history):
+    total = history['total_appointments']
+    return history['scheduled_count'] / total if total > 0 else 0.0
+
+def patient_no_show_history(patient_id, as_of, stats=None):
+    return no_show_history_score(get_patient_history(patient_id, as_of, stats))
+
+PATIENT_RANGE_QUERY = """SELECT appointment_day, status FROM appointments
+                         WHERE patient_id = ? AND appointment_day >= ? AND appointment_day < ?"""
+
+# The patient's priority score as of each day first_day..last_day. The history before
+# first_day is read once and the patient's appointments inside the range are added
+# day by day, so the scores match patient_no_show_history() for each day.
+def priority_scores_by_day(patient_id, first_day, last_day, stats=None):
+    if stats is None:
+        stats = query_db(PATIENT_STATS_QUERY, (patient_id,), one=True)
+    history = history_from_stats(stats, first_day)
+    if history is not None:
+        # Nothing on or after first_day, so every day has the same history
+        return np.full(last_day - first_day + 1, calculate_priority_score(no_show_history_score(history)))
+    history = query_db(PATIENT_HISTORY_QUERY, (patient_id, first_day), one=True)
+    # An appointment on day d counts from day d + 1 on
+    added = np.zeros(last_day - first_day + 2)
+    added_scheduled = np.zeros(added.shape)
+    for row in query_db(PATIENT_RANGE_QUERY, (patient_id, first_day, last_day)):
+        added[row['appointment_day'] - first_day + 1] += 1
+        added_scheduled[row['appointment_day'] - first_day + 1] += row['status'] == 'scheduled'
+    totals = history['total_appointments'] + np.cumsum(added)[:-1]
+    scheduled = history['scheduled_count'] + np.cumsum(added_scheduled)[:-1]
+    return calculate_priority_score(np.where(totals > 0, scheduled / np.maximum(totals, 1), 0.0))
+
+# Overbooking rules for a slot that already has appointments
+MAX_APPOINTMENTS_PER_SLOT = 2
+COMBINED_NO_SHOW_THRESHOLD = 50.0
+PRIORITY_THRESHOLD = 0.7
+
+# Why a patient cannot take a slot holding existing_appts (the slot's non-closed
+# appointments with their no_show_prob), or None if they can. The patient's history is
+# only read when the slot is shared but not full.
+def slot_refusal(existing_appts, patient_id, day, stats=None):
+    if not existing_appts or len(existing_appts) >= MAX_APPOINTMENTS_PER_SLOT:
+        return slot_refusal_for_priority(existing_appts, None)
+    priority_score = calculate_priority_score(patient_no_show_history(patient_id, day, stats))
+    return slot_refusal_for_priority(existing_appts, priority_score)
+
+def slot_refusal_for_priority(existing_appts, priority_score):
+    combined_no_show_prob = sum(appt['no_show_prob'] or 0.0 for appt in existing_appts)
+    return occupancy_refusal(len(existing_appts), combined_no_show_prob, priority_score)
+
+# The same rules for a slot known only by its booking count and summed no_show_prob
+def occupancy_refusal(bookings, combined_no_show_prob, priority_score):
+    if not bookings:
+        return None
+    if bookings >= MAX_APPOINTMENTS_PER_SLOT:
+        return 'Slot is fully booked'
+    if priority_score < PRIORITY_THRESHOLD:
+        return 'Priority score too low'
+    if combined_no_show_prob >= COMBINED_NO_SHOW_THRESHOLD:
+        return 'Combined no-show risk too high'
+    return None
+
+# {slot_minute: (bookings, summed no_show_prob)} for a doctor's non-closed appointments on a day
+def day_occupancy(day_appts):
+    occupancy = {}
+    for appt in day_appts:
+        bookings, no_show_sum = occupancy.get(appt['slot_minute'], (0, 0.0))
+        occupancy[appt['slot_minute']] = (bookings + 1, no_show_sum + (appt['no_show_prob'] or 0.0))
+    return occupancy
+
+# Slots (minutes) a patient with priority_score can book on a day with this occupancy
+def available_slot_minutes(occupancy, priority_score):
+    return [slot for slot in SLOT_MINUTES if occupancy_refusal(*occupancy.get(slot, (0, 0.0)), priority_score) is None]
+
+SLOT_INDEX = {slot: col for col, slot in enumerate(SLOT_MINUTES)}
+
+# Occupancy of consecutive days as (bookings, summed no_show_prob) arrays with one row
+# per day and one column per SLOT_MINUTES slot
+def occupancy_matrix(occupancies):
+    bookings = np.zeros((len(occupancies), len(SLOT_MINUTES)), dtype=np.int64)
+    no_show_sums = np.zeros(bookings.shape)
+    for row, occupancy in enumerate(occupancies):
+        for slot, (count, no_show_sum) in occupancy.items():
+            col = SLOT_INDEX.get(slot)
+            if col is not None:
+                bookings[row, col] = count
+                no_show_sums[row, col] = no_show_sum
+    return bookings, no_show_sums
+
+# Where a reschedule may put a patient, over occupancy arrays with one row per day and
+# priority_scores holding the patient's score as of each row's day: a free slot, or a
+# slot holding its day's only booking when that booking's no_show_prob is under
+# COMBINED_NO_SHOW_THRESHOLD, and either only on days the score reaches
+# PRIORITY_THRESHOLD. These are the reschedule rules, which differ from the booking
+# rules in occupancy_refusal().
+def reschedule_slots(bookings, no_show_sums, priority_scores):
+    day_open = bookings.sum(axis=1) < MAX_APPOINTMENTS_PER_SLOT
+    open_slots = (bookings == 0) | (day_open[:, None] & (no_show_sums < COMBINED_NO_SHOW_THRESHOLD))
+    return (np.asarray(priority_scores)[:, None] >= PRIORITY_THRESHOLD) & open_slots
+
+# Hospitals, departments and doctors are seeded reference data that almost never
+# changes, so all three tables are read in one go and served from memory. Each dropdown
+# list is kept as its finished JSON body and ETag, so /get_departments and /get_doctors
+# answer (or 304) without touching the database. Call reference_data.invalidate() after
+# changing those tables; other worker processes pick the change up within
+# REFERENCE_DATA_TTL seconds.
+REFERENCE_DATA_TTL = float(os.getenv("REFERENCE_DATA_TTL", "300"))
+# Seconds browsers may reuse a dropdown list before revalidating it with its ETag
+REFERENCE_MAX_AGE = int(os.getenv("REFERENCE_MAX_AGE", "60"))
+
+ReferenceSnapshot = namedtuple('ReferenceSnapshot', ['hospitals', 'hospitals_by_id', 'departments', 'doctors', 'doctor_ids', 'known_doctor_ids', 'empty', 'loaded_at'])
+
+# The body jsonify() produces for data, for responses built outside a Flask view
+def json_bytes(data):
+    return app.json.response(data).get_data()
+
+# (body, etag) for a JSON dropdown list
+def json_body(data):
+    body = json_bytes(data)
+    return body, hashlib.sha1(body).hexdigest()
+
+class ReferenceDataCache:
+    def __init__(self, ttl=REFERENCE_DATA_TTL):
+        self.ttl = ttl
+        self._snapshot = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+        self.load_count = 0
+
+    def _load(self):
+        hospitals = query_db("SELECT id, name, location FROM hospitals ORDER BY id")
+        departments, doctors = {}, {}
+        for dept in query_db("SELECT id, name, hospital_id FROM departments ORDER BY id"):
+            departments.setdefault(dept['hospital_id'], []).append((dept['id'], dept['name']))
+        for doc in query_db("SELECT id, name, department_id FROM doctors ORDER BY id"):
+            doctors.setdefault(doc['department_id'], []).append((doc['id'], doc['name']))
+        return ReferenceSnapshot(
+            hospitals=hospitals,
+            hospitals_by_id={hospital['id']: hospital for hospital in hospitals},
+            departments={hospital_id: json_body(rows) for hospital_id, rows in departments.items()},
+            doctors={department_id: json_body(rows) for department_id, rows in doctors.items()},
+            doctor_ids={department_id: [doctor_id for doctor_id, _ in rows] for department_id, rows in doctors.items()},
+            known_doctor_ids=frozenset(doctor_id for rows in doctors.values() for doctor_id, _ in rows),
+            empty=json_body([]),
+            loaded_at=datetime.now()
+        )
+
+    # The cached snapshot, or None once it has expired or been invalidated
+    def current(self):
+        return self._snapshot if time.monotonic() < self._expires else None
+
+    def get(self):
+        snapshot = self.current()
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            snapshot = self.current()
+            if snapshot is None:
+                snapshot = self._load()
+                self._snapshot = snapshot
+                self._expires = time.monotonic() + self.ttl
+                self.load_count += 1
+            return snapshot
+
+    def invalidate(self):
+        self._expires = 0.0
+
+    def hospitals(self):
+        return self.get().hospitals
+
+    def hospital(self, hospital_id):
+        try:
+            return self.get().hospitals_by_id.get(int(hospital_id))
+        except (TypeError, ValueError):
+            return None
+
+    def stats(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'loaded': False}
+        return {
+            'loaded': True,
+            'fresh': self.current() is not None,
+            'hospitals': len(snapshot.hospitals),
+            'hospitals_with_departments': len(snapshot.departments),
+            'departments_with_doctors': len(snapshot.doctors),
+            'last_load': snapshot.loaded_at.isoformat(),
+            'load_count': self.load_count,
+        }
+
+reference_data = ReferenceDataCache()
+
+# A cached dropdown list with its validators; a matching If-None-Match gets a 304
+def reference_response(body, etag):
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = REFERENCE_MAX_AGE
+    return response.make_conditional(request)
+
+# Queries shared by the booking lookups here and their async versions in async_api.py
+DAY_APPOINTMENTS_QUERY = """SELECT slot_minute, patient_id, no_show_prob
+                            FROM appointments
+                            WHERE doctor_id = ? AND appointment_day = ? AND status != 'closed'"""
+SLOT_APPOINTMENTS_QUERY = """SELECT patient_id, no_show_prob FROM appointments
+                             WHERE doctor_id = ? AND appointment_day = ? AND slot_minute = ? AND status != 'closed'"""
+RANGE_APPOINTMENTS_QUERY = """SELECT doctor_id, appointment_day, slot_minute, patient_id, no_show_prob
+                              FROM appointments
+                              WHERE doctor_id IN ({doctors}) AND appointment_day BETWEEN ? AND ? AND status != 'closed'"""
+
+# RANGE_APPOINTMENTS_QUERY and its parameters for the (doctor_id, day) keys of tokens
+def range_appointments_query(tokens):
+    doctor_ids = sorted({doctor_id for doctor_id, _ in tokens})
+    days = [day for _, day in tokens]
+    return RANGE_APPOINTMENTS_QUERY.format(doctors=', '.join('?' * len(doctor_ids))), (*doctor_ids, min(days), max(days))
+
+# Per-(doctor, day) slot occupancy kept in memory so availability lookups skip the
+# database. Each cached day maps slot_minute -> (bookings, summed no_show_prob) over its
+# non-closed appointments. Appointment writes record their slot moves with
+# slot_occupancy.change() inside unit_of_work(), and the cached days are updated when
+# it commits. A day read while a write to it is in flight is returned but not cached, so
+# an entry never misses a booking or counts one twice. Writes made by other worker
+# processes show up once an entry expires after OCCUPANCY_TTL seconds. Booking and
+# rescheduling still check the slot in the database under the schedule lock, so a
+# stale entry can only make a lookup out of date; it cannot overbook a slot.
+OCCUPANCY_TTL = float(os.getenv("OCCUPANCY_TTL", "30"))
+OCCUPANCY_MAX_DAYS = int(os.getenv("OCCUPANCY_MAX_DAYS", "20000"))
+
+# An appointment's (day, slot_minute, no_show_prob) as slot occupancy, or None once closed
+def booked_slot(day, slot_minute, no_show_prob, status):
+    return None if status == 'closed' else (day, slot_minute, no_show_prob)
+
+class SlotOccupancyIndex:
+    def __init__(self, ttl=OCCUPANCY_TTL, max_days=OCCUPANCY_MAX_DAYS):
+        self.ttl = ttl
+        self.max_days = max_days
+        # (doctor_id, day) -> (expiry, {slot_minute: (bookings, no_show_sum)}), oldest use first
+        self._days = OrderedDict()
+        # (doctor_id, day) -> [version, writes in flight, reads in flight] while any of
+        # them is non-zero or the day is cached
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    # (occupancy, None) when the day is cached, else (None, token) to hand to store()
+    # with the day's rows once they have been read
+    def lookup(self, doctor_id, day):
+        key = (int(doctor_id), int(day))
+        with self._lock:
+            entry = self._days.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._days.move_to_end(key)
+                return dict(entry[1]), None
+            state = self._keys.setdefault(key, [0, 0, 0])
+            state[2] += 1
+            return None, (key, state[0])
+
+    # Cache a day read after lookup() missed; rows is None when the read failed
+    def store(self, token, rows):
+        key, version = token
+        occupancy = day_occupancy(rows) if rows is not None else None
+        with self._lock:
+            state = self._keys[key]
+            state[2] -= 1
+            if occupancy is not None and state[0] == version and state[1] == 0:
+                self._days[key] = (time.monotonic() + self.ttl, dict(occupancy))
+                self._days.move_to_end(key)
+                while len(self._days) > self.max_days:
+                    evicted, _ = self._days.popitem(last=False)
+                    self._release(evicted)
+            self._release(key)
+        return occupancy
+
+    def get(self, doctor_id, day):
+        occupancy, token = self.lookup(doctor_id, day)
+        if occupancy is not None:
+            return occupancy
+        rows = None
+        try:
+            rows = query_db(DAY_APPOINTMENTS_QUERY, token[0])
+        finally:
+            occupancy = self.store(token, rows)
+        return occupancy
+
+    # Cached days of doctor_ids over first_day..last_day as ({doctor_id: {day: occupancy}},
+    # tokens), tokens mapping each (doctor_id, day) not cached to its lookup() token
+    def lookup_range(self, doctor_ids, first_day, last_day):
+        occupancies, tokens = {}, {}
+        for doctor_id in doctor_ids:
+            days = occupancies.setdefault(int(doctor_id), {})
+            for day in range(first_day, last_day + 1):
+                occupancy, token = self.lookup(doctor_id, day)
+                if occupancy is None:
+                    tokens[token[0]] = token
+                else:
+                    days[day] = occupancy
+        return occupancies, tokens
+
+    # Cache the days lookup_range() missed from the rows of range_appointments_query()
+    # (None when the read failed) and add them to occupancies
+    def store_range(self, occupancies, tokens, rows):
+        rows_by_key = None
+        if rows is not None:
+            rows_by_key = {key: [] for key in tokens}
+            for row in rows:
+                key = (row['doctor_id'], row['appointment_day'])
+                if key in rows_by_key:
+                    rows_by_key[key].append(row)
+        for (doctor_id, day), token in tokens.items():
+            occupancies[doctor_id][day] = self.store(token, None if rows_by_key is None else rows_by_key[(doctor_id, day)])
+        return occupancies
+
+    # {doctor_id: {day: occupancy}} for each of doctor_ids over first_day..last_day; the
+    # days not cached are read together with one range query
+    def get_ranges(self, doctor_ids, first_day, last_day):
+        occupancies, tokens = self.lookup_range(doctor_ids, first_day, last_day)
+        if tokens:
+            rows = None
+            try:
+                rows = query_db(*range_appointments_query(tokens))
+            finally:
+                self.store_range(occupancies, tokens, rows)
+        return occupancies
+
+    def get_range(self, doctor_id, first_day, last_day):
+        return self.get_ranges([doctor_id], first_day, last_day)[int(doctor_id)]
+
+    # Record that the current unit_of_work() moves one of doctor_id's bookings from old
+    # to new, each a booked_slot() or None
+    def change(self, doctor_id, old=None, new=None):
+        if old == new:
+            return
+        pending = g.get('occupancy_changes') if has_app_context() else None
+        if pending is None:
+            raise RuntimeError("Slot occupancy changes must be recorded inside unit_of_work()")
+        change = (int(doctor_id), old, new)
+        with self._lock:
+            for key in self._change_keys(change):
+                state = self._keys.setdefault(key, [0, 0, 0])
+                state[0] += 1
+                state[1] += 1
+        pending.append(change)
+
+    # Called by unit_of_work() as it ends, with the changes recorded inside it
+    def finish(self, changes, committed):
+        with self._lock:
+            for change in changes:
+                doctor_id, old, new = change
+                if committed:
+                    for booking, sign in ((old, -1), (new, 1)):
+                        if booking is not None:
+                            self._apply(doctor_id, booking, sign)
+                for key in self._change_keys(change):
+                    state = self._keys[key]
+                    state[0] += 1
+                    state[1] -= 1
+                    self._release(key)
+
+    def invalidate(self):
+        with self._lock:
+            for key in list(self._days):
+                del self._days[key]
+                self._release(key)
+
+    def _apply(self, doctor_id, booking, sign):
+        day, slot, no_show_prob = booking
+        entry = self._days.get((doctor_id, int(day)))
+        if entry is None:
+            return
+        slots = entry[1]
+        count, no_show_sum = slots.get(slot, (0, 0.0))
+        count += sign
+        if count > 0:
+            slots[slot] = (count, no_show_sum + sign * (no_show_prob or 0.0))
+        else:
+            slots.pop(slot, None)
+
+    @staticmethod
+    def _change_keys(change):
+        doctor_id, old, new = change
+        return {(doctor_id, int(booking[0])) for booking in (old, new) if booking is not None}
+
+    def _release(self, key):
+        state = self._keys.get(key)
+        if state is not None and state[1] == 0 and state[2] == 0 and key not in self._days:
+            del self._keys[key]
+
+slot_occupancy = SlotOccupancyIndex()
+
+# find_available_slot searches this many days after the appointment, reading the
+# doctor's schedule SLOT_SEARCH_WINDOW_DAYS at a time and stopping at the first window
+# with a bookable slot
+SLOT_SEARCH_HORIZON_DAYS = int(os.getenv("SLOT_SEARCH_HORIZON_DAYS", "7"))
+SLOT_SEARCH_WINDOW_DAYS = int(os.getenv("SLOT_SEARCH_WINDOW_DAYS", "7"))
+
+# Last day a booking or reschedule may land on: one year after today
+def max_booking_day(today):
+    return to_day(day_to_date(today) + relativedelta(years=1))
+
 # Function to send email notifications
 def send_reschedule_notification(patient_email, appointment_details):
     subject = "Appointment Rescheduled"
@@ -294,8 +1078,8 @@ def send_reschedule_notification(patient_email, appointment_details):
     - Hospital: {appointment_details['hospital_name']}
     - Department: {appointment_details['department_name']}
     - Doctor: {appointment_details['doctor_name']}
-    - Date: {appointment_details['date']}
-    - Time: {appointment_details['slot_time']}
+    - Date: {format_day(appointment_details['day'], "%d %B %Y")}
+    - Time: {format_slot(appointment_details['slot_minute'])}
 
     Please ensure you attend this appointment. If you have any questions, feel free to contact us.
 
@@ -309,149 +1093,310 @@ def send_reschedule_notification(patient_email, appointment_details):
     except Exception as e:
         app.logger.error(f"Failed to send reschedule notification to {patient_email}: {e}")
 
-# Helper function for auto-rescheduling
-def find_available_slot(doctor_id, current_date, patient_id, max_attempts=7):
+# Helper function for auto-rescheduling: the first (day, slot) in the max_attempts days
+# after current_day that reschedule_slots() allows for the patient, else (None, None).
+# pending maps (doctor_id, day) to slots already handed out in the current batch
+# but not yet written, so a sweep does not give the same slot away twice.
+def find_available_slot(doctor_id, current_day, patient_id, max_attempts=SLOT_SEARCH_HORIZON_DAYS, pending=None):
     try:
-        all_slots = [f"{hour:02d}:00 {'AM' if hour < 12 else 'PM'}" for hour in range(8, 18)]
-        current_date_dt = pd.to_datetime(current_date)
-        for days_ahead in range(1, max_attempts + 1):
-            new_date = (current_date_dt + pd.Timedelta(days=days_ahead)).strftime('%Y-%m-%d')
-            existing_appts = query_db(
-                "SELECT slot_time, patient_id, no_show_prob FROM appointments WHERE doctor_id = ? AND date = ? AND status != 'closed'",
-                (doctor_id, new_date)
-            )
-            booked_slots = {appt['slot_time']: appt for appt in existing_appts}
-
-            for slot in all_slots:
-                if slot not in booked_slots:
-                    max_appointments_per_slot = 2
-                    combined_no_show_threshold = 50.0
-                    priority_threshold = 0.7
-                    no_show_history = calculate_no_show_history(patient_id, new_date)
-                    priority_score = calculate_priority_score(no_show_history)
-                    if priority_score >= priority_threshold:
-                        return new_date, slot
-                else:
-                    appt = booked_slots[slot]
-                    if len(existing_appts) < max_appointments_per_slot:
-                        no_show_history = calculate_no_show_history(patient_id, new_date)
-                        priority_score = calculate_priority_score(no_show_history)
-                        if priority_score >= priority_threshold:
-                            combined_no_show_prob = appt['no_show_prob']
-                            if combined_no_show_prob < combined_no_show_threshold:
-                                return new_date, slot
+        horizon_end = current_day + max_attempts
+        if horizon_end <= current_day:
+            return None, None
+        priority_scores = priority_scores_by_day(patient_id, current_day + 1, horizon_end)
+        for first_day in range(current_day + 1, horizon_end + 1, SLOT_SEARCH_WINDOW_DAYS):
+            last_day = min(first_day + SLOT_SEARCH_WINDOW_DAYS - 1, horizon_end)
+            occupancies = slot_occupancy.get_range(doctor_id, first_day, last_day)
+            bookings, no_show_sums = occupancy_matrix([occupancies[day] for day in range(first_day, last_day + 1)])
+            if pending:
+                for row, day in enumerate(range(first_day, last_day + 1)):
+                    for appt in pending.get((doctor_id, day), []):
+                        col = SLOT_INDEX.get(appt['slot_minute'])
+                        if col is not None:
+                            bookings[row, col] += 1
+                            no_show_sums[row, col] += appt['no_show_prob'] or 0.0
+            day_scores = priority_scores[first_day - current_day - 1:last_day - current_day]
+            candidates = np.flatnonzero(reschedule_slots(bookings, no_show_sums, day_scores))
+            if candidates.size:
+                row, col = divmod(int(candidates[0]), len(SLOT_MINUTES))
+                return first_day + row, SLOT_MINUTES[col]
         app.logger.warning(f"No available slots found for doctor_id {doctor_id} within {max_attempts} days.")
         return None, None
     except Exception as e:
         app.logger.error(f"Error finding available slot for doctor_id {doctor_id}: {e}")
         return None, None
 
+# auto_reschedule_all places every flagged appointment at once in AUTO_RESCHEDULE_MODE
+# "batch" (a min-cost assignment per doctor, see assign_reschedule_slots) or one at a
+# time with find_available_slot in "greedy". A batch placement costs its delay in days
+# plus RESCHEDULE_RISK_WEIGHT days per 100% of no-show risk already booked in the slot.
+AUTO_RESCHEDULE_MODE = os.getenv("AUTO_RESCHEDULE_MODE", "batch")
+RESCHEDULE_RISK_WEIGHT = float(os.getenv("RESCHEDULE_RISK_WEIGHT", "1.0"))
+# Cost of a placement the reschedule rules forbid; the solver only makes one when an
+# appointment has nowhere else to go, and it is discarded
+UNASSIGNABLE_COST = 1e9
+
+# Batch counterpart of find_available_slot: {appointment id: (day, slot)} for the
+# appointments that fit within horizon days after their current day. Appointments
+# must carry PATIENT_STATS_COLUMNS. Doctors are solved independently; one that fails
+# only leaves its own appointments unplaced, and callers search for unplaced ones
+# with find_available_slot.
+def assign_reschedule_slots(appts, today, horizon=SLOT_SEARCH_HORIZON_DAYS):
+    by_doctor = {}
+    for appt in appts:
+        by_doctor.setdefault(appt['doctor_id'], []).append(appt)
+    assignments = {}
+    for doctor_id, doctor_appts in by_doctor.items():
+        try:
+            assignments.update(assign_doctor_slots(doctor_id, doctor_appts, today, horizon))
+        except Exception as e:
+            app.logger.error(f"Error assigning reschedule slots for doctor_id {doctor_id}: {e}")
+    return assignments
+
+# One doctor's share of assign_reschedule_slots. The doctor's schedule over every
+# appointment's horizon is one range read; each free place in it is a column of the
+# cost matrix, each appointment a row, and linear_sum_assignment picks the cheapest
+# placement of all of them together under the reschedule_slots() rules. Places are
+# priced independently, so the picks are replayed through reschedule_slots() and any
+# refused appointment goes into the next round against the updated schedule.
+def assign_doctor_slots(doctor_id, appts, today, horizon):
+    current_days = np.array([appt['appointment_day'] for appt in appts])
+    first_day = max(int(current_days.min()) + 1, today)
+    last_day = min(int(current_days.max()) + horizon, max_booking_day(today))
+    if first_day > last_day:
+        return {}
+    occupancies = slot_occupancy.get_range(doctor_id, first_day, last_day)
+    day_bookings, day_no_show_sums = occupancy_matrix([occupancies[day] for day in range(first_day, last_day + 1)])
+    # Flat views of the same arrays, one entry per (day, slot) cell
+    bookings, no_show_sums = day_bookings.ravel(), day_no_show_sums.ravel()
+    # Each appointment's priority score as of every day in the range
+    priorities = np.array([priority_scores_by_day(appt['patient_id'], first_day, last_day, appt) for appt in appts])
+    no_show_probs = np.array([appt['no_show_prob'] or 0.0 for appt in appts])
+
+    assignments = {}
+    unplaced = np.arange(len(appts))
+    while unplaced.size:
+        # Place k of a slot comes after k other bookings. Beyond the slot's first free
+        # place, the one before is taken in this batch, so a place is only offered if
+        # the least risky appointment left could still share it.
+        free = np.clip(MAX_APPOINTMENTS_PER_SLOT - bookings, 0, None)
+        extra = no_show_sums + no_show_probs[unplaced].min() < COMBINED_NO_SHOW_THRESHOLD
+        free = np.where(extra, free, np.minimum(free, 1))
+        cells = np.repeat(np.arange(free.size), free)
+        if not cells.size:
+            break
+        places = np.arange(cells.size) - np.repeat(np.cumsum(free) - free, free)
+        place_rows, place_cols = np.divmod(cells, len(SLOT_MINUTES))
+        place_days = first_day + place_rows
+        shared = bookings[cells] + places > 0
+        place_sums = no_show_sums[cells]
+
+        # reschedule_slots() per place: a shared place also needs its day to stay under
+        # MAX_APPOINTMENTS_PER_SLOT bookings, counting the batch's earlier places
+        day_totals = day_bookings.sum(axis=1)
+        open_places = ~shared | (
+            (day_totals[place_rows] + places < MAX_APPOINTMENTS_PER_SLOT) & (place_sums < COMBINED_NO_SHOW_THRESHOLD)
+        )
+        delay = place_days[None, :] - current_days[unplaced, None]
+        allowed = (delay >= 1) & (delay <= horizon) & open_places[None, :] & (
+            priorities[unplaced][:, place_rows] >= PRIORITY_THRESHOLD
+        )
+        # The slot order breaks ties within a day, as in find_available_slot
+        cost = delay + RESCHEDULE_RISK_WEIGHT * place_sums[None, :] / 100.0 + place_cols[None, :] * 1e-3
+        picked_rows, picked_places = linear_sum_assignment(np.where(allowed, cost, UNASSIGNABLE_COST))
+
+        refused = []
+        for row, place in sorted(zip(picked_rows, picked_places), key=lambda pick: pick[1]):
+            if not allowed[row, place]:
+                continue
+            i, cell, day_row, col = unplaced[row], cells[place], place_rows[place], place_cols[place]
+            day = slice(day_row, day_row + 1)
+            if not reschedule_slots(day_bookings[day], day_no_show_sums[day], priorities[i, day])[0, col]:
+                refused.append(i)
+                continue
+            bookings[cell] += 1
+            no_show_sums[cell] += no_show_probs[i]
+            assignments[appts[i]['id']] = (int(place_days[place]), SLOT_MINUTES[col])
+        if len(refused) == unplaced.size:
+            break
+        unplaced = np.array(refused, dtype=np.int64)
+    return assignments
+
 # Function to check for no-shows and reschedule them after 1 day
+# Appointments on a day that were still open at its end, with the names the no-show
+# emails use
+NO_SHOW_SWEEP_QUERY = """
+    SELECT a.id, a.patient_id, a.hospital_id, a.department_id, a.doctor_id, a.slot_minute, a.appointment_day, a.status, a.no_show_prob,
+           u.email, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name
+    FROM appointments a
+    JOIN users u ON a.patient_id = u.id
+    JOIN hospitals h ON a.hospital_id = h.id
+    JOIN departments d ON a.department_id = d.id
+    JOIN doctors doc ON a.doctor_id = doc.id
+    WHERE a.appointment_day = ? AND a.status IN ('scheduled', 'rescheduled')
+"""
+
 def check_no_shows_and_reschedule():
     with app.app_context():
         try:
-            today = date.today()
-            yesterday = (today - timedelta(days=1)).strftime('%Y-%m-%d')
-
-            query = """
-            SELECT a.id, a.patient_id, a.hospital_id, a.department_id, a.doctor_id, a.slot_time, a.date, a.status,
-                   u.email, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name
-            FROM appointments a
-            JOIN users u ON a.patient_id = u.id
-            JOIN hospitals h ON a.hospital_id = h.id
-            JOIN departments d ON a.department_id = d.id
-            JOIN doctors doc ON a.doctor_id = doc.id
-            WHERE a.date = ? AND a.status IN ('scheduled', 'rescheduled')
-            """
-            potential_no_shows = query_db(query, (yesterday,))
+            today = today_day()
+            yesterday = today - 1
+
+            potential_no_shows = query_db(NO_SHOW_SWEEP_QUERY, (yesterday,))
 
             if not potential_no_shows:
                 app.logger.info("No potential no-show appointments from yesterday.")
                 return
 
+            # Mark every missed appointment as a no-show in bulk before picking slots, so
+            # the patient histories read below already count them
+            no_shows = AppointmentBatch()
+            for appt in potential_no_shows:
+                current_day = appt['appointment_day']
+                no_shows.update(appt['id'], appt['patient_id'], (current_day, appt['status']), (current_day, 'no_show'), status='no_show')
+            no_shows.flush()
+            app.logger.info(f"Marked {len(potential_no_shows)} appointments from yesterday as no_show")
+
+            # Pick slots and build features first, then score every reschedule in one batch
+            pending_slots = {}
+            to_score = []
             for appt in potential_no_shows:
                 appt_id = appt['id']
                 patient_id = appt['patient_id']
                 hospital_id = appt['hospital_id']
                 department_id = appt['department_id']
                 doctor_id = appt['doctor_id']
-                current_date = appt['date']
-
-                query = "UPDATE appointments SET status = ? WHERE id = ?"
-                query_db(query, ('no_show', appt_id), commit=True)
-                app.logger.info(f"Marked appointment ID {appt_id} as no_show")
+                current_day = appt['appointment_day']
 
-                new_date, new_time = find_available_slot(doctor_id, current_date, patient_id)
-                if not new_date or not new_time:
+                new_day, new_slot = find_available_slot(doctor_id, current_day, patient_id, pending=pending_slots)
+                if new_day is None or new_slot is None:
                     app.logger.warning(f"No available slot found for rescheduling appointment ID {appt_id}")
                     continue
 
-                try:
-                    appointment_date = pd.to_datetime(new_date)
-                    current_date_dt = pd.to_datetime(today)
-                    max_date = current_date_dt + relativedelta(years=1)
-
-                    if appointment_date < current_date_dt or appointment_date > max_date:
-                        app.logger.warning(f"Invalid date range for rescheduling appointment ID {appt_id}: {new_date}")
-                        continue
-                except ValueError as e:
-                    app.logger.error(f"Invalid date format for rescheduling appointment ID {appt_id}: {new_date}. Error: {e}")
+                if new_day < today or new_day > max_booking_day(today):
+                    app.logger.warning(f"Invalid date range for rescheduling appointment ID {appt_id}: {format_day(new_day)}")
                     continue
 
-                past_appointments = query_db(
-                    "SELECT status FROM appointments WHERE patient_id = ? AND date < ?",
-                    (patient_id, new_date)
-                )
-                previous_no_shows = sum(1 for appt in past_appointments if appt['status'] == 'no_show')
+                previous_no_shows = get_patient_history(patient_id, new_day)['no_show_count']
 
-                hospital_location = query_db("SELECT location FROM hospitals WHERE id = ?", (hospital_id,), one=True)
-                if not hospital_location:
+                hospital = reference_data.hospital(hospital_id)
+                if not hospital:
                     app.logger.warning(f"Invalid hospital_id {hospital_id} for appointment ID {appt_id}")
                     continue
-                hospital_location = hospital_location['location']
+                hospital_location = hospital['location']
 
-                lead_time = (appointment_date - current_date_dt).days
+                lead_time = new_day - today
                 distance_5km = 0 if 'Lagos' in hospital_location else 1
-                time_of_day_morning = 1 if 'AM' in new_time.upper() else 0
-                is_weekday = appointment_date.day_name() in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-                is_weekday_weekend = 0 if is_weekday else 1
+                time_of_day_morning = 1 if is_morning(new_slot) else 0
+                is_weekday_weekend = 1 if is_weekend(new_day) else 0
 
                 features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
+                to_score.append((appt, new_day, new_slot, features))
+                pending_slots.setdefault((doctor_id, new_day), []).append(
+                    {'slot_minute': new_slot, 'patient_id': patient_id, 'no_show_prob': appt['no_show_prob'] or 0.0}
+                )
+
+            if not to_score:
+                return
 
-                try:
-                    no_show_prob = predict_no_show(features)
-                    reschedule_prob = predict_reschedule(features)
+            try:
+                features_matrix = [features for _, _, _, features in to_score]
+                no_show_probs, reschedule_probs = score_appointments(features_matrix)
+            except Exception as e:
+                app.logger.error(f"Error predicting probabilities for no-show reschedules: {e}")
+                return
 
-                    if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
-                        app.logger.warning(f"Invalid probabilities for appointment ID {appt_id}: no_show_prob={no_show_prob}, reschedule_prob={reschedule_prob}")
-                        continue
-                except Exception as e:
-                    app.logger.error(f"Error predicting probabilities for appointment ID {appt_id}: {e}")
+            reschedules = AppointmentBatch()
+            rescheduled = []
+            for (appt, new_day, new_slot, _), no_show_prob, reschedule_prob in zip(to_score, no_show_probs, reschedule_probs):
+                appt_id = appt['id']
+                no_show_prob = float(no_show_prob)
+                reschedule_prob = float(reschedule_prob)
+                if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
+                    app.logger.warning(f"Invalid probabilities for appointment ID {appt_id}: no_show_prob={no_show_prob}, reschedule_prob={reschedule_prob}")
                     continue
 
-                query = """
-                UPDATE appointments 
-                SET date = ?, slot_time = ?, status = 'rescheduled', no_show_prob = ?, reschedule_prob = ? 
-                WHERE id = ?
-                """
-                query_db(query, (new_date, new_time, no_show_prob, reschedule_prob, appt_id), commit=True)
-                app.logger.info(f"Rescheduled no-show appointment ID {appt_id} to {new_date} at {new_time}")
+                reschedules.update(
+                    appt_id, appt['patient_id'], (appt['appointment_day'], 'no_show'), (new_day, 'rescheduled'),
+                    slot=(appt['doctor_id'],
+                          booked_slot(appt['appointment_day'], appt['slot_minute'], appt['no_show_prob'], 'no_show'),
+                          booked_slot(new_day, new_slot, no_show_prob, 'rescheduled')),
+                    appointment_day=new_day, slot_minute=new_slot, status='rescheduled',
+                    no_show_prob=no_show_prob, reschedule_prob=reschedule_prob
+                )
+                rescheduled.append((appt, new_day, new_slot))
+            reschedules.flush()
 
+            # Notify only once the reschedules are committed
+            for appt, new_day, new_slot in rescheduled:
+                app.logger.info(f"Rescheduled no-show appointment ID {appt['id']} to {format_day(new_day)} at {format_slot(new_slot)}")
                 patient_email = appt['email']
                 appointment_details = {
                     'hospital_name': appt['hospital_name'],
                     'department_name': appt['department_name'],
                     'doctor_name': appt['doctor_name'],
-                    'date': new_date,
-                    'slot_time': new_time
+                    'day': new_day,
+                    'slot_minute': new_slot
                 }
                 send_reschedule_notification(patient_email, appointment_details)
-                formatted_date = pd.to_datetime(new_date).strftime("%d %B %Y")
-                flash(f"Appointment for {patient_email} automatically rescheduled to {formatted_date} at {new_time} at {appt['hospital_name']}.", "success")
+                # The scheduler runs this without a request to flash into
+                if has_request_context():
+                    flash(f"Appointment for {patient_email} automatically rescheduled to {format_day(new_day, '%d %B %Y')} at {format_slot(new_slot)} at {appt['hospital_name']}.", "success")
 
         except Exception as e:
             app.logger.error(f"Error in check_no_shows_and_reschedule: {e}")
 
+# Nightly job: fold yesterday's outcomes into the models. Runs in a child process so the
+# web process never imports sklearn/xgboost; the registry picks up the published models.
+# Full retrains stay manual: `python model/no_show_model.py`
+def retrain_models_incrementally():
+    try:
+        result = subprocess.run(
+            [sys.executable, os.path.join('model', 'no_show_model.py'), 'incremental'],
+            capture_output=True, text=True, timeout=int(os.getenv('RETRAIN_TIMEOUT', '3600'))
+        )
+        for line in result.stdout.splitlines():
+            app.logger.info(f"retrain: {line}")
+        if result.returncode != 0:
+            app.logger.error(f"Incremental retrain failed with exit code {result.returncode}: {result.stderr[-2000:]}")
+    except Exception as e:
+        app.logger.error(f"Error in retrain_models_incrementally: {e}")
+
+# Every doctor's bookings on day, for the overbooking simulation
+DAY_BOOKINGS_QUERY = """SELECT doctor_id, slot_minute, no_show_prob
+                        FROM appointments
+                        WHERE appointment_day = ? AND status != 'closed'"""
+
+# simulate_day() reports for day, keyed by doctor_id: every doctor with bookings from
+# one read of the day, or just doctor_id when given
+def overbooking_results(day, doctor_id=None, **options):
+    if doctor_id is None:
+        rows = query_db(DAY_BOOKINGS_QUERY, (day,))
+    else:
+        rows = [dict(row, doctor_id=doctor_id) for row in query_db(DAY_APPOINTMENTS_QUERY, (doctor_id, day))]
+    bookings = {} if doctor_id is None else {doctor_id: []}
+    for row in rows:
+        bookings.setdefault(row['doctor_id'], []).append((row['slot_minute'], row['no_show_prob']))
+    return {doctor: simulate_day(doctor_bookings, **options) for doctor, doctor_bookings in bookings.items()}
+
+# Nightly overbooking check: simulates tomorrow for every doctor and logs the days
+# likely to overflow
+def simulate_tomorrows_overbooking():
+    with app.app_context():
+        try:
+            day = today_day() + 1
+            start = time.perf_counter()
+            results = overbooking_results(day)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            flagged = {doctor: result for doctor, result in results.items() if result['overflow_probability'] > OVERFLOW_TARGET}
+            app.logger.info(f"Overbooking simulation for {format_day(day)}: {len(results)} doctors in {elapsed_ms:.0f} ms, {len(flagged)} likely to overflow")
+            for doctor_id, result in flagged.items():
+                app.logger.warning(
+                    f"Doctor {doctor_id} on {format_day(day)}: overflow probability {result['overflow_probability']:.2f}, "
+                    f"expected idle slots {result['expected_idle_slots']:.1f}, utilization {result['utilization']:.2f}"
+                )
+        except Exception as e:
+            app.logger.error(f"Error in simulate_tomorrows_overbooking: {e}")
+
 # Routes
 @app.route('/', endpoint='index')
 def index():
@@ -474,7 +1419,7 @@ def register():
             return redirect(url_for('register'))
 
         password_hash = generate_password_hash(password, method='pbkdf2:sha256')
-        query = """INSERT INTO users (name, email, phone, password, role) VALUES (%s, %s, %s, %s, %s)""" if DB_TYPE == "postgresql" else """INSERT INTO users (name, email, phone, password, role) VALUES (?, ?, ?, ?, ?)"""
+        query = "INSERT INTO users (name, email, phone, password, role) VALUES (?, ?, ?, ?, ?)"
         try:
             query_db(query, (name, email, phone, password_hash, 'patient'), commit=True)
             flash(f"Registration successful for {email}! Please login.", "success")
@@ -489,7 +1434,7 @@ def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
-        query = "SELECT * FROM users WHERE email = %s" if DB_TYPE == "postgresql" else "SELECT * FROM users WHERE email = ?"
+        query = "SELECT * FROM users WHERE email = ?"
         user = query_db(query, (email,), one=True)
         if user and check_password_hash(user['password'], password):
             session['user_id'] = user['id']
@@ -510,21 +1455,18 @@ def logout():
 
 @app.route('/get_departments/<int:hospital_id>', methods=['GET'], endpoint='get_departments')
 def get_departments(hospital_id):
-    query = "SELECT id, name FROM departments WHERE hospital_id = %s" if DB_TYPE == "postgresql" else "SELECT id, name FROM departments WHERE hospital_id = ?"
-    departments = query_db(query, (hospital_id,))
-    return jsonify([(dept['id'], dept['name']) for dept in departments])
+    snapshot = reference_data.get()
+    return reference_response(*snapshot.departments.get(hospital_id, snapshot.empty))
 
 @app.route('/get_doctors/<int:department_id>', methods=['GET'], endpoint='get_doctors')
 def get_doctors(department_id):
-    query = "SELECT id, name FROM doctors WHERE department_id = %s" if DB_TYPE == "postgresql" else "SELECT id, name FROM doctors WHERE department_id = ?"
-    doctors = query_db(query, (department_id,))
-    return jsonify([(doc['id'], doc['name']) for doc in doctors])
+    snapshot = reference_data.get()
+    return reference_response(*snapshot.doctors.get(department_id, snapshot.empty))
 
 @app.route('/book', methods=['GET', 'POST'], endpoint='book_appointment')
 @login_required('patient')
 def book_appointment():
-    hospitals = query_db("SELECT * FROM hospitals")
-    app.logger.info(f"Fetched hospitals: {hospitals}")
+    hospitals = reference_data.hospitals()
     if not hospitals:
         flash("No hospitals available. Please contact the administrator.", "danger")
         return redirect(url_for('patient_dashboard'))
@@ -542,62 +1484,71 @@ def book_appointment():
             return redirect(url_for('book_appointment'))
 
         try:
-            appointment_date = pd.to_datetime(date)
-            current_date = pd.to_datetime(date.today())
-            max_date = current_date + relativedelta(years=1)
-
-            if appointment_date < current_date:
-                flash("Cannot book an appointment in the past.", "danger")
-                return redirect(url_for('book_appointment'))
-            if appointment_date > max_date:
-                flash("Cannot book an appointment more than one year in the future.", "danger")
-                return redirect(url_for('book_appointment'))
+            appointment_day = to_day(date)
+            slot_minute = to_slot_minute(slot_time)
         except ValueError:
-            flash("Invalid date format.", "danger")
+            flash("Invalid date or time format.", "danger")
             return redirect(url_for('book_appointment'))
 
-        past_appointments = query_db(
-            "SELECT status FROM appointments WHERE patient_id = ? AND date < ?",
-            (patient_id, date)
-        )
-        previous_no_shows = sum(1 for appt in past_appointments if appt['status'] == 'no_show')
+        today = today_day()
+        if appointment_day < today:
+            flash("Cannot book an appointment in the past.", "danger")
+            return redirect(url_for('book_appointment'))
+        if appointment_day > max_booking_day(today):
+            flash("Cannot book an appointment more than one year in the future.", "danger")
+            return redirect(url_for('book_appointment'))
 
-        hospital_location = query_db("SELECT location FROM hospitals WHERE id = ?", (hospital_id,), one=True)
-        if not hospital_location:
+        hospital = reference_data.hospital(hospital_id)
+        if not hospital:
             flash("Invalid hospital selected.", "danger")
             return redirect(url_for('book_appointment'))
-        hospital_location = hospital_location['location']
-        hospital_name = query_db("SELECT name FROM hospitals WHERE id = ?", (hospital_id,), one=True)['name']
-
-        lead_time = (appointment_date - current_date).days
-        distance_5km = 0 if 'Lagos' in hospital_location else 1
-        time_of_day_morning = 1 if 'AM' in slot_time.upper() else 0
-        is_weekday = appointment_date.day_name() in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        is_weekday_weekend = 0 if is_weekday else 1
-
-        features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
 
         try:
-            no_show_prob = predict_no_show(features)
-            reschedule_prob = predict_reschedule(features)
-
-            if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
-                flash("Invalid prediction probabilities.", "danger")
-                return redirect(url_for('book_appointment'))
+            # Slot check, insert and patient_stats update commit together
+            with unit_of_work():
+                # Patient email and patient_stats in one round-trip
+                context = query_db(
+                    f"""
+                    SELECT u.email, {PATIENT_STATS_COLUMNS}
+                    FROM users u
+                    LEFT JOIN patient_stats ps ON ps.patient_id = u.id
+                    WHERE u.id = ?
+                    """,
+                    (patient_id,), one=True
+                )
+                if not context:
+                    flash("Invalid patient account.", "danger")
+                    return redirect(url_for('book_appointment'))
+
+                lock_doctor_schedule(doctor_id)
+                existing_appts = query_db(SLOT_APPOINTMENTS_QUERY, (doctor_id, appointment_day, slot_minute))
+                refusal = slot_refusal(existing_appts, patient_id, appointment_day, context)
+                if refusal:
+                    flash(f"This slot is no longer available: {refusal}.", "danger")
+                    return redirect(url_for('book_appointment'))
+
+                previous_no_shows = get_patient_history(patient_id, appointment_day, context)['no_show_count']
+                lead_time = appointment_day - today
+                distance_5km = 0 if 'Lagos' in hospital['location'] else 1
+                time_of_day_morning = 1 if is_morning(slot_minute) else 0
+                is_weekday_weekend = 1 if is_weekend(appointment_day) else 0
 
-            query = """INSERT INTO appointments (patient_id, hospital_id, department_id, doctor_id, slot_time, date, no_show_prob, reschedule_prob, status) 
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-            query_db(query, (patient_id, hospital_id, department_id, doctor_id, slot_time, date, no_show_prob, reschedule_prob, 'scheduled'), commit=True)
+                features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
+                no_show_prob, reschedule_prob = score_appointment(features)
 
-            user_email = query_db("SELECT email FROM users WHERE id = ?", (patient_id,), one=True)['email']
-            formatted_date = pd.to_datetime(date).strftime("%d %B %Y")
-            flash(f"Appointment successfully booked for {user_email} at {hospital_name} on {formatted_date} at {slot_time}.", "success")
-            return redirect(url_for('patient_dashboard'))
+                query = """INSERT INTO appointments (patient_id, hospital_id, department_id, doctor_id, slot_minute, appointment_day, no_show_prob, reschedule_prob, status, updated_at) 
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+                query_db(query, (patient_id, hospital_id, department_id, doctor_id, slot_minute, appointment_day, no_show_prob, reschedule_prob, 'scheduled', changed_at()), commit=True)
+                update_patient_stats(patient_id, new=(appointment_day, 'scheduled'))
+                slot_occupancy.change(doctor_id, new=booked_slot(appointment_day, slot_minute, no_show_prob, 'scheduled'))
         except Exception as e:
             app.logger.error(f"Booking error: {e}")
             flash("Error booking appointment. Please try again.", "danger")
             return redirect(url_for('book_appointment'))
 
+        flash(f"Appointment successfully booked for {context['email']} at {hospital['name']} on {format_day(appointment_day, '%d %B %Y')} at {format_slot(slot_minute)}.", "success")
+        return redirect(url_for('patient_dashboard'))
+
     return render_template('booking.html', hospitals=hospitals, user=session.get('user_id'), role=session.get('role'))
 
 @app.route('/check_slot', methods=['GET'], endpoint='check_slot')
@@ -612,30 +1563,19 @@ def check_slot():
         return jsonify({'available': False, 'error': 'Missing required parameters'})
 
     try:
-        query = """SELECT patient_id, no_show_prob FROM appointments 
-                   WHERE doctor_id = ? AND date = ? AND slot_time = ? AND status != 'closed'"""
-        existing_appts = query_db(query, (doctor_id, date, slot_time))
-
-        max_appointments_per_slot = 2
-        combined_no_show_threshold = 50.0
-        priority_threshold = 0.7
-
-        if not existing_appts:
-            return jsonify({'available': True})
-
-        if len(existing_appts) >= max_appointments_per_slot:
-            return jsonify({'available': False, 'error': 'Slot is fully booked'})
-
-        no_show_history = calculate_no_show_history(patient_id, date)
-        priority_score = calculate_priority_score(no_show_history)
-
-        if priority_score < priority_threshold:
-            return jsonify({'available': False, 'error': 'Priority score too low'})
-
-        combined_no_show_prob = sum(appt['no_show_prob'] for appt in existing_appts)
-        if combined_no_show_prob >= combined_no_show_threshold:
-            return jsonify({'available': False, 'error': 'Combined no-show risk too high'})
+        day = to_day(date)
+        slot_minute = to_slot_minute(slot_time)
+    except ValueError:
+        return jsonify({'available': False, 'error': 'Invalid date or time format'})
 
+    try:
+        bookings, combined_no_show_prob = slot_occupancy.get(doctor_id, day).get(slot_minute, (0, 0.0))
+        priority_score = None
+        if 0 < bookings < MAX_APPOINTMENTS_PER_SLOT:
+            priority_score = calculate_priority_score(patient_no_show_history(patient_id, day))
+        refusal = occupancy_refusal(bookings, combined_no_show_prob, priority_score)
+        if refusal:
+            return jsonify({'available': False, 'error': refusal})
         return jsonify({'available': True})
     except Exception as e:
         app.logger.error(f"Error checking slot availability: {e}")
@@ -652,37 +1592,98 @@ def get_available_slots():
         return jsonify({'error': 'Missing required parameters'})
 
     try:
-        all_slots = [f"{hour:02d}:00 {'AM' if hour < 12 else 'PM'}" for hour in range(8, 18)]
-        query = """SELECT slot_time, patient_id, no_show_prob 
-                   FROM appointments 
-                   WHERE doctor_id = ? AND date = ? AND status != 'closed'"""
-        existing_appts = query_db(query, (doctor_id, date))
-
-        slot_appointments = {slot: [appt for appt in existing_appts if appt['slot_time'] == slot] for slot in all_slots}
-
-        max_appointments_per_slot = 2
-        combined_no_show_threshold = 50.0
-        priority_threshold = 0.7
-
-        no_show_history = calculate_no_show_history(patient_id, date)
-        priority_score = calculate_priority_score(no_show_history)
-
-        available_slots = []
-        for slot in all_slots:
-            appts_in_slot = slot_appointments[slot]
-            if not appts_in_slot:
-                available_slots.append(slot)
-            elif len(appts_in_slot) < max_appointments_per_slot:
-                if priority_score >= priority_threshold:
-                    combined_no_show_prob = sum(appt['no_show_prob'] for appt in appts_in_slot)
-                    if combined_no_show_prob < combined_no_show_threshold:
-                        available_slots.append(slot)
-
-        return jsonify(available_slots)
+        day = to_day(date)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'})
+
+    try:
+        occupancy = slot_occupancy.get(doctor_id, day)
+        priority_score = calculate_priority_score(patient_no_show_history(patient_id, day))
+        return jsonify([format_slot(slot) for slot in available_slot_minutes(occupancy, priority_score)])
     except Exception as e:
         app.logger.error(f"Error fetching available slots: {e}")
         return jsonify({'error': 'Database error'})
 
+# /get_availability covers at most AVAILABILITY_MAX_DAYS days (a month view with room to
+# spare), AVAILABILITY_DEFAULT_DAYS when no end date is given
+AVAILABILITY_MAX_DAYS = int(os.getenv("AVAILABILITY_MAX_DAYS", "62"))
+AVAILABILITY_DEFAULT_DAYS = 7
+
+# The doctors and days a /get_availability request asks for, as (doctor_ids, first_day,
+# last_day, error), where error is a (message, HTTP status) pair. department_id stands
+# for every doctor in the department; the days are cut to the ones that can still be
+# booked, and a range with none of those left is refused.
+def availability_query(args, snapshot):
+    try:
+        if args.get('doctor_id'):
+            doctor_ids = [int(args['doctor_id'])]
+            if doctor_ids[0] not in snapshot.known_doctor_ids:
+                return None, None, None, ('Unknown doctor', 404)
+        elif args.get('department_id'):
+            doctor_ids = snapshot.doctor_ids.get(int(args['department_id']), [])
+        else:
+            return None, None, None, ('Missing required parameters', 400)
+    except ValueError:
+        return None, None, None, ('Invalid doctor or department', 400)
+    today = today_day()
+    try:
+        first_day = to_day(args['start']) if args.get('start') else today
+        last_day = to_day(args['end']) if args.get('end') else first_day + AVAILABILITY_DEFAULT_DAYS - 1
+    except ValueError:
+        return None, None, None, ('Invalid date format', 400)
+    if not 0 <= last_day - first_day < AVAILABILITY_MAX_DAYS:
+        return None, None, None, (f'Date range must cover 1 to {AVAILABILITY_MAX_DAYS} days', 400)
+    first_day, last_day = max(first_day, today), min(last_day, max_booking_day(today))
+    if first_day > last_day:
+        return None, None, None, ('Date range has no bookable days', 400)
+    return doctor_ids, first_day, last_day, None
+
+# The /get_availability body: each doctor's bookable slots per day under the patient's
+# priority score, as get_available_slots lists them for a single day
+def availability_response(occupancies, first_day, last_day, priority_score):
+    return {
+        'start': format_day(first_day),
+        'end': format_day(last_day),
+        'doctors': [
+            {
+                'doctor_id': doctor_id,
+                'days': {
+                    format_day(day): [format_slot(slot) for slot in available_slot_minutes(days[day], priority_score)]
+                    for day in range(first_day, last_day + 1)
+                }
+            }
+            for doctor_id, days in occupancies.items()
+        ]
+    }
+
+# A doctor's (or a whole department's) calendar over a date range from one range read,
+# with the patient's priority score computed once as of the first day
+@app.route('/get_availability', methods=['GET'], endpoint='get_availability')
+@login_required('patient')
+def get_availability():
+    doctor_ids, first_day, last_day, error = availability_query(request.args, reference_data.get())
+    if error:
+        message, status = error
+        return jsonify({'error': message}), status
+
+    try:
+        occupancies = slot_occupancy.get_ranges(doctor_ids, first_day, last_day)
+        priority_score = calculate_priority_score(patient_no_show_history(session.get('user_id'), first_day))
+        return jsonify(availability_response(occupancies, first_day, last_day, priority_score))
+    except Exception as e:
+        app.logger.error(f"Error fetching availability: {e}")
+        return jsonify({'error': 'Database error'})
+
+# Dashboard sort keys (the sort_by query parameter) and the columns they order by
+SORT_COLUMNS = {'date': 'a.appointment_day', 'status': 'a.status'}
+
+PATIENT_APPOINTMENTS_QUERY = """SELECT a.id, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name, a.slot_minute, a.appointment_day, a.status
+                                FROM appointments a
+                                JOIN hospitals h ON a.hospital_id = h.id
+                                JOIN departments d ON a.department_id = d.id
+                                JOIN doctors doc ON a.doctor_id = doc.id
+                                WHERE a.patient_id = ?"""
+
 @app.route('/patient', endpoint='patient_dashboard')
 @login_required('patient')
 def patient_dashboard():
@@ -690,43 +1691,136 @@ def patient_dashboard():
     sort_by = request.args.get('sort_by', 'date')
     sort_order = request.args.get('sort_order', 'asc')
 
-    query = """SELECT a.id, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name, a.slot_time, a.date, a.status 
-               FROM appointments a 
-               JOIN hospitals h ON a.hospital_id = h.id 
-               JOIN departments d ON a.department_id = d.id 
-               JOIN doctors doc ON a.doctor_id = doc.id 
-               WHERE a.patient_id = ?"""
-    if sort_by in ['date', 'status']:
-        query += f" ORDER BY {sort_by} {'ASC' if sort_order == 'asc' else 'DESC'}"
+    query = PATIENT_APPOINTMENTS_QUERY
+    if sort_by in SORT_COLUMNS:
+        query += f" ORDER BY {SORT_COLUMNS[sort_by]} {'ASC' if sort_order == 'asc' else 'DESC'}"
     appointments = query_db(query, (user_id,))
 
     reordered_appointments = [
-        (appt['hospital_name'], appt['department_name'], appt['doctor_name'], appt['date'], appt['slot_time'], appt['status'])
+        (appt['hospital_name'], appt['department_name'], appt['doctor_name'], format_day(appt['appointment_day']), format_slot(appt['slot_minute']), appt['status'])
         for appt in appointments
     ]
 
     return render_template('patient.html', appointments=reordered_appointments, user=session.get('user_id'), role=session.get('role'))
 
+# Admin dashboard pages: ADMIN_PAGE_SIZE rows, keyset-paginated on (sort column, id) so
+# a page is one index range read however deep it is. Migration 3 indexes each sort order
+# on its own and behind the hospital and status filters; a doctor filter uses the
+# (doctor_id, appointment_day, ...) index. A risk threshold is checked row by row
+# along the chosen order.
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+APPOINTMENT_STATUSES = ('scheduled', 'rescheduled', 'attended', 'no_show', 'closed')
+
+# Appointment filters from request args (the admin dashboard and exports) as (filters
+# to carry into links, WHERE conditions on appointments a, params, invalid dates)
+def appointment_filters(args):
+    filters, conditions, params, invalid = {}, [], [], []
+    for name in ('hospital_id', 'doctor_id'):
+        value = args.get(name, type=int)
+        if value is not None:
+            filters[name] = value
+            conditions.append(f"a.{name} = ?")
+            params.append(value)
+    status = args.get('status')
+    if status in APPOINTMENT_STATUSES:
+        filters['status'] = status
+        conditions.append("a.status = ?")
+        params.append(status)
+    for name, op in (('date_from', '>='), ('date_to', '<=')):
+        value = args.get(name)
+        if not value:
+            continue
+        try:
+            day = to_day(value)
+        except ValueError:
+            invalid.append(value)
+            continue
+        filters[name] = format_day(day)
+        conditions.append(f"a.appointment_day {op} ?")
+        params.append(day)
+    min_risk = args.get('min_risk', type=float)
+    if min_risk is not None:
+        filters['min_risk'] = min_risk
+        conditions.append("a.no_show_prob >= ?")
+        params.append(min_risk)
+    return filters, conditions, params, invalid
+
+# Page cursors are "<sort value>:<id>" of the row a page starts after (or ends before)
+def format_cursor(appt, sort_by):
+    return f"{appt[SORT_COLUMNS[sort_by].split('.')[1]]}:{appt['id']}"
+
+def parse_cursor(cursor, sort_by):
+    if not cursor:
+        return None
+    key, _, appt_id = cursor.rpartition(':')
+    try:
+        return (int(key) if sort_by == 'date' else key), int(appt_id)
+    except ValueError:
+        return None
+
+# One admin page of appointment rows (LIMIT ?), and the names joined onto them
+ADMIN_PAGE_ROWS_QUERY = """SELECT a.id, a.patient_id, a.hospital_id, a.department_id, a.doctor_id, a.slot_minute, a.appointment_day, a.no_show_prob, a.reschedule_prob, a.status
+                           FROM appointments a {where}
+                           ORDER BY {order} LIMIT ?"""
+ADMIN_PAGE_QUERY = """SELECT a.id, u.email, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name, a.slot_minute, a.appointment_day, a.no_show_prob, a.reschedule_prob, a.status
+                      FROM ({rows}) a
+                      JOIN users u ON a.patient_id = u.id
+                      JOIN hospitals h ON a.hospital_id = h.id
+                      JOIN departments d ON a.department_id = d.id
+                      JOIN doctors doc ON a.doctor_id = doc.id
+                      ORDER BY {order}"""
+
+# ADMIN_PAGE_ROWS_QUERY for appointment_filters() conditions and params, past cursor in
+# sort_by order (descending or not), as (query, order clause, params)
+def admin_page_rows_query(conditions, params, sort_by, descending, cursor=None):
+    conditions, params = list(conditions), list(params)
+    sort_column = SORT_COLUMNS[sort_by]
+    if cursor:
+        op = '<' if descending else '>'
+        conditions.append(f"{sort_column} {op}= ? AND ({sort_column} {op} ? OR a.id {op} ?)")
+        params += [cursor[0], cursor[0], cursor[1]]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = f"{sort_column} {'DESC' if descending else 'ASC'}, a.id {'DESC' if descending else 'ASC'}"
+    return ADMIN_PAGE_ROWS_QUERY.format(where=where, order=order), order, params
+
 @app.route('/admin', endpoint='admin_dashboard')
 @login_required('admin')
 def admin_dashboard():
     sort_by = request.args.get('sort_by', 'date')
-    sort_order = request.args.get('sort_order', 'desc')  # Default to descending order for date
-
-    query = """SELECT a.id, u.email, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name, a.slot_time, a.date, a.no_show_prob, a.reschedule_prob, a.status 
-               FROM appointments a 
-               JOIN users u ON a.patient_id = u.id 
-               JOIN hospitals h ON a.hospital_id = h.id 
-               JOIN departments d ON a.department_id = d.id 
-               JOIN doctors doc ON a.doctor_id = doc.id"""
-    if sort_by in ['date', 'status']:
-        query += f" ORDER BY {sort_by} {'ASC' if sort_order == 'asc' else 'DESC'}"
-    appointments = query_db(query)
+    if sort_by not in SORT_COLUMNS:
+        sort_by = 'date'
+    sort_order = 'asc' if request.args.get('sort_order', 'desc') == 'asc' else 'desc'  # Default to descending order for date
+    filters, conditions, params, invalid = appointment_filters(request.args)
+    for value in invalid:
+        flash(f"Ignoring invalid date {value!r}.", "warning")
+
+    after = parse_cursor(request.args.get('after'), sort_by)
+    before = parse_cursor(request.args.get('before'), sort_by) if after is None else None
+    cursor = after or before
+    # A page before the cursor is read in reverse order and flipped back
+    descending = (sort_order == 'desc') != (before is not None)
+    rows_query, order, params = admin_page_rows_query(conditions, params, sort_by, descending, cursor)
+
+    # Page the appointments first so the joins only touch the rows shown
+    query = ADMIN_PAGE_QUERY.format(rows=rows_query, order=order)
+    appointments = query_db(query, (*params, ADMIN_PAGE_SIZE + 1))
+    has_more = len(appointments) > ADMIN_PAGE_SIZE
+    appointments = appointments[:ADMIN_PAGE_SIZE]
+    if before:
+        appointments.reverse()
+
+    page_args = dict(filters, sort_by=sort_by, sort_order=sort_order)
+    next_cursor = prev_cursor = None
+    if appointments:
+        if has_more or before:
+            next_cursor = format_cursor(appointments[-1], sort_by)
+        if after or (before and has_more):
+            prev_cursor = format_cursor(appointments[0], sort_by)
 
     formatted_appointments = [
     [
         appt['id'], appt['email'], appt['hospital_name'], appt['department_name'], appt['doctor_name'], 
-        appt['slot_time'], appt['date'], 
+        format_slot(appt['slot_minute']), format_day(appt['appointment_day']), 
         f"{float(appt['no_show_prob']) if appt['no_show_prob'] is not None else 0:.2f}",
         f"{float(appt['reschedule_prob']) if appt['reschedule_prob'] is not None else 0:.2f}",
         appt['status']
@@ -734,358 +1828,482 @@ def admin_dashboard():
     for appt in appointments
     ]
 
-    return render_template('admin.html', appointments=formatted_appointments, user=session.get('user_id'), role=session.get('role'))
+    return render_template('admin.html', appointments=formatted_appointments, hospitals=reference_data.hospitals(),
+                           statuses=APPOINTMENT_STATUSES, filters=filters, page_args=page_args,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor,
+                           user=session.get('user_id'), role=session.get('role'))
+
+# Appointment export for analysts: appointments with their names and risk scores,
+# streamed in (updated_at, id) order through iter_query() so memory stays flat however
+# many rows match. since is the "<updated_at>:<id>" of the last row a previous export
+# wrote; the next run starts after it. Rows changed in the last EXPORT_SETTLE_SECONDS are
+# held back for the next run, so a write still committing when the export starts cannot
+# slip behind the cursor.
+EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_SETTLE_SECONDS = int(os.getenv("EXPORT_SETTLE_SECONDS", "60"))
+EXPORT_FIELDS = ['id', 'patient_id', 'patient_email', 'hospital_name', 'department_name', 'doctor_name',
+                 'appointment_date', 'slot_time', 'status', 'no_show_prob', 'reschedule_prob', 'updated_at']
+
+def parse_export_cursor(since):
+    updated_at, _, appt_id = since.partition(':')
+    try:
+        return int(updated_at), int(appt_id or 0)
+    except ValueError:
+        raise ValueError(f"Invalid since cursor {since!r}, expected <updated_at>:<id>")
+
+def export_cursor(row):
+    return f"{row['updated_at']}:{row['id']}"
+
+EXPORT_QUERY = """SELECT a.id, a.patient_id, u.email AS patient_email, h.name AS hospital_name, d.name AS department_name,
+                         doc.name AS doctor_name, a.appointment_day, a.slot_minute, a.status, a.no_show_prob, a.reschedule_prob, a.updated_at
+                  FROM appointments a
+                  JOIN users u ON a.patient_id = u.id
+                  JOIN hospitals h ON a.hospital_id = h.id
+                  JOIN departments d ON a.department_id = d.id
+                  JOIN doctors doc ON a.doctor_id = doc.id
+                  WHERE {where}
+                  ORDER BY a.updated_at, a.id"""
+
+# EXPORT_QUERY and its params for appointment_filters() conditions, from the since cursor
+def export_query(conditions=(), params=(), since=None):
+    conditions, params = list(conditions), list(params)
+    conditions.append("a.updated_at < ?")
+    params.append(changed_at() - EXPORT_SETTLE_SECONDS)
+    if since:
+        updated_at, appt_id = parse_export_cursor(since)
+        conditions.append("a.updated_at >= ? AND (a.updated_at > ? OR a.id > ?)")
+        params += [updated_at, updated_at, appt_id]
+    return EXPORT_QUERY.format(where=' AND '.join(conditions)), params
+
+def iter_appointment_export(conditions=(), params=(), since=None):
+    query, params = export_query(conditions, params, since)
+    for appt in iter_query(query, params):
+        appt['appointment_date'] = format_day(appt.pop('appointment_day'))
+        appt['slot_time'] = format_slot(appt.pop('slot_minute'))
+        yield appt
+
+# Encoded export text, STREAM_CHUNK_SIZE rows per chunk
+def export_chunks(rows, fmt):
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        write = lambda row: buffer.write(json.dumps({field: row[field] for field in EXPORT_FIELDS}, separators=(",", ":")) + "\n")
+    pending = 0
+    for row in rows:
+        write(row)
+        pending += 1
+        if pending >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.route('/export/appointments', methods=['GET'], endpoint='export_appointments')
+@login_required('admin')
+def export_appointments():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    filters, conditions, params, invalid = appointment_filters(request.args)
+    if invalid:
+        return jsonify({'error': f"Invalid date {invalid[0]!r}"}), 400
+    since = request.args.get('since')
+    try:
+        if since:
+            parse_export_cursor(since)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows = iter_appointment_export(conditions, params, since)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = app.response_class(stream_with_context(export_chunks(rows, fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="appointments.{fmt}"'
+    return response
 
 @app.route('/mark_attended/<int:appt_id>', methods=['POST'], endpoint='mark_attended')
 @login_required('admin')
 def mark_attended(appt_id):
-    appointment = query_db(
-        """
-        SELECT u.email, h.name AS hospital_name, a.date, a.slot_time 
-        FROM appointments a 
-        JOIN users u ON a.patient_id = u.id 
-        JOIN hospitals h ON a.hospital_id = h.id 
-        WHERE a.id = ?
-        """,
-        (appt_id,), one=True
-    )
+    with unit_of_work():
+        appointment = query_db(
+            """
+            SELECT u.email, h.name AS hospital_name, a.patient_id, a.doctor_id, a.appointment_day, a.slot_minute, a.no_show_prob, a.status 
+            FROM appointments a 
+            JOIN users u ON a.patient_id = u.id 
+            JOIN hospitals h ON a.hospital_id = h.id 
+            WHERE a.id = ?
+            """,
+            (appt_id,), one=True
+        )
+        if appointment:
+            query = "UPDATE appointments SET status = ?, updated_at = ? WHERE id = ?"
+            query_db(query, ('attended', changed_at(), appt_id), commit=True)
+            update_patient_stats(appointment['patient_id'], (appointment['appointment_day'], appointment['status']), (appointment['appointment_day'], 'attended'))
+            slot_occupancy.change(
+                appointment['doctor_id'],
+                booked_slot(appointment['appointment_day'], appointment['slot_minute'], appointment['no_show_prob'], appointment['status']),
+                booked_slot(appointment['appointment_day'], appointment['slot_minute'], appointment['no_show_prob'], 'attended')
+            )
     if appointment:
-        query = "UPDATE appointments SET status = ? WHERE id = ?"
-        query_db(query, ('attended', appt_id), commit=True)
-        formatted_date = pd.to_datetime(appointment['date']).strftime("%d %B %Y")
-        flash(f"Appointment for {appointment['email']} at {appointment['hospital_name']} on {formatted_date} at {appointment['slot_time']} marked as attended.", "success")
+        flash(f"Appointment for {appointment['email']} at {appointment['hospital_name']} on {format_day(appointment['appointment_day'], '%d %B %Y')} at {format_slot(appointment['slot_minute'])} marked as attended.", "success")
     else:
         flash("Appointment not found.", "danger")
     return redirect(url_for('admin_dashboard'))
 
+# Another appointment already in a doctor's slot, for a manual reschedule
+SLOT_CONFLICT_QUERY = "SELECT id FROM appointments WHERE doctor_id = ? AND appointment_day = ? AND slot_minute = ? AND id != ?"
+
 @app.route('/reschedule/<int:appt_id>', methods=['POST'], endpoint='reschedule')
 @login_required('admin')
 def reschedule(appt_id):
-    appointment = query_db(
-        """
-        SELECT a.status, a.patient_id, a.hospital_id, a.department_id, a.doctor_id,
-               u.email, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name
-        FROM appointments a
-        JOIN users u ON a.patient_id = u.id
-        JOIN hospitals h ON a.hospital_id = h.id
-        JOIN departments d ON a.department_id = d.id
-        JOIN doctors doc ON a.doctor_id = doc.id
-        WHERE a.id = ?
-        """,
-        (appt_id,), one=True
-    )
-    if not appointment:
-        flash("Appointment not found.", "danger")
-        return redirect(url_for('admin_dashboard'))
-
-    if appointment['status'] in ['attended', 'closed']:
-        flash("Cannot reschedule an appointment that has already been attended or closed.", "danger")
-        return redirect(url_for('admin_dashboard'))
-
     new_date = request.form.get('date')
     new_time = request.form.get('time')
-
-    if not all([new_date, new_time]):
-        flash("Date and time are required.", "danger")
-        return redirect(url_for('admin_dashboard'))
-
     try:
-        appointment_date = pd.to_datetime(new_date)
-        current_date = pd.to_datetime(date.today())
-        max_date = current_date + relativedelta(years=1)
-
-        if appointment_date < current_date:
-            flash("Cannot reschedule to a past date.", "danger")
-            return redirect(url_for('admin_dashboard'))
-        if appointment_date > max_date:
-            flash("Cannot reschedule more than one year in the future.", "danger")
-            return redirect(url_for('admin_dashboard'))
-    except ValueError:
-        flash("Invalid date format. Please use YYYY-MM-DD.", "danger")
-        return redirect(url_for('admin_dashboard'))
-
-    patient_id = appointment['patient_id']
-    hospital_id = appointment['hospital_id']
-    department_id = appointment['department_id']
-    doctor_id = appointment['doctor_id']
-
-    existing_appointment = query_db(
-        "SELECT * FROM appointments WHERE doctor_id = ? AND date = ? AND slot_time = ? AND id != ?",
-        (doctor_id, new_date, new_time, appt_id), one=True
-    )
-    if existing_appointment:
-        flash("The new slot is already booked.", "danger")
-        return redirect(url_for('admin_dashboard'))
-
-    past_appointments = query_db(
-        "SELECT status FROM appointments WHERE patient_id = ? AND date < ?",
-        (patient_id, new_date)
-    )
-    previous_no_shows = sum(1 for appt in past_appointments if appt['status'] == 'no_show')
+        # Lookups, conflict check, update and patient_stats update commit together
+        with unit_of_work():
+            appointment = query_db(
+                f"""
+                SELECT a.status, a.appointment_day, a.slot_minute, a.no_show_prob, a.patient_id, a.hospital_id, a.department_id, a.doctor_id,
+                       u.email, h.name AS hospital_name, h.location, d.name AS department_name, doc.name AS doctor_name,
+                       {PATIENT_STATS_COLUMNS}
+                FROM appointments a
+                JOIN users u ON a.patient_id = u.id
+                JOIN hospitals h ON a.hospital_id = h.id
+                JOIN departments d ON a.department_id = d.id
+                JOIN doctors doc ON a.doctor_id = doc.id
+                LEFT JOIN patient_stats ps ON ps.patient_id = a.patient_id
+                WHERE a.id = ?
+                """,
+                (appt_id,), one=True
+            )
+            if not appointment:
+                flash("Appointment not found.", "danger")
+                return redirect(url_for('admin_dashboard'))
 
-    hospital_location = query_db("SELECT location FROM hospitals WHERE id = ?", (hospital_id,), one=True)
-    if not hospital_location:
-        flash("Invalid hospital.", "danger")
-        return redirect(url_for('admin_dashboard'))
-    hospital_location = hospital_location['location']
+            if appointment['status'] in ['attended', 'closed']:
+                flash("Cannot reschedule an appointment that has already been attended or closed.", "danger")
+                return redirect(url_for('admin_dashboard'))
 
-    lead_time = (appointment_date - current_date).days
-    distance_5km = 0 if 'Lagos' in hospital_location else 1
-    time_of_day_morning = 1 if 'AM' in new_time.upper() else 0
-    is_weekday = appointment_date.day_name() in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    is_weekday_weekend = 0 if is_weekday else 1
+            if not all([new_date, new_time]):
+                flash("Date and time are required.", "danger")
+                return redirect(url_for('admin_dashboard'))
 
-    features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
+            try:
+                new_day = to_day(new_date)
+                new_slot = to_slot_minute(new_time)
+            except ValueError:
+                flash("Invalid date or time format. Please use YYYY-MM-DD and e.g. 10:00 AM.", "danger")
+                return redirect(url_for('admin_dashboard'))
 
-    try:
-        no_show_prob = predict_no_show(features)
-        reschedule_prob = predict_reschedule(features)
+            today = today_day()
+            if new_day < today:
+                flash("Cannot reschedule to a past date.", "danger")
+                return redirect(url_for('admin_dashboard'))
+            if new_day > max_booking_day(today):
+                flash("Cannot reschedule more than one year in the future.", "danger")
+                return redirect(url_for('admin_dashboard'))
 
-        if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
-            flash("Invalid prediction probabilities.", "danger")
-            return redirect(url_for('admin_dashboard'))
+            patient_id = appointment['patient_id']
+            doctor_id = appointment['doctor_id']
 
-        query = """UPDATE appointments SET date = ?, slot_time = ?, status = 'rescheduled', no_show_prob = ?, reschedule_prob = ? WHERE id = ?"""
-        query_db(query, (new_date, new_time, no_show_prob, reschedule_prob, appt_id), commit=True)
+            lock_doctor_schedule(doctor_id)
+            existing_appointment = query_db(SLOT_CONFLICT_QUERY, (doctor_id, new_day, new_slot, appt_id), one=True)
+            if existing_appointment:
+                flash("The new slot is already booked.", "danger")
+                return redirect(url_for('admin_dashboard'))
 
-        appointment_details = {
-            'hospital_name': appointment['hospital_name'],
-            'department_name': appointment['department_name'],
-            'doctor_name': appointment['doctor_name'],
-            'date': new_date,
-            'slot_time': new_time
-        }
-        patient_email = appointment['email']
-        send_reschedule_notification(patient_email, appointment_details)
+            previous_no_shows = get_patient_history(patient_id, new_day, appointment)['no_show_count']
+            lead_time = new_day - today
+            distance_5km = 0 if 'Lagos' in appointment['location'] else 1
+            time_of_day_morning = 1 if is_morning(new_slot) else 0
+            is_weekday_weekend = 1 if is_weekend(new_day) else 0
 
-        formatted_date = pd.to_datetime(new_date).strftime("%d %B %Y")
-        flash(f"Appointment for {patient_email} manually rescheduled to {formatted_date} at {new_time} at {appointment['hospital_name']}.", "success")
-        return redirect(url_for('admin_dashboard'))
+            features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
+            no_show_prob, reschedule_prob = score_appointment(features)
+
+            query = """UPDATE appointments SET appointment_day = ?, slot_minute = ?, status = 'rescheduled', no_show_prob = ?, reschedule_prob = ?, updated_at = ? WHERE id = ?"""
+            query_db(query, (new_day, new_slot, no_show_prob, reschedule_prob, changed_at(), appt_id), commit=True)
+            update_patient_stats(patient_id, (appointment['appointment_day'], appointment['status']), (new_day, 'rescheduled'))
+            slot_occupancy.change(
+                doctor_id,
+                booked_slot(appointment['appointment_day'], appointment['slot_minute'], appointment['no_show_prob'], appointment['status']),
+                booked_slot(new_day, new_slot, no_show_prob, 'rescheduled')
+            )
     except Exception as e:
         app.logger.error(f"Rescheduling error for appointment ID {appt_id}: {e}")
         flash("Error rescheduling appointment.", "danger")
         return redirect(url_for('admin_dashboard'))
 
+    # Mail goes out after the commit, never while the write lock is held
+    appointment_details = {
+        'hospital_name': appointment['hospital_name'],
+        'department_name': appointment['department_name'],
+        'doctor_name': appointment['doctor_name'],
+        'day': new_day,
+        'slot_minute': new_slot
+    }
+    patient_email = appointment['email']
+    send_reschedule_notification(patient_email, appointment_details)
+
+    flash(f"Appointment for {patient_email} manually rescheduled to {format_day(new_day, '%d %B %Y')} at {format_slot(new_slot)} at {appointment['hospital_name']}.", "success")
+    return redirect(url_for('admin_dashboard'))
+
 @app.route('/close_appt/<int:appt_id>', methods=['POST'], endpoint='close_appt')
 @login_required('admin')
 def close_appt(appt_id):
-    appointment = query_db(
-        """
-        SELECT u.email, h.name AS hospital_name, a.date, a.slot_time 
-        FROM appointments a 
-        JOIN users u ON a.patient_id = u.id 
-        JOIN hospitals h ON a.hospital_id = h.id 
-        WHERE a.id = ?
-        """,
-        (appt_id,), one=True
-    )
+    with unit_of_work():
+        appointment = query_db(
+            """
+            SELECT u.email, h.name AS hospital_name, a.patient_id, a.doctor_id, a.appointment_day, a.slot_minute, a.no_show_prob, a.status 
+            FROM appointments a 
+            JOIN users u ON a.patient_id = u.id 
+            JOIN hospitals h ON a.hospital_id = h.id 
+            WHERE a.id = ?
+            """,
+            (appt_id,), one=True
+        )
+        if appointment:
+            query = "UPDATE appointments SET status = ?, updated_at = ? WHERE id = ?"
+            query_db(query, ('closed', changed_at(), appt_id), commit=True)
+            update_patient_stats(appointment['patient_id'], (appointment['appointment_day'], appointment['status']), (appointment['appointment_day'], 'closed'))
+            slot_occupancy.change(
+                appointment['doctor_id'],
+                booked_slot(appointment['appointment_day'], appointment['slot_minute'], appointment['no_show_prob'], appointment['status']),
+                booked_slot(appointment['appointment_day'], appointment['slot_minute'], appointment['no_show_prob'], 'closed')
+            )
     if appointment:
-        query = "UPDATE appointments SET status = ? WHERE id = ?"
-        query_db(query, ('closed', appt_id), commit=True)
-        formatted_date = pd.to_datetime(appointment['date']).strftime("%d %B %Y")
-        flash(f"Appointment for {appointment['email']} at {appointment['hospital_name']} on {formatted_date} at {appointment['slot_time']} closed.", "success")
+        flash(f"Appointment for {appointment['email']} at {appointment['hospital_name']} on {format_day(appointment['appointment_day'], '%d %B %Y')} at {format_slot(appointment['slot_minute'])} closed.", "success")
     else:
         flash("Appointment not found.", "danger")
     return redirect(url_for('admin_dashboard'))
 
+# A doctor's booked (day, slot) pairs between two days
+TAKEN_SLOTS_QUERY = """SELECT appointment_day, slot_minute FROM appointments
+                       WHERE doctor_id = ? AND appointment_day BETWEEN ? AND ? AND status != 'closed'"""
+
 @app.route('/auto_reschedule/<int:appt_id>', methods=['POST'], endpoint='auto_reschedule')
 @login_required('admin')
 def auto_reschedule(appt_id):
     try:
-        appointment = query_db(
-            """
-            SELECT a.*, u.email, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name 
-            FROM appointments a 
-            JOIN users u ON a.patient_id = u.id 
-            JOIN hospitals h ON a.hospital_id = h.id 
-            JOIN departments d ON a.department_id = d.id 
-            JOIN doctors doc ON a.doctor_id = doc.id 
-            WHERE a.id = ? AND a.no_show_prob > 0.5 AND a.status IN ('scheduled', 'rescheduled')
-            """,
-            (appt_id,), one=True
-        )
-        
-        if not appointment:
-            app.logger.info(f"Appointment ID {appt_id} not eligible for auto-rescheduling: no_show_prob <= 0.5 or invalid status")
-            flash("Appointment not eligible for auto-rescheduling.", "info")
-            return jsonify({"status": "info", "message": "Appointment not eligible for auto-rescheduling."})
+        # Lookups, slot search, update and patient_stats update commit together
+        with unit_of_work():
+            appointment = query_db(
+                f"""
+                SELECT a.*, u.email, h.name AS hospital_name, h.location, d.name AS department_name, doc.name AS doctor_name,
+                       {PATIENT_STATS_COLUMNS}
+                FROM appointments a 
+                JOIN users u ON a.patient_id = u.id 
+                JOIN hospitals h ON a.hospital_id = h.id 
+                JOIN departments d ON a.department_id = d.id 
+                JOIN doctors doc ON a.doctor_id = doc.id 
+                LEFT JOIN patient_stats ps ON ps.patient_id = a.patient_id
+                WHERE a.id = ? AND a.no_show_prob > 0.5 AND a.status IN ('scheduled', 'rescheduled')
+                """,
+                (appt_id,), one=True
+            )
+            
+            if not appointment:
+                app.logger.info(f"Appointment ID {appt_id} not eligible for auto-rescheduling: no_show_prob <= 0.5 or invalid status")
+                flash("Appointment not eligible for auto-rescheduling.", "info")
+                return jsonify({"status": "info", "message": "Appointment not eligible for auto-rescheduling."})
+
+            app.logger.debug(f"Processing appointment ID {appt_id}: {appointment}")
+
+            current_day = appointment['appointment_day']
+            if current_day is None:
+                app.logger.error(f"Appointment ID {appt_id} has no date")
+                flash("Invalid date format for the appointment.", "danger")
+                return jsonify({"status": "error", "message": "Invalid date format for the appointment."}), 500
+
+            # First free slot in the next 7 days, from one read of the doctor's week
+            lock_doctor_schedule(appointment['doctor_id'])
+            taken = query_db(TAKEN_SLOTS_QUERY, (appointment['doctor_id'], current_day + 1, current_day + 7))
+            taken = {(row['appointment_day'], row['slot_minute']) for row in taken}
+            new_day, new_slot = next(
+                ((day, slot) for day in range(current_day + 1, current_day + 8) for slot in SLOT_MINUTES if (day, slot) not in taken),
+                (None, None)
+            )
 
-        app.logger.debug(f"Processing appointment ID {appt_id}: {appointment}")
+            if new_day is None:
+                app.logger.warning(f"No available slots found for appointment ID {appt_id}")
+                flash("No available slots found for rescheduling.", "warning")
+                return jsonify({"status": "warning", "message": "No available slots found for rescheduling."})
 
-        date_str = appointment['date']
-        try:
-            current_date = pd.to_datetime(date_str)
-        except ValueError as e:
-            app.logger.error(f"Invalid date format for appointment ID {appt_id}: {date_str}. Error: {e}")
-            flash("Invalid date format for the appointment.", "danger")
-            return jsonify({"status": "error", "message": "Invalid date format for the appointment."}), 500
-
-        all_slots = [f"{hour:02d}:00 {'AM' if hour < 12 else 'PM'}" for hour in range(8, 18)]
-        new_date = None
-        new_slot_time = None
-        for i in range(1, 8):
-            candidate_date = current_date + timedelta(days=i)
-            candidate_date_str = candidate_date.strftime('%Y-%m-%d')
-            for slot in all_slots:
-                conflict = query_db(
-                    "SELECT * FROM appointments WHERE doctor_id = ? AND date = ? AND slot_time = ? AND status != 'closed'",
-                    (appointment['doctor_id'], candidate_date_str, slot)
-                )
-                if not conflict:
-                    new_date = candidate_date_str
-                    new_slot_time = slot
-                    break
-            if new_date:
-                break
+            previous_no_shows = get_patient_history(appointment['patient_id'], new_day, appointment)['no_show_count']
+            lead_time = new_day - today_day()
+            distance_5km = 0 if 'Lagos' in appointment['location'] else 1
+            time_of_day_morning = 1 if is_morning(new_slot) else 0
+            is_weekday_weekend = 1 if is_weekend(new_day) else 0
 
-        if not new_date:
-            app.logger.warning(f"No available slots found for appointment ID {appt_id}")
-            flash("No available slots found for rescheduling.", "warning")
-            return jsonify({"status": "warning", "message": "No available slots found for rescheduling."})
+            features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
+            no_show_prob, reschedule_prob = score_appointment(features)
 
-        past_appointments = query_db(
-            "SELECT status FROM appointments WHERE patient_id = ? AND date < ?",
-            (appointment['patient_id'], new_date)
-        )
-        previous_no_shows = sum(1 for appt in past_appointments if appt['status'] == 'no_show')
-
-        hospital_location = query_db("SELECT location FROM hospitals WHERE id = ?", (appointment['hospital_id'],), one=True)
-        if not hospital_location:
-            flash("Invalid hospital.", "danger")
-            return jsonify({"status": "error", "message": "Invalid hospital."})
-
-        hospital_location = hospital_location['location']
-        appointment_date = pd.to_datetime(new_date)
-        current_date_dt = pd.to_datetime(date.today())
-        lead_time = (appointment_date - current_date_dt).days
-        distance_5km = 0 if 'Lagos' in hospital_location else 1
-        time_of_day_morning = 1 if 'AM' in new_slot_time.upper() else 0
-        is_weekday = appointment_date.day_name() in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        is_weekday_weekend = 0 if is_weekday else 1
-
-        features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
-        no_show_prob = predict_no_show(features)
-        reschedule_prob = predict_reschedule(features)
-
-        query_db(
-            "UPDATE appointments SET date = ?, slot_time = ?, status = 'rescheduled', no_show_prob = ?, reschedule_prob = ? WHERE id = ?",
-            (new_date, new_slot_time, no_show_prob, reschedule_prob, appt_id), commit=True
-        )
+            query_db(
+                "UPDATE appointments SET appointment_day = ?, slot_minute = ?, status = 'rescheduled', no_show_prob = ?, reschedule_prob = ?, updated_at = ? WHERE id = ?",
+                (new_day, new_slot, no_show_prob, reschedule_prob, changed_at(), appt_id), commit=True
+            )
+            update_patient_stats(appointment['patient_id'], (current_day, appointment['status']), (new_day, 'rescheduled'))
+            slot_occupancy.change(
+                appointment['doctor_id'],
+                booked_slot(current_day, appointment['slot_minute'], appointment['no_show_prob'], appointment['status']),
+                booked_slot(new_day, new_slot, no_show_prob, 'rescheduled')
+            )
 
         appointment_details = {
             'hospital_name': appointment['hospital_name'],
             'department_name': appointment['department_name'],
             'doctor_name': appointment['doctor_name'],
-            'date': new_date,
-            'slot_time': new_slot_time
+            'day': new_day,
+            'slot_minute': new_slot
         }
         send_reschedule_notification(appointment['email'], appointment_details)
 
-        formatted_date = pd.to_datetime(new_date).strftime("%d %B %Y")
-        app.logger.info(f"Auto-rescheduled appointment ID {appt_id} to {new_date} at {new_slot_time}")
-        flash(f"Appointment for {appointment['email']} automatically rescheduled to {formatted_date} at {new_slot_time} at {appointment['hospital_name']}.", "success")
-        return jsonify({"status": "success", "message": f"Appointment auto-rescheduled to {new_date} at {new_slot_time}."})
+        app.logger.info(f"Auto-rescheduled appointment ID {appt_id} to {format_day(new_day)} at {format_slot(new_slot)}")
+        flash(f"Appointment for {appointment['email']} automatically rescheduled to {format_day(new_day, '%d %B %Y')} at {format_slot(new_slot)} at {appointment['hospital_name']}.", "success")
+        return jsonify({"status": "success", "message": f"Appointment auto-rescheduled to {format_day(new_day)} at {format_slot(new_slot)}."})
 
     except Exception as e:
         app.logger.error(f"Error during auto-rescheduling of appointment ID {appt_id}: {e}")
         flash("An error occurred during auto-rescheduling.", "danger")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Scheduled appointments with a no-show risk over 50%, with the names the reschedule
+# emails use and the patient's stats for get_patient_history()
+HIGH_RISK_APPOINTMENTS_QUERY = f"""
+    SELECT a.id, a.patient_id, a.hospital_id, a.department_id, a.doctor_id, a.appointment_day, a.slot_minute, a.no_show_prob,
+           u.email, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name,
+           {PATIENT_STATS_COLUMNS}
+    FROM appointments a
+    JOIN users u ON a.patient_id = u.id
+    JOIN hospitals h ON a.hospital_id = h.id
+    JOIN departments d ON a.department_id = d.id
+    JOIN doctors doc ON a.doctor_id = doc.id
+    LEFT JOIN patient_stats ps ON ps.patient_id = a.patient_id
+    WHERE a.no_show_prob > 50 AND a.status = 'scheduled'
+"""
+
 @app.route('/auto_reschedule_all', methods=['POST'], endpoint='auto_reschedule_all')
 @login_required('admin')
 def auto_reschedule_all():
     try:
-        high_risk_appts = query_db(
-            """
-            SELECT a.id, a.patient_id, a.hospital_id, a.department_id, a.doctor_id, a.date, a.no_show_prob,
-                   u.email, h.name AS hospital_name, d.name AS department_name, doc.name AS doctor_name
-            FROM appointments a
-            JOIN users u ON a.patient_id = u.id
-            JOIN hospitals h ON a.hospital_id = h.id
-            JOIN departments d ON a.department_id = d.id
-            JOIN doctors doc ON a.doctor_id = doc.id
-            WHERE a.no_show_prob > 50 AND a.status = 'scheduled'
-            """
-        )
+        high_risk_appts = query_db(HIGH_RISK_APPOINTMENTS_QUERY)
 
         if not high_risk_appts:
             app.logger.info("No high-risk appointments found for auto-rescheduling.")
             flash("No high-risk appointments to reschedule.", "info")
             return redirect(url_for('admin_dashboard'))
 
+        # Pick slots and build features first, then score every reschedule in one batch
         rescheduled_count = 0
+        pending_slots = {}
+        to_score = []
+        today = today_day()
+        assignments = {}
+        if AUTO_RESCHEDULE_MODE == 'batch':
+            assignments = assign_reschedule_slots(
+                [appt for appt in high_risk_appts if appt['appointment_day'] is not None], today
+            )
+            # Hold the batch's slots so the per-appointment search for whatever the
+            # solver left unplaced does not hand them out again
+            for appt in high_risk_appts:
+                if appt['id'] in assignments:
+                    new_day, new_slot = assignments[appt['id']]
+                    pending_slots.setdefault((appt['doctor_id'], new_day), []).append(
+                        {'slot_minute': new_slot, 'patient_id': appt['patient_id'], 'no_show_prob': appt['no_show_prob'] or 0.0}
+                    )
+            unplaced = sum(1 for appt in high_risk_appts if appt['id'] not in assignments)
+            app.logger.info(f"Batch assignment placed {len(assignments)} appointments; searching one by one for {unplaced} more")
         for appt in high_risk_appts:
             appt_id = appt['id']
             patient_id = appt['patient_id']
             hospital_id = appt['hospital_id']
             department_id = appt['department_id']
             doctor_id = appt['doctor_id']
-            current_date = appt['date']
-            patient_email = appt['email']
+            current_day = appt['appointment_day']
             app.logger.debug(f"Processing high-risk appointment ID {appt_id}: no_show_prob={appt['no_show_prob']}")
+            if current_day is None:
+                app.logger.error(f"Appointment ID {appt_id} has no date")
+                continue
 
-            new_date, new_time = find_available_slot(doctor_id, current_date, patient_id)
-            if not new_date or not new_time:
+            batch_placed = appt_id in assignments
+            if batch_placed:
+                new_day, new_slot = assignments[appt_id]
+            else:
+                new_day, new_slot = find_available_slot(doctor_id, current_day, patient_id, pending=pending_slots)
+            if new_day is None or new_slot is None:
                 app.logger.warning(f"No available slot found for appointment ID {appt_id}")
                 continue
 
-            try:
-                appointment_date = pd.to_datetime(new_date)
-                current_date_dt = pd.to_datetime(date.today())
-                max_date = current_date_dt + relativedelta(years=1)
-
-                if appointment_date < current_date_dt or appointment_date > max_date:
-                    app.logger.warning(f"Invalid date range for appointment ID {appt_id}: {new_date}")
-                    continue
-            except ValueError as e:
-                app.logger.error(f"Invalid date format for appointment ID {appt_id}: {new_date}. Error: {e}")
+            if new_day < today or new_day > max_booking_day(today):
+                app.logger.warning(f"Invalid date range for appointment ID {appt_id}: {format_day(new_day)}")
                 continue
 
-            past_appointments = query_db(
-                "SELECT status FROM appointments WHERE patient_id = ? AND date < ?",
-                (patient_id, new_date)
-            )
-            previous_no_shows = sum(1 for appt in past_appointments if appt['status'] == 'no_show')
+            previous_no_shows = get_patient_history(patient_id, new_day, appt)['no_show_count']
 
-            hospital_location = query_db("SELECT location FROM hospitals WHERE id = ?", (hospital_id,), one=True)
-            if not hospital_location:
+            hospital = reference_data.hospital(hospital_id)
+            if not hospital:
                 app.logger.warning(f"Invalid hospital_id {hospital_id} for appointment ID {appt_id}")
                 continue
-            hospital_location = hospital_location['location']
+            hospital_location = hospital['location']
 
-            lead_time = (appointment_date - current_date_dt).days
+            lead_time = new_day - today
             distance_5km = 0 if 'Lagos' in hospital_location else 1
-            time_of_day_morning = 1 if 'AM' in new_time.upper() else 0
-            is_weekday = appointment_date.day_name() in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-            is_weekday_weekend = 0 if is_weekday else 1
+            time_of_day_morning = 1 if is_morning(new_slot) else 0
+            is_weekday_weekend = 1 if is_weekend(new_day) else 0
 
             features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
+            to_score.append((appt, new_day, new_slot, features))
+            if not batch_placed:
+                pending_slots.setdefault((doctor_id, new_day), []).append(
+                    {'slot_minute': new_slot, 'patient_id': patient_id, 'no_show_prob': appt['no_show_prob'] or 0.0}
+                )
 
-            try:
-                no_show_prob = predict_no_show(features)
-                reschedule_prob = predict_reschedule(features)
+        try:
+            features_matrix = [features for _, _, _, features in to_score]
+            no_show_probs, reschedule_probs = score_appointments(features_matrix)
+        except Exception as e:
+            app.logger.error(f"Error predicting probabilities for high-risk appointments: {e}")
+            flash("An error occurred during auto-rescheduling.", "danger")
+            return redirect(url_for('admin_dashboard'))
 
-                if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
-                    app.logger.warning(f"Invalid probabilities for appointment ID {appt_id}: no_show_prob={no_show_prob}, reschedule_prob={reschedule_prob}")
-                    continue
-            except Exception as e:
-                app.logger.error(f"Error predicting probabilities for appointment ID {appt_id}: {e}")
+        reschedules = AppointmentBatch()
+        rescheduled = []
+        for (appt, new_day, new_slot, _), no_show_prob, reschedule_prob in zip(to_score, no_show_probs, reschedule_probs):
+            appt_id = appt['id']
+            no_show_prob = float(no_show_prob)
+            reschedule_prob = float(reschedule_prob)
+            if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
+                app.logger.warning(f"Invalid probabilities for appointment ID {appt_id}: no_show_prob={no_show_prob}, reschedule_prob={reschedule_prob}")
                 continue
 
-            query = "UPDATE appointments SET date = ?, slot_time = ?, status = 'rescheduled', no_show_prob = ?, reschedule_prob = ? WHERE id = ?"
-            query_db(query, (new_date, new_time, no_show_prob, reschedule_prob, appt_id), commit=True)
+            reschedules.update(
+                appt_id, appt['patient_id'], (appt['appointment_day'], 'scheduled'), (new_day, 'rescheduled'),
+                slot=(appt['doctor_id'],
+                      booked_slot(appt['appointment_day'], appt['slot_minute'], appt['no_show_prob'], 'scheduled'),
+                      booked_slot(new_day, new_slot, no_show_prob, 'rescheduled')),
+                appointment_day=new_day, slot_minute=new_slot, status='rescheduled',
+                no_show_prob=no_show_prob, reschedule_prob=reschedule_prob
+            )
+            rescheduled.append((appt, new_day, new_slot))
+        reschedules.flush()
 
+        # Notify only once the reschedules are committed
+        for appt, new_day, new_slot in rescheduled:
+            patient_email = appt['email']
             appointment_details = {
                 'hospital_name': appt['hospital_name'],
                 'department_name': appt['department_name'],
                 'doctor_name': appt['doctor_name'],
-                'date': new_date,
-                'slot_time': new_time
+                'day': new_day,
+                'slot_minute': new_slot
             }
             send_reschedule_notification(patient_email, appointment_details)
 
-            formatted_date = pd.to_datetime(new_date).strftime("%d %B %Y")
-            flash(f"Appointment for {patient_email} automatically rescheduled to {formatted_date} at {new_time} at {appt['hospital_name']}.", "success")
+            flash(f"Appointment for {patient_email} automatically rescheduled to {format_day(new_day, '%d %B %Y')} at {format_slot(new_slot)} at {appt['hospital_name']}.", "success")
             rescheduled_count += 1
 
         flash(f"Successfully rescheduled {rescheduled_count} high-risk appointments.", "success")
@@ -1096,6 +2314,40 @@ def auto_reschedule_all():
         flash("An error occurred during auto-rescheduling.", "danger")
         return redirect(url_for('admin_dashboard'))
 
+# Monte Carlo overbooking report for a day (default tomorrow): one doctor with per-slot
+# detail when doctor_id is given, else a summary for every doctor with bookings.
+# new_risk is the no_show_prob assumed for bookings not made yet.
+@app.route('/simulate_overbooking', methods=['GET'], endpoint='simulate_overbooking')
+@login_required('admin')
+def simulate_overbooking():
+    doctor_id = request.args.get('doctor_id', type=int)
+    runs = min(request.args.get('runs', SIMULATION_RUNS, type=int), MAX_SIMULATION_RUNS)
+    new_no_show_prob = request.args.get('new_risk', type=float)
+    try:
+        day = to_day(request.args['date']) if request.args.get('date') else today_day() + 1
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    if runs < 1 or (new_no_show_prob is not None and not 0 <= new_no_show_prob <= 100):
+        return jsonify({'error': 'Invalid runs or new_risk'}), 400
+
+    try:
+        start = time.perf_counter()
+        results = overbooking_results(day, doctor_id, runs=runs, new_no_show_prob=new_no_show_prob)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    except Exception as e:
+        app.logger.error(f"Error simulating overbooking: {e}")
+        return jsonify({'error': 'Simulation failed'}), 500
+
+    doctors = []
+    for doctor, result in sorted(results.items()):
+        if doctor_id is None:
+            del result['slots']
+        else:
+            for slot in result['slots']:
+                slot['time'] = format_slot(slot.pop('slot_minute'))
+        doctors.append({'doctor_id': doctor, **result})
+    return jsonify({'date': format_day(day), 'elapsed_ms': round(elapsed_ms, 1), 'doctors': doctors})
+
 # Debug Routes
 @app.route('/debug_appointments', methods=['GET'])
 @login_required('admin')
@@ -1127,10 +2379,31 @@ def debug_users():
     users = query_db("SELECT * FROM users")
     return jsonify(users)
 
+@app.route('/debug_model_registry', methods=['GET'])
+@login_required('admin')
+def debug_model_registry():
+    if request.args.get('reload') == '1':
+        try:
+            model_registry.reload(force=True)
+        except Exception as e:
+            app.logger.error(f"Forced model reload failed: {e}")
+            return jsonify({'error': str(e)}), 500
+    return jsonify(model_registry.stats())
+
+@app.route('/debug_reference_data', methods=['GET'])
+@login_required('admin')
+def debug_reference_data():
+    if request.args.get('reload') == '1':
+        reference_data.invalidate()
+        reference_data.get()
+    return jsonify(reference_data.stats())
+
 if __name__ == '__main__':
     init_db()
     scheduler = BackgroundScheduler()
     scheduler.add_job(check_no_shows_and_reschedule, 'cron', hour=8, minute=0)
+    scheduler.add_job(retrain_models_incrementally, 'cron', hour=2, minute=0)
+    scheduler.add_job(simulate_tomorrows_overbooking, 'cron', hour=3, minute=0)
     scheduler.start()
 
     try:
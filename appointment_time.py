@@ -0,0 +1,60 @@
+import re
+from datetime import date, datetime, timedelta
+
+# Appointments store their date as appointment_day (days since 1970-01-01) and their
+# slot as slot_minute (minutes after midnight). Strings only exist at the edges: parsed
+# from forms and query strings, formatted for templates, emails and JSON.
+EPOCH = date(1970, 1, 1)
+CLINIC_HOURS = range(8, 18)
+SLOT_MINUTES = [hour * 60 for hour in CLINIC_HOURS]
+NOON = 12 * 60
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y')
+SLOT_PATTERN = re.compile(r'\s*(\d{1,2}):(\d{2})\s*([AaPp][Mm])?\s*')
+
+# Day number for a date, datetime, pandas Timestamp or a YYYY-MM-DD / MM/DD/YYYY string
+def to_day(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return (value - EPOCH).days
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return (datetime.strptime(text, fmt).date() - EPOCH).days
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date: {value!r}")
+
+def today_day():
+    return to_day(date.today())
+
+def day_to_date(day):
+    return EPOCH + timedelta(days=int(day))
+
+def format_day(day, fmt='%Y-%m-%d'):
+    return '' if day is None else day_to_date(day).strftime(fmt)
+
+def is_weekend(day):
+    return day_to_date(day).weekday() >= 5
+
+# Minute of day for "08:00 AM", "8:00 AM", "13:00" and the legacy "13:00 PM"
+# (a 24-hour hour with a suffix, which the suffix must not shift again)
+def to_slot_minute(value):
+    match = SLOT_PATTERN.fullmatch(str(value))
+    if not match:
+        raise ValueError(f"Unrecognized slot time: {value!r}")
+    hour, minute, suffix = int(match[1]), int(match[2]), (match[3] or '').upper()
+    if suffix and 1 <= hour <= 12:
+        hour = hour % 12 + (12 if suffix == 'PM' else 0)
+    if hour > 23 or minute > 59:
+        raise ValueError(f"Unrecognized slot time: {value!r}")
+    return hour * 60 + minute
+
+def format_slot(minute):
+    if minute is None:
+        return ''
+    hour, minute = divmod(int(minute), 60)
+    return f"{hour % 12 or 12:02d}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+def is_morning(minute):
+    return minute < NOON
@@ -0,0 +1,229 @@
+import asyncio
+import re
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from itsdangerous import BadSignature
+from app import (app, DB_TYPE, SQLITE_POOL_SIZE, PG_POOL_MAX_SIZE, PG_CONNECT_PARAMS, REFERENCE_MAX_AGE, get_sqlite_conn, dialect,
+                 reference_data, slot_occupancy, DAY_APPOINTMENTS_QUERY, range_appointments_query,
+                 PATIENT_STATS_QUERY, PATIENT_HISTORY_QUERY, MAX_APPOINTMENTS_PER_SLOT,
+                 history_from_stats, no_show_history_score, occupancy_refusal, available_slot_minutes,
+                 availability_query, availability_response, json_bytes)
+from appointment_time import to_day, to_slot_minute, format_slot
+from async_db import AsyncDatabase
+from model.no_show_model import calculate_priority_score
+
+# ASGI entry point for the booking page's lookups. static/js/script.js calls
+# /get_departments, /get_doctors, /get_available_slots and /check_slot on every dropdown
+# change (and /get_availability once per month viewed); here they run as coroutines on
+# AsyncDatabase, so one worker serves many of them at once instead of one per thread.
+# Every other path, and any method other than GET on these, goes to the Flask app
+# unchanged. Run with
+#
+#     gunicorn -k uvicorn.workers.UvicornWorker async_api:application
+#
+# The responses match the Flask routes of the same name in app.py.
+
+db = AsyncDatabase(
+    DB_TYPE,
+    PG_POOL_MAX_SIZE if DB_TYPE == "postgresql" else SQLITE_POOL_SIZE,
+    connect_sqlite=get_sqlite_conn,
+    pg_params=PG_CONNECT_PARAMS,
+    translate=dialect,
+)
+
+# The logged-in user from Flask's signed session cookie, or an empty dict
+def read_session(scope):
+    cookies = SimpleCookie()
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return {}
+    serializer = app.session_interface.get_signing_serializer(app)
+    try:
+        return serializer.loads(morsel.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+# Serialized by the Flask app's JSON provider, so the body is byte for byte what jsonify() returns
+def json_response(data, status=200):
+    return status, [(b'content-type', app.json.mimetype.encode())], json_bytes(data)
+
+# The Flask routes also flash "Please log in"; the flash lives in the session, which
+# this side only reads, so /login is reached without it
+def login_redirect():
+    return 302, [(b'location', b'/login'), (b'content-type', b'text/html; charset=utf-8')], b''
+
+# The doctor's day from slot_occupancy, reading it through AsyncDatabase on a miss
+async def doctor_day_occupancy(doctor_id, day):
+    occupancy, token = slot_occupancy.lookup(doctor_id, day)
+    if occupancy is not None:
+        return occupancy
+    rows = None
+    try:
+        rows = await db.fetch(DAY_APPOINTMENTS_QUERY, token[0])
+    finally:
+        occupancy = slot_occupancy.store(token, rows)
+    return occupancy
+
+# The doctors' days from slot_occupancy, reading the ones not cached with one range query
+async def occupancy_range(doctor_ids, first_day, last_day):
+    occupancies, tokens = slot_occupancy.lookup_range(doctor_ids, first_day, last_day)
+    if tokens:
+        rows = None
+        try:
+            rows = await db.fetch(*range_appointments_query(tokens))
+        finally:
+            slot_occupancy.store_range(occupancies, tokens, rows)
+    return occupancies
+
+async def patient_history(patient_id, day):
+    stats = await db.fetchone(PATIENT_STATS_QUERY, (patient_id,))
+    history = history_from_stats(stats, day)
+    if history is None:
+        history = await db.fetchone(PATIENT_HISTORY_QUERY, (patient_id, day))
+    return history
+
+# The reference data snapshot; an expired one is reloaded off the event loop
+async def reference_snapshot():
+    snapshot = reference_data.current()
+    if snapshot is None:
+        snapshot = await asyncio.to_thread(reference_data.get)
+    return snapshot
+
+# A cached dropdown list with the validators reference_response() sets in app.py
+def reference_response(scope, body, etag):
+    quoted = f'"{etag}"'.encode()
+    headers = [(b'etag', quoted), (b'cache-control', f'public, max-age={REFERENCE_MAX_AGE}'.encode())]
+    for name, value in scope['headers']:
+        if name == b'if-none-match' and (value.strip() == b'*' or quoted in [tag.strip().removeprefix(b'W/') for tag in value.split(b',')]):
+            return 304, headers, b''
+    return 200, [(b'content-type', b'application/json')] + headers, body
+
+async def get_departments(scope, params, user, hospital_id):
+    snapshot = await reference_snapshot()
+    return reference_response(scope, *snapshot.departments.get(hospital_id, snapshot.empty))
+
+async def get_doctors(scope, params, user, department_id):
+    snapshot = await reference_snapshot()
+    return reference_response(scope, *snapshot.doctors.get(department_id, snapshot.empty))
+
+async def check_slot(scope, params, user):
+    if 'user_id' not in user or user.get('role') != 'patient':
+        return login_redirect()
+    doctor_id = params.get('doctor_id')
+    date = params.get('date')
+    slot_time = params.get('time')
+    patient_id = user['user_id']
+
+    if not all([doctor_id, date, slot_time]):
+        return json_response({'available': False, 'error': 'Missing required parameters'})
+
+    try:
+        day = to_day(date)
+        slot_minute = to_slot_minute(slot_time)
+    except ValueError:
+        return json_response({'available': False, 'error': 'Invalid date or time format'})
+
+    try:
+        bookings, combined_no_show_prob = (await doctor_day_occupancy(doctor_id, day)).get(slot_minute, (0, 0.0))
+        priority_score = None
+        if 0 < bookings < MAX_APPOINTMENTS_PER_SLOT:
+            priority_score = calculate_priority_score(no_show_history_score(await patient_history(patient_id, day)))
+        refusal = occupancy_refusal(bookings, combined_no_show_prob, priority_score)
+        if refusal:
+            return json_response({'available': False, 'error': refusal})
+        return json_response({'available': True})
+    except Exception as e:
+        app.logger.error(f"Error checking slot availability: {e}")
+        return json_response({'available': False, 'error': 'Database error'})
+
+async def get_available_slots(scope, params, user):
+    if 'user_id' not in user or user.get('role') != 'patient':
+        return login_redirect()
+    doctor_id = params.get('doctor_id')
+    date = params.get('date')
+    patient_id = user['user_id']
+
+    if not all([doctor_id, date]):
+        return json_response({'error': 'Missing required parameters'})
+
+    try:
+        day = to_day(date)
+    except ValueError:
+        return json_response({'error': 'Invalid date format'})
+
+    try:
+        # The doctor's day and the patient's history are independent reads
+        occupancy, history = await asyncio.gather(
+            doctor_day_occupancy(doctor_id, day),
+            patient_history(patient_id, day)
+        )
+        priority_score = calculate_priority_score(no_show_history_score(history))
+        return json_response([format_slot(slot) for slot in available_slot_minutes(occupancy, priority_score)])
+    except Exception as e:
+        app.logger.error(f"Error fetching available slots: {e}")
+        return json_response({'error': 'Database error'})
+
+async def get_availability(scope, params, user):
+    if 'user_id' not in user or user.get('role') != 'patient':
+        return login_redirect()
+    doctor_ids, first_day, last_day, error = availability_query(params, await reference_snapshot())
+    if error:
+        message, status = error
+        return json_response({'error': message}, status)
+
+    try:
+        occupancies, history = await asyncio.gather(
+            occupancy_range(doctor_ids, first_day, last_day),
+            patient_history(user['user_id'], first_day)
+        )
+        priority_score = calculate_priority_score(no_show_history_score(history))
+        return json_response(availability_response(occupancies, first_day, last_day, priority_score))
+    except Exception as e:
+        app.logger.error(f"Error fetching availability: {e}")
+        return json_response({'error': 'Database error'})
+
+ROUTES = [
+    (re.compile(r'/get_departments/(\d+)'), get_departments),
+    (re.compile(r'/get_doctors/(\d+)'), get_doctors),
+    (re.compile(r'/get_available_slots'), get_available_slots),
+    (re.compile(r'/check_slot'), check_slot),
+    (re.compile(r'/get_availability'), get_availability),
+]
+
+_flask_asgi = None
+
+async def flask_application(scope, receive, send):
+    global _flask_asgi
+    if _flask_asgi is None:
+        from asgiref.wsgi import WsgiToAsgi
+        _flask_asgi = WsgiToAsgi(app)
+    await _flask_asgi(scope, receive, send)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await db.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        for pattern, handler in ROUTES:
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                params = {key: values[0] for key, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+                user = read_session(scope)
+                status, headers, body = await handler(scope, params, user, *(int(arg) for arg in match.groups()))
+                headers.append((b'content-length', str(len(body)).encode()))
+                await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+                return
+    await flask_application(scope, receive, send)
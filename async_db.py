@@ -0,0 +1,131 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from psycopg2 import extensions
+
+# Block until an asynchronous psycopg2 connection finishes its current operation,
+# yielding to the event loop while the socket is not ready
+async def _wait(conn):
+    loop = asyncio.get_running_loop()
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        fd = conn.fileno()
+        ready = loop.create_future()
+        def wake():
+            if not ready.done():
+                ready.set_result(None)
+        if state == extensions.POLL_READ:
+            loop.add_reader(fd, wake)
+            try:
+                await ready
+            finally:
+                loop.remove_reader(fd)
+        elif state == extensions.POLL_WRITE:
+            loop.add_writer(fd, wake)
+            try:
+                await ready
+            finally:
+                loop.remove_writer(fd)
+        else:
+            raise psycopg2.OperationalError(f"Unexpected poll state {state}")
+
+# Read-only data access for handlers running on an event loop (see async_api.py).
+# Rows come back as dicts, like query_db(). Queries use ? placeholders; translate turns
+# them into the driver's dialect.
+#
+# PostgreSQL connections run in psycopg2's asynchronous mode and are polled from the
+# loop, so a request waiting on the database holds a socket, not a thread. At most
+# max_connections are open; further queries wait on the loop for one to come back.
+# SQLite has no non-blocking API, so its queries run on max_connections executor
+# threads that each keep one connection; in WAL mode those reads run side by side.
+class AsyncDatabase:
+    def __init__(self, db_type, max_connections, connect_sqlite=None, pg_params=None, translate=None):
+        self.db_type = db_type
+        self.max_connections = max_connections
+        self._connect_sqlite = connect_sqlite
+        self._pg_params = pg_params or {}
+        self._translate = translate or (lambda query: query)
+        self._executor = None
+        self._local = threading.local()
+        self._sqlite_conns = []
+        # Idle PostgreSQL connections; None stands for a connection not opened yet.
+        # Created on first use so it belongs to the serving loop.
+        self._pg_idle = None
+
+    async def fetch(self, query, args=()):
+        if self.db_type == "postgresql":
+            return await self._fetch_postgres(query, args)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix='async-db')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._fetch_sqlite, query, args)
+
+    async def fetchone(self, query, args=()):
+        rows = await self.fetch(query, args)
+        return rows[0] if rows else None
+
+    def _fetch_sqlite(self, query, args):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect_sqlite()
+            self._sqlite_conns.append(conn)
+        try:
+            c = conn.execute(query, args)
+            columns = [column[0] for column in c.description or ()]
+            return [dict(zip(columns, row)) for row in c.fetchall()]
+        finally:
+            # Reads only: don't hold a snapshot open between requests
+            if conn.in_transaction:
+                conn.rollback()
+
+    async def _fetch_postgres(self, query, args):
+        conn = await self._acquire()
+        try:
+            c = conn.cursor()
+            c.execute(self._translate(query), args)
+            await _wait(conn)
+            if c.description is None:
+                return []
+            columns = [column[0] for column in c.description]
+            return [dict(zip(columns, row)) for row in c.fetchall()]
+        except (asyncio.CancelledError, psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The connection may be mid-query or broken; its slot reopens on next use
+            conn.close()
+            raise
+        finally:
+            self._pg_idle.put_nowait(None if conn.closed else conn)
+
+    async def _acquire(self):
+        if self._pg_idle is None:
+            self._pg_idle = asyncio.Queue()
+            for _ in range(self.max_connections):
+                self._pg_idle.put_nowait(None)
+        conn = await self._pg_idle.get()
+        if conn is not None and not conn.closed:
+            return conn
+        conn = None
+        try:
+            conn = psycopg2.connect(async_=True, **self._pg_params)
+            await _wait(conn)
+            return conn
+        except BaseException:
+            if conn is not None:
+                conn.close()
+            self._pg_idle.put_nowait(None)
+            raise
+
+    async def close(self):
+        if self._pg_idle is not None:
+            while not self._pg_idle.empty():
+                conn = self._pg_idle.get_nowait()
+                if conn is not None:
+                    conn.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for conn in self._sqlite_conns:
+            conn.close()
+        self._sqlite_conns = []
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from model.no_show_model import build_features, fit_models
+
+# Synthetic joined rows shaped like load_data_from_db() output
+def make_appointments(n_rows, n_patients=None, seed=42):
+    rng = np.random.default_rng(seed)
+    n_patients = n_patients or max(100, n_rows // 50)
+    hours = rng.integers(8, 18, size=n_rows)
+    # appointment_day counts days since 1970-01-01; 19723 is 2024-01-01
+    days = 19723 + rng.integers(0, 494, size=n_rows)
+    return pd.DataFrame({
+        'id': np.arange(1, n_rows + 1),
+        'patient_id': rng.integers(1, n_patients + 1, size=n_rows),
+        'slot_minute': hours * 60,
+        'appointment_day': days,
+        'status': rng.choice(['scheduled', 'attended', 'closed'], p=[0.42, 0.50, 0.08], size=n_rows),
+        'location': rng.choice(['Lagos', 'Abuja', 'Kano', 'Ibadan'], size=n_rows),
+    })
+
+# The row-by-row feature code prepare_data() used before it was vectorized, kept for comparison
+def legacy_features(data, current_date=pd.to_datetime('2025-05-08')):
+    data = data.copy()
+    data['appointment_date'] = pd.to_datetime(data['appointment_day'], unit='D')
+    previous_no_shows = []
+    for idx, row in data.iterrows():
+        past_appointments = data[(data['patient_id'] == row['patient_id']) & (data['appointment_date'] < row['appointment_date'])]
+        no_show_count = past_appointments[past_appointments['status'] == 'scheduled'].shape[0]
+        previous_no_shows.append(no_show_count)
+    data['previous_no_shows'] = previous_no_shows
+    data['lead_time'] = [np.random.randint(1, 91) for _ in range(len(data))]
+    data['distance'] = data['location'].apply(lambda x: '<5km' if 'Lagos' in x else '>5km')
+    data['time_of_day'] = data['slot_minute'].apply(lambda x: 'morning' if x < 720 else 'afternoon')
+    data['day_of_week'] = data['appointment_date'].dt.day_name()
+    data['is_weekday'] = data['day_of_week'].apply(lambda x: 'weekday' if x in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'] else 'weekend')
+    data['no_show'] = data.apply(
+        lambda row: 1 if row['status'] == 'scheduled' and row['appointment_date'] < current_date else 0,
+        axis=1
+    )
+    data['reschedule'] = data.apply(
+        lambda row: 1 if row['lead_time'] > 60 or row['previous_no_shows'] > 2 else 0,
+        axis=1
+    )
+    X = data[['previous_no_shows', 'lead_time', 'distance', 'time_of_day', 'is_weekday']]
+    X_encoded = pd.get_dummies(X, columns=['distance', 'time_of_day', 'is_weekday'], drop_first=True)
+    return X_encoded, data['no_show'], data['reschedule']
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def benchmark_features(legacy_sizes=(1000, 5000, 20000), vectorized_sizes=(100000, 1000000, 5000000)):
+    print("Feature engineering: legacy iterrows vs vectorized build_features")
+    for n_rows in legacy_sizes:
+        data = make_appointments(n_rows)
+        np.random.seed(0)
+        (X_old, y_ns_old, y_rs_old), legacy_seconds = timed(legacy_features, data)
+        np.random.seed(0)
+        (X_new, y_ns_new, y_rs_new), vectorized_seconds = timed(build_features, data)
+        matches = (
+            X_old.astype(np.int64).equals(X_new.astype(np.int64))
+            and y_ns_old.equals(y_ns_new)
+            and y_rs_old.equals(y_rs_new)
+        )
+        print(f"  {n_rows:>9,} rows: legacy {legacy_seconds:8.2f}s  vectorized {vectorized_seconds:6.3f}s  "
+              f"speedup {legacy_seconds / vectorized_seconds:8.0f}x  identical={matches}")
+    for n_rows in vectorized_sizes:
+        data = make_appointments(n_rows)
+        _, vectorized_seconds = timed(build_features, data)
+        print(f"  {n_rows:>9,} rows: vectorized {vectorized_seconds:6.3f}s ({n_rows / vectorized_seconds:,.0f} rows/s)")
+
+# Wall-clock of the four model fits, one after another vs concurrently under the core budget
+def benchmark_fit(n_rows=200000, cpu_budget=None):
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    X, y_no_show, y_reschedule = build_features(make_appointments(n_rows))
+    print(f"Model fitting on {n_rows:,} rows")
+    runs = {}
+    for budget in sorted({1, cpu_budget}):
+        print(f"  core budget {budget}:")
+        _, _, timings = fit_models(X, y_no_show, y_reschedule, cpu_budget=budget)
+        runs[budget] = timings['resample'] + timings['fit']
+    if len(runs) > 1:
+        print(f"  speedup with {cpu_budget} cores: {runs[1] / runs[cpu_budget]:.1f}x")
+
+if __name__ == '__main__':
+    # `python benchmark_training.py fit [rows]` benchmarks model fitting instead of features
+    if len(sys.argv) > 1 and sys.argv[1] == 'fit':
+        benchmark_fit(int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
+    else:
+        benchmark_features()
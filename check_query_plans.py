@@ -0,0 +1,125 @@
+import os
+import re
+import sqlite3
+import sys
+from dotenv import load_dotenv
+from migrations import MIGRATIONS, apply_migrations, schema_version
+
+load_dotenv()
+
+from werkzeug.datastructures import MultiDict
+from app import (DAY_APPOINTMENTS_QUERY, SLOT_APPOINTMENTS_QUERY, SLOT_CONFLICT_QUERY, TAKEN_SLOTS_QUERY,
+                 DAY_BOOKINGS_QUERY, PATIENT_STATS_QUERY, PATIENT_HISTORY_QUERY, PATIENT_RANGE_QUERY,
+                 NO_SHOW_SWEEP_QUERY, HIGH_RISK_APPOINTMENTS_QUERY, PATIENT_APPOINTMENTS_QUERY, ADMIN_PAGE_SIZE,
+                 range_appointments_query, appointment_filters, admin_page_rows_query, export_query)
+from model.no_show_model import LATEST_OUTCOME_QUERY
+
+# The admin page's appointment read for the given filter arguments, as (sql, params)
+def admin_page(args, sort_by, descending, cursor=None):
+    _, conditions, params, _ = appointment_filters(MultiDict(args))
+    sql, _, params = admin_page_rows_query(conditions, params, sort_by, descending, cursor)
+    return sql, (*params, ADMIN_PAGE_SIZE + 1)
+
+# The app's hot appointment queries, taken from app.py, with representative parameters.
+# Day 20220 is 2025-05-12 and slot minute 540 is 09:00 AM.
+QUERIES = [
+    ("day bookings", DAY_APPOINTMENTS_QUERY, (1, 20220)),
+    ("check_slot", SLOT_APPOINTMENTS_QUERY, (1, 20220, 540)),
+    ("reschedule slot conflict", SLOT_CONFLICT_QUERY, (1, 20220, 540, 1)),
+    ("auto_reschedule week", TAKEN_SLOTS_QUERY, (1, 20221, 20227)),
+    ("slot search range", *range_appointments_query([(1, 20221), (1, 20227)])),
+    ("department calendar", *range_appointments_query([(1, 20221), (2, 20221), (3, 20251)])),
+    ("overbooking day", DAY_BOOKINGS_QUERY, (20221,)),
+    ("patient stats", PATIENT_STATS_QUERY, (14,)),
+    ("patient history", PATIENT_HISTORY_QUERY, (14, 20220)),
+    ("patient history range", PATIENT_RANGE_QUERY, (14, 20220, 20227)),
+    ("no-show sweep", NO_SHOW_SWEEP_QUERY, (20219,)),
+    ("auto_reschedule_all", HIGH_RISK_APPOINTMENTS_QUERY, ()),
+    ("patient dashboard", PATIENT_APPOINTMENTS_QUERY, (14,)),
+    ("admin page by date", *admin_page({}, 'date', True, (20220, 5000))),
+    ("admin page by status", *admin_page({}, 'status', False, ('no_show', 5000))),
+    ("admin page for a hospital",
+     *admin_page({'hospital_id': '1', 'date_from': '2025-01-12', 'date_to': '2025-05-12'}, 'date', True)),
+    ("admin page for a status", *admin_page({'status': 'scheduled'}, 'date', True)),
+    ("incremental export", *export_query(since="1750000000:5000")),
+    ("retrain checkpoint", LATEST_OUTCOME_QUERY, (20220,)),
+]
+
+# SQLite reports a full table scan as "SCAN <table>" without "USING ... INDEX"
+def sqlite_full_scans(conn, sql, params):
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    details = [row[3] for row in plan]
+    scans = [detail for detail in details if re.match(r"SCAN \w+", detail) and "USING" not in detail]
+    return details, scans
+
+def postgres_plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from postgres_plan_nodes(child)
+
+# PostgreSQL happily seq-scans tables that fit in a few pages, so plan with seq scans
+# disabled: a Seq Scan that survives means no index can serve the query.
+def postgres_full_scans(conn, sql, params):
+    with conn.cursor() as c:
+        c.execute("SET enable_seqscan = off")
+        c.execute(f"EXPLAIN (FORMAT JSON) {sql.replace('?', '%s')}", params)
+        plan = c.fetchone()[0][0]['Plan']
+    nodes = list(postgres_plan_nodes(plan))
+    details = [f"{node['Node Type']} {node.get('Relation Name', '')}".strip() for node in nodes]
+    scans = [detail for node, detail in zip(nodes, details) if node['Node Type'] == 'Seq Scan']
+    return details, scans
+
+# A connection to plan against that nothing here can write through. SQLite plans on an
+# in-memory copy of database.db (read through a read-only connection) with the
+# migrations applied, so the indexes checked are the ones the app will create.
+# PostgreSQL plans on the live database, which must already be migrated.
+def open_database(db_type, path="database.db"):
+    if db_type == "postgresql":
+        import psycopg2
+        conn = psycopg2.connect(
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT")
+        )
+        latest = MIGRATIONS[-1][0]
+        if schema_version(conn) < latest:
+            conn.close()
+            raise RuntimeError(f"Database is below schema version {latest}; run the app or migrations first")
+        return conn, postgres_full_scans
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn = sqlite3.connect(":memory:")
+    try:
+        source.backup(conn)
+    finally:
+        source.close()
+    apply_migrations(conn, db_type)
+    return conn, sqlite_full_scans
+
+# (name, plan details, full scans) for every query in QUERIES
+def check_plans(conn, explain):
+    results = []
+    for name, sql, params in QUERIES:
+        details, scans = explain(conn, sql, params)
+        results.append((name, details, scans))
+    return results
+
+def main():
+    conn, explain = open_database(os.getenv("DB_TYPE", "sqlite"))
+    try:
+        results = check_plans(conn, explain)
+    finally:
+        conn.close()
+
+    failures = 0
+    for name, details, scans in results:
+        print(f"{name}: {'FULL SCAN' if scans else 'ok'}")
+        for detail in details:
+            print(f"    {detail}")
+        failures += bool(scans)
+    print(f"{len(QUERIES) - failures}/{len(QUERIES)} queries use indexes")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
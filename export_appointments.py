@@ -0,0 +1,75 @@
+import argparse
+import os
+import sys
+from werkzeug.datastructures import MultiDict
+from app import app, appointment_filters, iter_appointment_export, export_chunks, export_cursor, EXPORT_FORMATS
+
+# Streams appointments with their names and risk scores as CSV or NDJSON, like
+# /export/appointments. With --state-file a nightly run picks up where the last one
+# stopped: the file holds the since cursor, rewritten once the export has finished.
+#
+#     python export_appointments.py --format ndjson --state-file export.cursor -o appointments.ndjson
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export appointments and risk scores")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('-o', '--output', help="file to write (default: stdout)")
+    parser.add_argument('--since', help="cursor <updated_at>:<id> of the last row already exported")
+    parser.add_argument('--state-file', help="read the since cursor from this file and store the new one in it")
+    parser.add_argument('--hospital-id', type=int)
+    parser.add_argument('--doctor-id', type=int)
+    parser.add_argument('--status')
+    parser.add_argument('--date-from', help="YYYY-MM-DD")
+    parser.add_argument('--date-to', help="YYYY-MM-DD")
+    parser.add_argument('--min-risk', type=float, help="minimum no_show_prob (percent)")
+    return parser.parse_args(argv)
+
+def read_cursor(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return f.read().strip() or None
+    return None
+
+def write_cursor(path, cursor):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(cursor + "\n")
+    os.replace(tmp_path, path)
+
+def main(argv=None):
+    args = parse_args(argv)
+    filter_args = MultiDict({
+        name: value for name, value in (
+            ('hospital_id', args.hospital_id), ('doctor_id', args.doctor_id), ('status', args.status),
+            ('date_from', args.date_from), ('date_to', args.date_to), ('min_risk', args.min_risk)
+        ) if value is not None
+    })
+    _, conditions, params, invalid = appointment_filters(filter_args)
+    if invalid:
+        print(f"Invalid date {invalid[0]!r}", file=sys.stderr)
+        return 2
+    since = args.since or read_cursor(args.state_file)
+
+    # Count rows and remember the cursor of the last one as they stream past
+    last = {'rows': 0, 'cursor': since}
+    def tracked(rows):
+        for row in rows:
+            last['rows'] += 1
+            last['cursor'] = export_cursor(row)
+            yield row
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        with app.app_context():
+            for chunk in export_chunks(tracked(iter_appointment_export(conditions, params, since)), args.format):
+                out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.state_file and last['cursor']:
+        write_cursor(args.state_file, last['cursor'])
+    print(f"Exported {last['rows']} appointments through cursor {last['cursor'] or 'start'}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
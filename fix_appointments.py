@@ -1,57 +1,80 @@
-from app import query_db, app
-from model.no_show_model import predict_no_show, predict_reschedule
-from datetime import datetime
-import pandas as pd
+from app import query_db, app, AppointmentBatch, PATIENT_STATS_COLUMNS, get_patient_history, reference_data, booked_slot
+from model.no_show_model import score_appointments
+from appointment_time import today_day, is_weekend, is_morning
 
 def recalculate_probabilities():
     with app.app_context():
         # Find appointments with NULL probabilities
-        null_appts = query_db("SELECT id, patient_id, hospital_id, doctor_id, date, slot_time FROM appointments WHERE no_show_prob IS NULL OR reschedule_prob IS NULL")
+        null_appts = query_db(f"""
+            SELECT a.id, a.patient_id, a.hospital_id, a.doctor_id, a.appointment_day, a.slot_minute, a.no_show_prob, a.status, {PATIENT_STATS_COLUMNS}
+            FROM appointments a LEFT JOIN patient_stats ps ON ps.patient_id = a.patient_id
+            WHERE a.no_show_prob IS NULL OR a.reschedule_prob IS NULL
+        """)
         
+        # Build every feature row first, then score them all in one batch
+        to_update = []
+        features_matrix = []
         for appt in null_appts:
             appt_id = appt['id']
             patient_id = appt['patient_id']
             hospital_id = appt['hospital_id']
-            date = appt['date']
+            day = appt['appointment_day']
+            if day is None or appt['slot_minute'] is None:
+                print(f"Skipping appointment {appt_id}: Missing date or slot time")
+                continue
             
             # Fetch hospital location
-            hospital = query_db("SELECT location FROM hospitals WHERE id = ?", (hospital_id,), one=True)
+            hospital = reference_data.hospital(hospital_id)
             if not hospital:
                 print(f"Skipping appointment {appt_id}: Invalid hospital_id")
                 continue
             hospital_location = hospital['location']
             
             # Calculate features
-            past_appointments = query_db("SELECT status FROM appointments WHERE patient_id = ? AND date < ?", (patient_id, date))
-            previous_no_shows = sum(1 for appt in past_appointments if appt['status'] == 'no_show')
+            previous_no_shows = get_patient_history(patient_id, as_of=day, stats=appt)['no_show_count']
             
-            appointment_date = pd.to_datetime(date)
-            current_date = pd.to_datetime(datetime.now().date())
-            lead_time = (appointment_date - current_date).days
+            lead_time = day - today_day()
             distance_5km = 0 if 'Lagos' in hospital_location else 1
-            time_of_day_morning = 1 if 'AM' in appt['slot_time'].upper() else 0
-            is_weekday = appointment_date.day_name() in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-            is_weekday_weekend = 0 if is_weekday else 1
+            time_of_day_morning = 1 if is_morning(appt['slot_minute']) else 0
+            is_weekday_weekend = 1 if is_weekend(day) else 0
             
             features = [previous_no_shows, lead_time, distance_5km, time_of_day_morning, is_weekday_weekend]
-            
-            try:
-                no_show_prob = predict_no_show(features)
-                reschedule_prob = predict_reschedule(features)
-                
-                if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
-                    print(f"Invalid probabilities for appointment {appt_id}: no_show_prob={no_show_prob}, reschedule_prob={reschedule_prob}")
-                    continue
-                
-                # Update appointment
-                query_db(
-                    "UPDATE appointments SET no_show_prob = ?, reschedule_prob = ? WHERE id = ?",
-                    (no_show_prob, reschedule_prob, appt_id),
-                    commit=True
-                )
-                print(f"Updated appointment {appt_id} with no_show_prob={no_show_prob}, reschedule_prob={reschedule_prob}")
-            except Exception as e:
-                print(f"Error updating appointment {appt_id}: {e}")
+            to_update.append(appt)
+            features_matrix.append(features)
+        
+        if not features_matrix:
+            return
+        
+        try:
+            no_show_probs, reschedule_probs = score_appointments(features_matrix)
+        except Exception as e:
+            print(f"Error predicting probabilities: {e}")
+            return
+        
+        # Queue every update and write them in chunked transactions. The new no_show_prob
+        # also moves the slot's summed no-show in this process's slot_occupancy; a running
+        # server picks the new values up as its cached days expire (OCCUPANCY_TTL).
+        batch = AppointmentBatch()
+        for appt, no_show_prob, reschedule_prob in zip(to_update, no_show_probs, reschedule_probs):
+            appt_id = appt['id']
+            no_show_prob = float(no_show_prob)
+            reschedule_prob = float(reschedule_prob)
+            if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
+                print(f"Invalid probabilities for appointment {appt_id}: no_show_prob={no_show_prob}, reschedule_prob={reschedule_prob}")
+                continue
+            slot = None
+            if appt['doctor_id'] is not None:
+                day, slot_minute, status = appt['appointment_day'], appt['slot_minute'], appt['status']
+                slot = (appt['doctor_id'],
+                        booked_slot(day, slot_minute, appt['no_show_prob'], status),
+                        booked_slot(day, slot_minute, no_show_prob, status))
+            batch.update(appt_id, slot=slot, no_show_prob=no_show_prob, reschedule_prob=reschedule_prob)
+        
+        try:
+            updated = batch.flush()
+            print(f"Updated probabilities for {updated} appointments")
+        except Exception as e:
+            print(f"Error updating appointments: {e}")
 
 if __name__ == "__main__":
     recalculate_probabilities()
\ No newline at end of file
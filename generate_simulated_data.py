@@ -1,11 +1,14 @@
 import sqlite3
 import pandas as pd
 from datetime import datetime, timedelta
+from appointment_time import to_day
+from migrations import apply_migrations, rebuild_patient_stats
 import random
 import numpy as np
 
 # Connect to the database
 conn = sqlite3.connect("database.db")
+apply_migrations(conn)
 c = conn.cursor()
 
 # Clear existing appointments to start fresh
@@ -52,20 +55,22 @@ while len(appointments) < target_appointments:
     
     # Appointment date (between Jan 2024 and May 2025)
     days_offset = random.randint(0, (current_date - start_date).days)
-    date = (start_date + timedelta(days=days_offset)).strftime('%Y-%m-%d')
+    appointment_day = to_day(start_date + timedelta(days=days_offset))
     
-    # Slot time (between 8 AM and 5 PM)
+    # Slot time (between 8 AM and 5 PM), in minutes after midnight
     hour = random.randint(8, 17)
-    slot_time = f"{hour}:00 {'AM' if hour < 12 else 'PM'}"
+    slot_minute = hour * 60
     
     # Simulate status based on realistic no-show rates (42% as per your study)
     status = random.choices(['scheduled', 'attended', 'closed'], weights=[42, 50, 8])[0]
     
-    appointments.append((patient_id, hospital_id, department_id, doctor_id, slot_time, date, 0.0, status))
+    appointments.append((patient_id, hospital_id, department_id, doctor_id, slot_minute, appointment_day, 0.0, status))
 
 # Insert into database
-c.executemany("INSERT INTO appointments (patient_id, hospital_id, department_id, doctor_id, slot_time, date, no_show_prob, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", appointments)
+c.executemany("INSERT INTO appointments (patient_id, hospital_id, department_id, doctor_id, slot_minute, appointment_day, no_show_prob, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", appointments)
 conn.commit()
+# Written behind the app's back, so its per-patient totals are recounted
+rebuild_patient_stats(conn)
 conn.close()
 
 print(f"Generated {len(appointments)} simulated appointments with {len(patients)} patients.")
\ No newline at end of file
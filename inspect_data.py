@@ -7,7 +7,7 @@ c = conn.cursor()
 
 # Query appointments data
 query = """
-SELECT patient_id, hospital_id, department_id, doctor_id, slot_time, date, no_show_prob, status
+SELECT patient_id, hospital_id, department_id, doctor_id, slot_minute, appointment_day, no_show_prob, status
 FROM appointments
 """
 appointments = pd.read_sql_query(query, conn)
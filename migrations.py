@@ -0,0 +1,178 @@
+import logging
+import sqlite3
+from datetime import datetime
+from appointment_time import to_day, to_slot_minute
+
+logger = logging.getLogger(__name__)
+
+# Fill appointment_day/slot_minute from the legacy text columns. Values neither parser
+# understands are left NULL and logged rather than failing the upgrade.
+def _backfill_day_and_slot(c, placeholder):
+    c.execute("SELECT id, date, slot_time FROM appointments")
+    updates = []
+    unparsed = 0
+    for appt_id, date_text, slot_text in c.fetchall():
+        try:
+            day = to_day(date_text) if date_text is not None else None
+        except ValueError:
+            day, unparsed = None, unparsed + 1
+        try:
+            minute = to_slot_minute(slot_text) if slot_text is not None else None
+        except ValueError:
+            minute, unparsed = None, unparsed + 1
+        updates.append((day, minute, appt_id))
+    c.executemany(
+        f"UPDATE appointments SET appointment_day = {placeholder}, slot_minute = {placeholder} WHERE id = {placeholder}",
+        updates
+    )
+    if unparsed:
+        logger.warning(f"{unparsed} appointment dates/slot times could not be parsed and were left empty")
+
+# Recount patient_stats from appointments. Migration 5 runs it once; run it again with
+# `python migrations.py --rebuild-patient-stats` after appointments are written outside
+# the app (generate_simulated_data.py, manual fixes).
+PATIENT_STATS_REBUILD = [
+    "DELETE FROM patient_stats",
+    """INSERT INTO patient_stats (patient_id, total_appointments, no_show_count, scheduled_count, last_appointment_day)
+       SELECT patient_id, COUNT(*),
+              SUM(CASE WHEN status = 'no_show' THEN 1 ELSE 0 END),
+              SUM(CASE WHEN status = 'scheduled' THEN 1 ELSE 0 END),
+              MAX(appointment_day)
+       FROM appointments WHERE patient_id IS NOT NULL GROUP BY patient_id""",
+]
+
+# Schema migrations, applied in version order by init_db() on both SQLite and PostgreSQL.
+# Each entry is (version, description, statements); add new versions at the end and
+# never edit one that has shipped. Statements must be valid on both databases; a
+# callable statement is called with (cursor, placeholder) for data backfills.
+MIGRATIONS = [
+    (1, "Indexes for slot lookups, patient history, the no-show sweep and high-risk scans", [
+        # find_available_slot, check_slot, get_available_slots and the reschedule conflict
+        # checks filter on (doctor_id, date[, slot_time]) and read patient_id/no_show_prob
+        """CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date_slot
+           ON appointments (doctor_id, date, slot_time, status, patient_id, no_show_prob)""",
+        # Patient history fallback scans and the patient dashboard
+        """CREATE INDEX IF NOT EXISTS idx_appointments_patient_date
+           ON appointments (patient_id, date, status)""",
+        # Daily no-show sweep (date = yesterday) and the retraining checkpoint (date < today)
+        """CREATE INDEX IF NOT EXISTS idx_appointments_date_status
+           ON appointments (date, status)""",
+        # auto_reschedule_all: status = 'scheduled' AND no_show_prob > 50
+        """CREATE INDEX IF NOT EXISTS idx_appointments_status_no_show_prob
+           ON appointments (status, no_show_prob)""",
+        "ANALYZE",
+    ]),
+    (2, "Store appointment dates as day numbers and slot times as minutes of the day", [
+        "ALTER TABLE appointments ADD COLUMN appointment_day INTEGER",
+        "ALTER TABLE appointments ADD COLUMN slot_minute INTEGER",
+        _backfill_day_and_slot,
+        # SQLite refuses to drop indexed columns
+        "DROP INDEX IF EXISTS idx_appointments_doctor_date_slot",
+        "DROP INDEX IF EXISTS idx_appointments_patient_date",
+        "DROP INDEX IF EXISTS idx_appointments_date_status",
+        "ALTER TABLE appointments DROP COLUMN date",
+        "ALTER TABLE appointments DROP COLUMN slot_time",
+        """CREATE INDEX IF NOT EXISTS idx_appointments_doctor_day_slot
+           ON appointments (doctor_id, appointment_day, slot_minute, status, patient_id, no_show_prob)""",
+        """CREATE INDEX IF NOT EXISTS idx_appointments_patient_day
+           ON appointments (patient_id, appointment_day, status)""",
+        """CREATE INDEX IF NOT EXISTS idx_appointments_day_status
+           ON appointments (appointment_day, status)""",
+        # Derived table; migration 5 recreates it with last_appointment_day
+        "DROP TABLE IF EXISTS patient_stats",
+        "ANALYZE",
+    ]),
+    (3, "Indexes for the admin dashboard's keyset pages and filters", [
+        # Pages are ordered by (appointment_day, id) or (status, id); id is spelled out
+        # because PostgreSQL does not append the row id to an index the way SQLite does
+        "CREATE INDEX IF NOT EXISTS idx_appointments_day_id ON appointments (appointment_day, id)",
+        "CREATE INDEX IF NOT EXISTS idx_appointments_status_id ON appointments (status, id)",
+        # The same date order behind the hospital and status filters
+        "CREATE INDEX IF NOT EXISTS idx_appointments_hospital_day_id ON appointments (hospital_id, appointment_day, id)",
+        "CREATE INDEX IF NOT EXISTS idx_appointments_status_day_id ON appointments (status, appointment_day, id)",
+        "ANALYZE",
+    ]),
+    (4, "Track when each appointment last changed for incremental exports", [
+        # Unix seconds, set by every appointment write in app.py; rows that predate the
+        # column read as 0, so the first incremental export includes them
+        "ALTER TABLE appointments ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_appointments_updated_id ON appointments (updated_at, id)",
+        "ANALYZE",
+    ]),
+    (5, "Per-patient appointment totals for history lookups", [
+        # Kept in step with every appointment write in app.py, so history lookups are a
+        # primary-key read. last_appointment_day is an upper bound: moving an appointment
+        # earlier leaves it where it was, which only sends more reads to the scan.
+        """CREATE TABLE IF NOT EXISTS patient_stats
+           (patient_id INTEGER PRIMARY KEY, total_appointments INTEGER NOT NULL DEFAULT 0,
+            no_show_count INTEGER NOT NULL DEFAULT 0, scheduled_count INTEGER NOT NULL DEFAULT 0,
+            last_appointment_day INTEGER,
+            FOREIGN KEY (patient_id) REFERENCES users(id))""",
+        *PATIENT_STATS_REBUILD,
+    ]),
+]
+
+# Apply every migration newer than the recorded schema version, one commit per version
+def apply_migrations(conn, db_type="sqlite"):
+    placeholder = "%s" if db_type == "postgresql" else "?"
+    c = conn.cursor()
+    c.execute("""CREATE TABLE IF NOT EXISTS schema_migrations
+                 (version INTEGER PRIMARY KEY, description TEXT, applied_at TEXT)""")
+    conn.commit()
+    c.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in c.fetchall()}
+
+    newly_applied = []
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            if db_type == "sqlite":
+                # Python's sqlite3 runs DDL outside a transaction unless one is open; open it
+                # so a failed step rolls the whole version back
+                c.execute("BEGIN")
+            for statement in statements:
+                if callable(statement):
+                    statement(c, placeholder)
+                else:
+                    c.execute(statement)
+            c.execute(
+                f"INSERT INTO schema_migrations (version, description, applied_at) VALUES ({placeholder}, {placeholder}, {placeholder})",
+                (version, description, datetime.now().isoformat())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        newly_applied.append(version)
+    return newly_applied
+
+# Recount patient_stats in one transaction
+def rebuild_patient_stats(conn):
+    c = conn.cursor()
+    try:
+        for statement in PATIENT_STATS_REBUILD:
+            c.execute(statement)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def schema_version(conn):
+    c = conn.cursor()
+    c.execute("SELECT MAX(version) FROM schema_migrations")
+    return c.fetchone()[0] or 0
+
+if __name__ == '__main__':
+    import sys
+    # `python migrations.py` brings database.db up to date without starting the app;
+    # --rebuild-patient-stats also recounts patient_stats from the appointments
+    conn = sqlite3.connect("database.db")
+    try:
+        applied = apply_migrations(conn)
+        print(f"Applied migrations: {applied or 'none'}; schema version {schema_version(conn)}")
+        if '--rebuild-patient-stats' in sys.argv[1:]:
+            rebuild_patient_stats(conn)
+            print("Rebuilt patient_stats")
+    finally:
+        conn.close()
@@ -1,40 +1,661 @@
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from xgboost import XGBClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import roc_auc_score, classification_report
-from imblearn.over_sampling import SMOTE
 import sqlite3
 import joblib
-from datetime import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import multiprocessing
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 
-# Extract data from the database
-def load_data_from_db():
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
+# sklearn, xgboost and imblearn are only imported inside the training functions: web
+# workers serve from the compiled arrays and never pay for those imports.
 
-    # Query appointments and related data
-    query = """
-    SELECT a.id, a.patient_id, a.hospital_id, a.department_id, a.doctor_id, a.slot_time, a.date, a.status,
+logger = logging.getLogger(__name__)
+
+# Model artifacts, relative to the repo root like the rest of the app
+MODEL_DIR = os.getenv("MODEL_DIR", "model")
+MODEL_FILES = {
+    'rf_no_show': 'rf_no_show_model.pkl',
+    'xgb_no_show': 'xgb_no_show_model.pkl',
+    'rf_reschedule': 'rf_reschedule_model.pkl',
+    'xgb_reschedule': 'xgb_reschedule_model.pkl',
+}
+# Each target is scored by its rf_/xgb_ pair, which loads and serves on its own
+TARGETS = ['no_show', 'reschedule']
+COMPILED_MODELS_FILE = 'compiled_models.npz'
+PROBABILITY_TABLE_FILE = 'probability_table.npz'
+# 'auto' serves the compiled arrays and probability table when they match the pickles,
+# 'pickle' always unpickles and scores with the original models
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "auto")
+# Column order of the encoded feature matrix the models were trained on
+FEATURE_COLS = ['previous_no_shows', 'lead_time', 'distance_>5km', 'time_of_day_morning', 'is_weekday_weekend']
+# Probability table bounds: previous_no_shows 0..cap, lead_time 0..365 days
+PROBABILITY_TABLE_MAX_NO_SHOWS = int(os.getenv("PROBABILITY_TABLE_MAX_NO_SHOWS", "20"))
+PROBABILITY_TABLE_MAX_LEAD_TIME = 365
+# Streaming training: rows read per chunk and rows kept for the random forest / evaluation
+TRAIN_CHUNK_SIZE = int(os.getenv("TRAIN_CHUNK_SIZE", "50000"))
+TRAIN_SAMPLE_SIZE = int(os.getenv("TRAIN_SAMPLE_SIZE", "200000"))
+# Cores training may use in total across all concurrent model fits (0 = all cores)
+TRAIN_CPU_BUDGET = int(os.getenv("TRAIN_CPU_BUDGET", "0")) or os.cpu_count() or 1
+# Incremental retraining: checkpoint of the last outcome the models have seen, rows
+# needed before an update runs, and how much each update adds to the ensembles
+RETRAIN_CHECKPOINT_FILE = 'retrain_checkpoint.json'
+RETRAIN_MIN_ROWS = int(os.getenv("RETRAIN_MIN_ROWS", "50"))
+RETRAIN_XGB_ROUNDS = int(os.getenv("RETRAIN_XGB_ROUNDS", "10"))
+RETRAIN_MAX_XGB_ROUNDS = int(os.getenv("RETRAIN_MAX_XGB_ROUNDS", "500"))
+RETRAIN_RF_TREES = int(os.getenv("RETRAIN_RF_TREES", "10"))
+RETRAIN_MAX_RF_TREES = int(os.getenv("RETRAIN_MAX_RF_TREES", "300"))
+# How often (seconds) the registry stats the .pkl files looking for a retrain
+MODEL_RELOAD_CHECK_INTERVAL = float(os.getenv("MODEL_RELOAD_CHECK_INTERVAL", "5"))
+# Training data comes from the same database as the app (DB_TYPE and DB_* settings)
+DB_TYPE = os.getenv("DB_TYPE", "sqlite")
+
+# Flattened tree ensemble evaluated with NumPy only.
+# All trees share one set of node arrays; roots holds each tree's root node. A node
+# goes left when x[feature] <= threshold. Leaves point at themselves, so walking
+# max_depth steps from the roots always ends on a leaf. Thresholds and inputs are
+# float32, matching how sklearn and xgboost compare features.
+class CompiledTreeEnsemble:
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, aggregation, base_margin=0.0):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        # 'mean' averages per-tree probabilities (random forest),
+        # 'logistic' sums leaf margins and applies a sigmoid (xgboost binary:logistic)
+        self.aggregation = aggregation
+        self.base_margin = float(base_margin)
+        # Evaluation layout: children[2 * node + went_right], native-width indices
+        self._children = np.column_stack([left, right]).astype(np.intp).ravel()
+        self._feature = feature.astype(np.intp)
+        self._roots = roots.astype(np.intp)
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32).reshape(-1, len(FEATURE_COLS))
+        flat_X = X.ravel()
+        row_offsets = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, None]
+        node = np.tile(self._roots, (len(X), 1))
+        for _ in range(self.max_depth):
+            went_right = flat_X[row_offsets + self._feature[node]] > self.threshold[node]
+            node = self._children[2 * node + went_right]
+        leaf_values = self.value[node]
+        if self.aggregation == 'logistic':
+            prob = 1.0 / (1.0 + np.exp(-(self.base_margin + leaf_values.sum(axis=1))))
+        else:
+            prob = leaf_values.mean(axis=1)
+        return np.column_stack([1.0 - prob, prob])
+
+    def to_arrays(self, prefix):
+        return {
+            f'{prefix}/feature': self.feature,
+            f'{prefix}/threshold': self.threshold,
+            f'{prefix}/left': self.left,
+            f'{prefix}/right': self.right,
+            f'{prefix}/value': self.value,
+            f'{prefix}/roots': self.roots,
+            f'{prefix}/meta': np.array([self.max_depth, self.base_margin]),
+            f'{prefix}/aggregation': np.array(self.aggregation),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        max_depth, base_margin = arrays[f'{prefix}/meta']
+        return cls(
+            feature=arrays[f'{prefix}/feature'],
+            threshold=arrays[f'{prefix}/threshold'],
+            left=arrays[f'{prefix}/left'],
+            right=arrays[f'{prefix}/right'],
+            value=arrays[f'{prefix}/value'],
+            roots=arrays[f'{prefix}/roots'],
+            max_depth=max_depth,
+            aggregation=str(arrays[f'{prefix}/aggregation']),
+            base_margin=base_margin
+        )
+
+# Largest float32 t with x <= t exactly when x <= threshold (float64), for float32 x
+def _float32_floor(threshold):
+    t32 = np.asarray(threshold, dtype=np.float32)
+    too_high = t32.astype(np.float64) > threshold
+    return np.where(too_high, np.nextafter(t32, np.float32(-np.inf)), t32).astype(np.float32)
+
+# Stitch per-tree node arrays into one ensemble, offsetting child pointers
+def _stack_trees(trees, aggregation, base_margin=0.0):
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for feature, threshold, left, right, value, depth in trees:
+        node_ids = np.arange(len(left))
+        is_leaf = left < 0
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, feature))
+        thresholds.append(np.where(is_leaf, 0, threshold).astype(np.float32))
+        lefts.append(np.where(is_leaf, node_ids, left) + offset)
+        rights.append(np.where(is_leaf, node_ids, right) + offset)
+        values.append(np.where(is_leaf, value, 0.0))
+        offset += len(left)
+        max_depth = max(max_depth, depth)
+    return CompiledTreeEnsemble(
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        value=np.concatenate(values).astype(np.float64),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max_depth,
+        aggregation=aggregation,
+        base_margin=base_margin
+    )
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=np.int64)
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+def compile_random_forest(rf):
+    positive = list(rf.classes_).index(1)
+    trees = []
+    for estimator in rf.estimators_:
+        tree = estimator.tree_
+        counts = tree.value[:, 0, :]
+        leaf_prob = counts[:, positive] / counts.sum(axis=1)
+        trees.append((tree.feature, _float32_floor(tree.threshold), tree.children_left, tree.children_right,
+                      leaf_prob, int(tree.max_depth)))
+    return _stack_trees(trees, 'mean')
+
+def compile_xgboost(xgb):
+    learner = json.loads(xgb.get_booster().save_raw('json'))['learner']
+    if learner['objective']['name'] != 'binary:logistic' or learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Cannot compile xgboost model with objective {learner['objective']['name']}")
+    base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+    trees = []
+    for tree in learner['gradient_booster']['model']['trees']:
+        left = np.array(tree['left_children'], dtype=np.int64)
+        right = np.array(tree['right_children'], dtype=np.int64)
+        conditions = np.array(tree['split_conditions'], dtype=np.float32)
+        # xgboost goes left when x < condition; for float32 x that is x <= the next float32 down
+        thresholds = np.nextafter(conditions, np.float32(-np.inf))
+        # Leaf weights are stored in split_conditions
+        trees.append((np.array(tree['split_indices'], dtype=np.int64), thresholds, left, right,
+                      conditions.astype(np.float64), _tree_depth(left, right)))
+    return _stack_trees(trees, 'logistic', base_margin=np.log(base_score / (1.0 - base_score)))
+
+# Compile all four models into the flattened format
+def compile_models(models):
+    return {
+        name: compile_random_forest(model) if name.startswith('rf_') else compile_xgboost(model)
+        for name, model in models.items()
+    }
+
+# Feature rows used to check compiled models against the originals
+def _parity_grid():
+    grid = np.array(np.meshgrid(np.arange(0, 11), np.arange(0, 366), [0, 1], [0, 1], [0, 1], indexing='ij'))
+    return grid.reshape(len(FEATURE_COLS), -1).T.astype(np.float64)
+
+# Parity test: compiled predictions must match predict_proba of the original models
+def check_compiled_parity(models, compiled, X=None, tolerance=1e-6):
+    X = _parity_grid() if X is None else _as_feature_matrix(X)
+    max_diffs = {}
+    for name, model in models.items():
+        reference = _reference_proba(model, X)
+        diff = float(np.max(np.abs(compiled[name].predict_proba(X)[:, 1] - reference)))
+        if diff > tolerance:
+            raise ValueError(f"Compiled {name} differs from the original model by {diff:.2e}")
+        max_diffs[name] = diff
+    return max_diffs
+
+def _models_version(payloads):
+    digest = hashlib.sha1()
+    for name in sorted(payloads):
+        digest.update(payloads[name])
+    return digest.hexdigest()[:12]
+
+def _read_model_payloads(model_dir, names=MODEL_FILES):
+    payloads = {}
+    for name in names:
+        with open(os.path.join(model_dir, MODEL_FILES[name]), 'rb') as f:
+            payloads[name] = f.read()
+    return payloads
+
+# The pickles of every target whose pair is on disk, and {target: error} for the others
+def _read_target_payloads(model_dir):
+    payloads, unavailable = {}, {}
+    for target in TARGETS:
+        try:
+            payloads.update(_read_model_payloads(model_dir, [f'rf_{target}', f'xgb_{target}']))
+        except FileNotFoundError as e:
+            unavailable[target] = str(e)
+    return payloads, unavailable
+
+def _save_arrays(path, arrays):
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+# Export step: compile the models, verify parity and write compiled_models.npz tagged
+# with the version of the pickles it was built from
+def export_compiled_models(models=None, model_dir=MODEL_DIR):
+    payloads = _read_model_payloads(model_dir)
+    if models is None:
+        models = {name: joblib.load(io.BytesIO(payload)) for name, payload in payloads.items()}
+    compiled = compile_models(models)
+    max_diffs = check_compiled_parity(models, compiled)
+
+    arrays = {'source_version': np.array(_models_version(payloads))}
+    for name, ensemble in compiled.items():
+        arrays.update(ensemble.to_arrays(name))
+    path = os.path.join(model_dir, COMPILED_MODELS_FILE)
+    _save_arrays(path, arrays)
+    print(f"Compiled models written to {path} (max parity diff {max(max_diffs.values()):.2e})")
+    return compiled
+
+# Dense table of pre-scored probabilities over the whole discrete feature space:
+# values[target, previous_no_shows, lead_time, distance_>5km, time_of_day_morning,
+# is_weekday_weekend], target 0 = no-show, 1 = reschedule, in percent.
+class ProbabilityTable:
+    def __init__(self, values, saturates):
+        self.values = values
+        self.max_no_shows = values.shape[1] - 1
+        self.max_lead_time = values.shape[2] - 1
+        # True when no tree splits on previous_no_shows above the cap, so larger
+        # counts score exactly like the cap and can be clamped instead of falling back
+        self.saturates = bool(saturates)
+
+    # Rows the table can answer: whole numbers inside the table bounds
+    def covers(self, X):
+        no_shows = np.minimum(X[:, 0], self.max_no_shows) if self.saturates else X[:, 0]
+        return (
+            np.all(X == np.floor(X), axis=1)
+            & (no_shows >= 0) & (no_shows <= self.max_no_shows)
+            & (X[:, 1] >= 0) & (X[:, 1] <= self.max_lead_time)
+            & np.all((X[:, 2:] == 0) | (X[:, 2:] == 1), axis=1)
+        )
+
+    # Look up rows that covers() accepted; returns (no_show_probs, reschedule_probs)
+    def lookup(self, X):
+        idx = X.astype(np.intp)
+        np.minimum(idx[:, 0], self.max_no_shows, out=idx[:, 0])
+        probs = self.values[:, idx[:, 0], idx[:, 1], idx[:, 2], idx[:, 3], idx[:, 4]]
+        return probs[0], probs[1]
+
+def _reference_proba(model, X):
+    if 'feature_names_in_' in vars(model):
+        X = pd.DataFrame(X, columns=FEATURE_COLS)
+    return model.predict_proba(X)[:, 1]
+
+# Export step: pre-score every reachable feature combination and write
+# probability_table.npz tagged with the version of the pickles it was built from
+def export_probability_table(models=None, model_dir=MODEL_DIR, max_no_shows=PROBABILITY_TABLE_MAX_NO_SHOWS):
+    payloads = _read_model_payloads(model_dir)
+    if models is None:
+        models = {name: joblib.load(io.BytesIO(payload)) for name, payload in payloads.items()}
+
+    shape = (max_no_shows + 1, PROBABILITY_TABLE_MAX_LEAD_TIME + 1, 2, 2, 2)
+    grid = np.indices(shape).reshape(len(shape), -1).T.astype(np.float64)
+    values = np.empty((2,) + shape)
+    for i, target in enumerate(TARGETS):
+        ensemble_probs = (_reference_proba(models[f'rf_{target}'], grid) + _reference_proba(models[f'xgb_{target}'], grid)) / 2
+        values[i] = (ensemble_probs * 100).reshape(shape)
+
+    # Highest previous_no_shows split in any tree; counts above it all score the same
+    split_max = -np.inf
+    for ensemble in compile_models(models).values():
+        internal = ensemble.left != np.arange(len(ensemble.left))
+        thresholds = ensemble.threshold[internal & (ensemble.feature == 0)]
+        if len(thresholds):
+            split_max = max(split_max, float(thresholds.max()))
+    saturates = max_no_shows > split_max
+
+    path = os.path.join(model_dir, PROBABILITY_TABLE_FILE)
+    _save_arrays(path, {
+        'source_version': np.array(_models_version(payloads)),
+        'values': values,
+        'saturates': np.array(saturates),
+    })
+    print(f"Probability table written to {path} ({values[0].size} combinations, previous_no_shows capped at {max_no_shows})")
+    return ProbabilityTable(values, saturates)
+
+def _load_probability_table(path, version):
+    with np.load(path, allow_pickle=False) as arrays:
+        if str(arrays['source_version']) != version:
+            return None
+        return ProbabilityTable(arrays['values'], arrays['saturates'])
+
+def _load_compiled_models(path, version):
+    with np.load(path, allow_pickle=False) as arrays:
+        if str(arrays['source_version']) != version:
+            return None
+        return {name: CompiledTreeEnsemble.from_arrays(arrays, name) for name in MODEL_FILES}
+
+ModelSnapshot = namedtuple('ModelSnapshot', ['models', 'table', 'unavailable', 'fingerprint', 'version', 'backend', 'loaded_at', 'load_seconds'])
+
+# Process-wide registry that keeps the RF/XGB ensembles resident in memory.
+# Readers grab the current snapshot reference, so a reload swaps all four
+# models at once and an in-flight prediction never mixes old and new models.
+# A target whose pickles are missing is left out of the snapshot (listed in
+# unavailable) and the other target keeps serving; the compiled arrays and the
+# probability table cover both targets, so they are only used when all four load.
+class ModelRegistry:
+    def __init__(self, model_dir=MODEL_DIR, check_interval=MODEL_RELOAD_CHECK_INTERVAL, backend=MODEL_BACKEND):
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        self.backend = backend
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self.reload_count = 0
+
+    def _paths(self):
+        return {name: os.path.join(self.model_dir, filename) for name, filename in MODEL_FILES.items()}
+
+    def _compiled_path(self):
+        return os.path.join(self.model_dir, COMPILED_MODELS_FILE)
+
+    def _table_path(self):
+        return os.path.join(self.model_dir, PROBABILITY_TABLE_FILE)
+
+    def _fingerprint(self):
+        fingerprint = []
+        for name, path in sorted(self._paths().items()):
+            if not os.path.exists(path):
+                fingerprint.append((name, None, None))
+                continue
+            st = os.stat(path)
+            fingerprint.append((name, st.st_mtime_ns, st.st_size))
+        if self.backend == 'auto':
+            for name, path in [('compiled', self._compiled_path()), ('table', self._table_path())]:
+                if os.path.exists(path):
+                    st = os.stat(path)
+                    fingerprint.append((name, st.st_mtime_ns, st.st_size))
+        return tuple(fingerprint)
+
+    def _load(self, fingerprint, current=None):
+        start = time.perf_counter()
+        payloads, unavailable = _read_target_payloads(self.model_dir)
+        if not payloads:
+            raise FileNotFoundError(f"No model files in {self.model_dir}: {'; '.join(unavailable.values())}")
+        if current is not None and set(unavailable) - set(current.unavailable):
+            raise FileNotFoundError(f"Models for {', '.join(sorted(set(unavailable) - set(current.unavailable)))} went missing")
+        for target, error in unavailable.items():
+            logger.error(f"Cannot load {target} models, {target} scoring is unavailable: {error}")
+        version = _models_version(payloads)
+
+        models = None
+        backend = 'compiled'
+        if self.backend == 'auto' and not unavailable and os.path.exists(self._compiled_path()):
+            models = _load_compiled_models(self._compiled_path(), version)
+            if models is None and current is not None:
+                # publish_models() swaps the pickles before re-exporting; keep serving
+                # the current models until the compiled arrays catch up
+                raise ValueError(f"{COMPILED_MODELS_FILE} is stale for models version {version}, waiting for export")
+            if models is None:
+                logger.warning(f"{COMPILED_MODELS_FILE} is stale for models version {version}, unpickling instead")
+        if models is None:
+            backend = 'pickle'
+            models = {}
+            for name, payload in payloads.items():
+                model = joblib.load(io.BytesIO(payload))
+                # Serving passes plain ndarrays in FEATURE_COLS order; drop the fitted
+                # column names so sklearn does not warn on every call
+                if 'feature_names_in_' in vars(model):
+                    if list(model.feature_names_in_) != FEATURE_COLS:
+                        raise ValueError(f"{name} was trained on columns {list(model.feature_names_in_)}, expected {FEATURE_COLS}")
+                    del model.feature_names_in_
+                models[name] = model
+
+        table = None
+        if self.backend == 'auto' and not unavailable and os.path.exists(self._table_path()):
+            table = _load_probability_table(self._table_path(), version)
+            if table is None:
+                logger.warning(f"{PROBABILITY_TABLE_FILE} is stale for models version {version}, scoring live")
+        return ModelSnapshot(
+            models=models,
+            table=table,
+            unavailable=unavailable,
+            fingerprint=fingerprint,
+            version=version,
+            backend=backend,
+            loaded_at=datetime.now(),
+            load_seconds=time.perf_counter() - start
+        )
+
+    # Reload the models if the files on disk changed (or unconditionally with force=True)
+    def reload(self, force=False):
+        with self._lock:
+            fingerprint = self._fingerprint()
+            current = self._snapshot
+            if current is not None and not force and current.fingerprint == fingerprint:
+                return current
+            try:
+                snapshot = self._load(fingerprint, current)
+            except Exception as e:
+                # A retrain may still be writing the files; keep serving the old models
+                if current is None:
+                    raise
+                logger.error(f"Model reload failed, keeping version {current.version}: {e}")
+                return current
+            self._snapshot = snapshot
+            self.reload_count += 1
+            logger.info(f"Loaded models version {snapshot.version} in {snapshot.load_seconds:.3f}s")
+            return snapshot
+
+    # Current snapshot; stats the files at most once per check_interval
+    def get(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is None or now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                snapshot = self.reload()
+            except FileNotFoundError:
+                if snapshot is None:
+                    raise
+                logger.warning("Model files missing on disk, keeping the loaded models")
+        return snapshot
+
+    def get_models(self, target):
+        snapshot = self.get()
+        if target in snapshot.unavailable:
+            raise FileNotFoundError(f"{target} models are unavailable: {snapshot.unavailable[target]}")
+        return snapshot.models[f'rf_{target}'], snapshot.models[f'xgb_{target}']
+
+    def stats(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'loaded': False, 'model_dir': self.model_dir}
+        return {
+            'loaded': True,
+            'model_dir': self.model_dir,
+            'version': snapshot.version,
+            'backend': snapshot.backend,
+            'probability_table': snapshot.table is not None,
+            'unavailable': snapshot.unavailable,
+            'load_seconds': round(snapshot.load_seconds, 4),
+            'last_reload': snapshot.loaded_at.isoformat(),
+            'reload_count': self.reload_count,
+            'files': {name: mtime_ns for name, mtime_ns, _ in snapshot.fingerprint},
+        }
+
+model_registry = ModelRegistry()
+
+def get_model_info():
+    return model_registry.stats()
+
+# Write a model so readers never see a half-written pickle
+def save_model(model, name):
+    path = os.path.join(MODEL_DIR, MODEL_FILES[name])
+    tmp_path = f"{path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+# appointments.appointment_day counts days since 1970-01-01 and slot_minute minutes after
+# midnight (see appointment_time.py, which this script cannot import when run directly)
+EPOCH = date(1970, 1, 1)
+NOON_MINUTE = 12 * 60
+
+def _day_number(value):
+    return (value - EPOCH).days
+
+def _day_iso(day):
+    return (EPOCH + timedelta(days=int(day))).isoformat()
+
+def _day_dates(days):
+    return pd.to_datetime(days, unit='D')
+
+# Last outcome folded into the models, as {'date': 'YYYY-MM-DD', 'id': ...}; None before the first training run
+def read_checkpoint():
+    path = os.path.join(MODEL_DIR, RETRAIN_CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def write_checkpoint(checkpoint):
+    path = os.path.join(MODEL_DIR, RETRAIN_CHECKPOINT_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(checkpoint, updated_at=datetime.now().isoformat()), f)
+    os.replace(tmp_path, path)
+
+def connect_db():
+    if DB_TYPE == "postgresql":
+        import psycopg2
+        return psycopg2.connect(
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT")
+        )
+    return sqlite3.connect("database.db")
+
+# Queries use SQLite's ? placeholders; the ones in this module hold no quoted ? or %,
+# so psycopg2 only needs each ? swapped for %s
+def _sql(query):
+    return query.replace('?', '%s') if DB_TYPE == "postgresql" else query
+
+# A query's rows as DataFrames of up to chunksize rows, always at least one (possibly
+# empty) frame. PostgreSQL reads through a named (server-side) cursor, so only one chunk
+# is ever held client-side instead of the whole result.
+def read_sql_chunks(query, params=(), chunksize=TRAIN_CHUNK_SIZE):
+    conn = connect_db()
+    try:
+        if DB_TYPE == "postgresql":
+            with conn.cursor(name='training_read') as c:
+                c.itersize = chunksize
+                c.execute(_sql(query), params)
+                first = True
+                while True:
+                    rows = c.fetchmany(chunksize)
+                    if rows or first:
+                        yield pd.DataFrame(rows, columns=[desc[0] for desc in c.description])
+                    if len(rows) < chunksize:
+                        break
+                    first = False
+        else:
+            yield from pd.read_sql_query(query, conn, params=params, chunksize=chunksize)
+    finally:
+        conn.close()
+
+def read_sql(query, params=()):
+    if DB_TYPE == "postgresql":
+        return pd.concat(read_sql_chunks(query, params), ignore_index=True)
+    conn = connect_db()
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+# Newest appointment whose outcome is known (dated before today), in (date, id) order
+LATEST_OUTCOME_QUERY = "SELECT appointment_day, id FROM appointments WHERE appointment_day < ? ORDER BY appointment_day DESC, id DESC LIMIT 1"
+
+def latest_outcome(today=None):
+    today = _day_number(today or datetime.now().date())
+    conn = connect_db()
+    try:
+        c = conn.cursor()
+        c.execute(_sql(LATEST_OUTCOME_QUERY), (today,))
+        row = c.fetchone()
+    finally:
+        conn.close()
+    return {'date': _day_iso(row[0]), 'id': row[1]} if row else None
+
+# Swap in a new set of models: pickles first, then the compiled arrays and probability
+# table, then the checkpoint. Running workers reload once the compiled arrays match.
+def publish_models(models, checkpoint=None):
+    for name, model in models.items():
+        save_model(model, name)
+    print("Models trained and saved!")
+    export_compiled_models(models)
+    export_probability_table(models)
+    if checkpoint is not None:
+        write_checkpoint(checkpoint)
+
+# Query appointments and related data
+TRAINING_QUERY = """
+    SELECT a.id, a.patient_id, a.hospital_id, a.department_id, a.doctor_id, a.slot_minute, a.appointment_day, a.status,
            u.phone, h.location
     FROM appointments a
     JOIN users u ON a.patient_id = u.id
     JOIN hospitals h ON a.hospital_id = h.id
-    """
-    data = pd.read_sql_query(query, conn)
-    conn.close()
-    return data
+"""
+
+# Extract data from the database
+def load_data_from_db():
+    return read_sql(TRAINING_QUERY)
+
+# Stream the training join in fixed-size chunks, yielding (ids, X, y_no_show, y_reschedule).
+# Rows come ordered by patient and date so previous_no_shows can be carried across
+# chunk boundaries: only the last patient of a chunk can continue into the next one.
+# Lead times are drawn from a per-chunk seeded generator, so every pass over the
+# data sees the same rows.
+def iter_training_chunks(chunk_size=TRAIN_CHUNK_SIZE, seed=42):
+    query = TRAINING_QUERY + " ORDER BY a.patient_id, a.appointment_day, a.id"
+    # (patient_id, last date, no-shows before that date, no-shows on that date)
+    carry = None
+    for chunk_index, chunk in enumerate(read_sql_chunks(query, chunksize=chunk_size)):
+        appointment_date = _day_dates(chunk['appointment_day'])
+        dates = appointment_date.to_numpy()
+        patients = chunk['patient_id'].to_numpy()
+        valid = appointment_date.notna().to_numpy()
+        previous_no_shows = count_previous_no_shows(patients, appointment_date, chunk['status'])
+
+        if carry is not None:
+            carry_patient, carry_date, before, on_date = carry
+            continued = valid & (patients == carry_patient)
+            previous_no_shows[continued] += np.where(dates[continued] > carry_date, before + on_date, before)
+
+        if valid.any():
+            last = np.flatnonzero(valid)[-1]
+            on_last_day = valid & (patients == patients[last]) & (dates == dates[last])
+            on_date = int((chunk['status'].to_numpy()[on_last_day] == 'scheduled').sum())
+            if carry is not None and carry[0] == patients[last] and carry[1] == dates[last]:
+                on_date += carry[3]
+            carry = (patients[last], dates[last], int(previous_no_shows[last]), on_date)
+
+        rng = np.random.default_rng([seed, chunk_index])
+        X, y_no_show, y_reschedule = build_features(chunk, previous_no_shows=previous_no_shows, rng=rng)
+        yield chunk['id'].to_numpy(), X, y_no_show.to_numpy(), y_reschedule.to_numpy()
 
 # Calculate a patient's no-show history score (0-1, where 1 is high no-show risk)
-def calculate_no_show_history(patient_id, appointment_date):
-    conn = sqlite3.connect("database.db")
+def calculate_no_show_history(patient_id, appointment_day):
     query = """
-    SELECT status, date FROM appointments 
-    WHERE patient_id = ? AND date < ?
+    SELECT status, appointment_day FROM appointments 
+    WHERE patient_id = ? AND appointment_day < ?
     """
-    past_appointments = pd.read_sql_query(query, conn, params=(patient_id, appointment_date))
-    conn.close()
+    past_appointments = read_sql(query, (patient_id, appointment_day))
 
     if past_appointments.empty:
         return 0.0  # No history, assume low risk
@@ -48,195 +669,442 @@ def calculate_priority_score(no_show_history):
     # Lower no-show history = higher priority
     return 1.0 - no_show_history
 
-# Prepare features and labels
-def prepare_data():
-    data = load_data_from_db()
+# Number of earlier no-shows per row: for each appointment, the patient's 'scheduled'
+# appointments on strictly earlier dates. Sort once, count per (patient, day) and take
+# the per-patient cumulative sum excluding the current day, so same-day appointments
+# do not count each other.
+def count_previous_no_shows(patient_ids, appointment_dates, statuses):
+    keys = pd.DataFrame({
+        'patient_id': np.asarray(patient_ids),
+        'appointment_date': np.asarray(appointment_dates, dtype='datetime64[ns]'),
+        'no_show': (np.asarray(statuses) == 'scheduled').astype(np.int64)
+    })
+    daily = keys.groupby(['patient_id', 'appointment_date'], sort=True)['no_show'].sum()
+    before = daily.groupby(level='patient_id').cumsum() - daily
+    counts = keys.join(before.rename('previous_no_shows'), on=['patient_id', 'appointment_date'])['previous_no_shows']
+    # Rows without a valid date have no earlier appointments
+    return counts.fillna(0).astype(np.int64).to_numpy()
+
+# Turn joined appointment rows into the encoded feature matrix and both labels.
+# previous_no_shows can be passed in when the history spans more than these rows.
+def build_features(data, current_date=pd.to_datetime('2025-05-08'), previous_no_shows=None, rng=None):
+    appointment_date = _day_dates(data['appointment_day'])
 
-    # Feature engineering
     # 1. Patient history (number of previous no-shows)
-    current_date = pd.to_datetime('2025-05-08')
-    data['appointment_date'] = pd.to_datetime(data['date'])
-    previous_no_shows = []
-    for idx, row in data.iterrows():
-        past_appointments = data[(data['patient_id'] == row['patient_id']) & (data['appointment_date'] < row['appointment_date'])]
-        no_show_count = past_appointments[past_appointments['status'] == 'scheduled'].shape[0]
-        previous_no_shows.append(no_show_count)
-    data['previous_no_shows'] = previous_no_shows
+    if previous_no_shows is None:
+        previous_no_shows = count_previous_no_shows(data['patient_id'], appointment_date, data['status'])
 
     # 2. Lead time (simulated as 1-90 days)
-    data['lead_time'] = [np.random.randint(1, 91) for _ in range(len(data))]
-
-    # 3. Distance to hospital
-    data['distance'] = data['location'].apply(lambda x: '<5km' if 'Lagos' in x else '>5km')
+    randint = np.random.randint if rng is None else rng.integers
+    lead_time = randint(1, 91, size=len(data))
 
-    # 4. Time of day
-    data['time_of_day'] = data['slot_time'].apply(lambda x: 'morning' if 'AM' in x.upper() else 'afternoon')
+    # 3. Distance to hospital, 4. time of day, 5. day of the week
+    distance_5km = ~data['location'].str.contains('Lagos', regex=False, na=False).to_numpy()
+    time_of_day_morning = (data['slot_minute'] < NOON_MINUTE).to_numpy()
+    is_weekday_weekend = ~(appointment_date.dt.dayofweek < 5).to_numpy()
 
-    # 5. Day of the week
-    data['day_of_week'] = data['appointment_date'].dt.day_name()
-    data['is_weekday'] = data['day_of_week'].apply(lambda x: 'weekday' if x in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'] else 'weekend')
+    # Encoded the same way pd.get_dummies(drop_first=True) encoded the string columns
+    X = pd.DataFrame({
+        'previous_no_shows': previous_no_shows,
+        'lead_time': lead_time,
+        'distance_>5km': distance_5km,
+        'time_of_day_morning': time_of_day_morning,
+        'is_weekday_weekend': is_weekday_weekend
+    }, index=data.index)[FEATURE_COLS]
 
     # Define target variables
     # No-show: 1 if status is 'scheduled' and date is past, 0 otherwise
-    data['no_show'] = data.apply(
-        lambda row: 1 if row['status'] == 'scheduled' and row['appointment_date'] < current_date else 0,
-        axis=1
-    )
+    y_no_show = ((data['status'] == 'scheduled') & (appointment_date < current_date)).astype(np.int64).rename('no_show')
     # Reschedule: Simulate based on lead time and previous no-shows (placeholder logic)
-    data['reschedule'] = data.apply(
-        lambda row: 1 if row['lead_time'] > 60 or row['previous_no_shows'] > 2 else 0,
-        axis=1
-    )
+    y_reschedule = pd.Series((lead_time > 60) | (previous_no_shows > 2), index=data.index, name='reschedule').astype(np.int64)
+    return X, y_no_show, y_reschedule
+
+# Prepare features and labels
+def prepare_data():
+    return build_features(load_data_from_db())
 
-    # Select features
-    features = ['previous_no_shows', 'lead_time', 'distance', 'time_of_day', 'is_weekday']
-    X = data[features]
-    y_no_show = data['no_show']
-    y_reschedule = data['reschedule']
+# Print and record how long a training stage took
+@contextmanager
+def _stage(name, timings, detail=''):
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+    print(f"[train] {name}{detail}: {timings[name]:.2f}s")
 
-    # Encode categorical features
-    X_encoded = pd.get_dummies(X, columns=['distance', 'time_of_day', 'is_weekday'], drop_first=True)
-    return X_encoded, y_no_show, y_reschedule
+# Split the core budget across the fits: as many concurrent fits as cores allow,
+# each one given an equal share of threads so workers x threads never exceeds the budget
+def _plan_workers(n_tasks, cpu_budget):
+    workers = max(1, min(n_tasks, cpu_budget))
+    return workers, max(1, cpu_budget // workers)
+
+# Fit one model; runs inside a pool worker (or in-process with a budget of one core)
+def _fit_model(name, X_train, y_train, n_threads, seed=42):
+    from threadpoolctl import threadpool_limits
+
+    start = time.perf_counter()
+    with threadpool_limits(limits=n_threads):
+        if name.startswith('rf_'):
+            from sklearn.ensemble import RandomForestClassifier
+            model = RandomForestClassifier(n_estimators=100, random_state=seed, class_weight='balanced', n_jobs=n_threads)
+        else:
+            from xgboost import XGBClassifier
+            model = XGBClassifier(n_estimators=100, random_state=seed, n_jobs=n_threads,
+                                  scale_pos_weight=len(y_train[y_train == 0]) / len(y_train[y_train == 1]))
+        model.fit(X_train, y_train)
+    return name, model, time.perf_counter() - start
+
+# Balance and split both targets, then fit all four models concurrently.
+# Returns the models, the held-out test sets per target and the stage timings.
+def fit_models(X, y_no_show, y_reschedule, cpu_budget=TRAIN_CPU_BUDGET, timings=None):
+    from sklearn.model_selection import train_test_split
+    from imblearn.over_sampling import SMOTE
+
+    timings = {} if timings is None else timings
+    with _stage('resample', timings):
+        # Handle class imbalance with SMOTE
+        splits = {}
+        for target, y in [('no_show', y_no_show), ('reschedule', y_reschedule)]:
+            X_res, y_res = SMOTE(random_state=42).fit_resample(X, y)
+            splits[target] = train_test_split(X_res, y_res, test_size=0.2, random_state=42)
+
+    # Labels go to the workers as plain arrays: unpickled pandas Series come back read-only
+    tasks = [(f'{kind}_{target}', splits[target][0], np.asarray(splits[target][2]))
+             for target in ['no_show', 'reschedule'] for kind in ['rf', 'xgb']]
+    workers, n_threads = _plan_workers(len(tasks), cpu_budget)
+    with _stage('fit', timings, f' ({workers} workers x {n_threads} threads)'):
+        if workers == 1:
+            results = [_fit_model(name, X_train, y_train, n_threads) for name, X_train, y_train in tasks]
+        else:
+            # spawn, not fork: the parent has already used OpenMP (SMOTE), which is not fork-safe
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = [pool.submit(_fit_model, name, X_train, y_train, n_threads) for name, X_train, y_train in tasks]
+                results = [future.result() for future in futures]
+
+    models = {}
+    for name, model, seconds in results:
+        timings[f'fit:{name}'] = seconds
+        print(f"[train]   {name}: {seconds:.2f}s")
+        models[name] = model
+    test_sets = {target: (split[1], split[3]) for target, split in splits.items()}
+    return models, test_sets, timings
 
 # Train models
-# Train models
-def train_models():
-    X, y_no_show, y_reschedule = prepare_data()
-
-    # Handle class imbalance with SMOTE
-    smote = SMOTE(random_state=42)
-    X_ns, y_ns = smote.fit_resample(X, y_no_show)
-    X_rs, y_rs = smote.fit_resample(X, y_reschedule)
-
-    # Split data
-    X_train_ns, X_test_ns, y_train_ns, y_test_ns = train_test_split(X_ns, y_ns, test_size=0.2, random_state=42)
-    X_train_rs, X_test_rs, y_train_rs, y_test_rs = train_test_split(X_rs, y_rs, test_size=0.2, random_state=42)
-
-    # No-show model (Random Forest + XGBoost ensemble)
-    rf_ns = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced')
-    xgb_ns = XGBClassifier(n_estimators=100, random_state=42, scale_pos_weight=len(y_train_ns[y_train_ns == 0]) / len(y_train_ns[y_train_ns == 1]))
-    rf_ns.fit(X_train_ns, y_train_ns)
-    xgb_ns.fit(X_train_ns, y_train_ns)
-
-    # Evaluate no-show model
-    rf_probs_ns = rf_ns.predict_proba(X_test_ns)[:, 1]
-    xgb_probs_ns = xgb_ns.predict_proba(X_test_ns)[:, 1]
-    
-    # Log sample probabilities
-    print("Sample RF no-show probabilities:", rf_probs_ns[:5])
-    print("Sample XGB no-show probabilities:", xgb_probs_ns[:5])
-    
-    ensemble_probs_ns = (rf_probs_ns + xgb_probs_ns) / 2
-    auc_ns = roc_auc_score(y_test_ns, ensemble_probs_ns)
-    print(f"No-Show Ensemble AUC: {auc_ns:.3f}")
-    y_pred_ns = (ensemble_probs_ns > 0.5).astype(int)
-    print("No-Show Classification Report:")
-    print(classification_report(y_test_ns, y_pred_ns))
-
-    # Reschedule model (Random Forest + XGBoost ensemble)
-    rf_rs = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced')
-    xgb_rs = XGBClassifier(n_estimators=100, random_state=42, scale_pos_weight=len(y_train_rs[y_train_rs == 0]) / len(y_train_rs[y_train_rs == 1]))
-    rf_rs.fit(X_train_rs, y_train_rs)
-    xgb_rs.fit(X_train_rs, y_train_rs)
-
-    # Evaluate reschedule model
-    rf_probs_rs = rf_rs.predict_proba(X_test_rs)[:, 1]
-    xgb_probs_rs = xgb_rs.predict_proba(X_test_rs)[:, 1]
-    
-    # Log sample probabilities
-    print("Sample RF reschedule probabilities:", rf_probs_rs[:5])
-    print("Sample XGB reschedule probabilities:", xgb_probs_rs[:5])
-    
-    ensemble_probs_rs = (rf_probs_rs + xgb_probs_rs) / 2
-    auc_rs = roc_auc_score(y_test_rs, ensemble_probs_rs)
-    print(f"Reschedule Ensemble AUC: {auc_rs:.3f}")
-    y_pred_rs = (ensemble_probs_rs > 0.5).astype(int)
-    print("Reschedule Classification Report:")
-    print(classification_report(y_test_rs, y_pred_rs))
-
-    # Save models
-    joblib.dump(rf_ns, 'model/rf_no_show_model.pkl')
-    joblib.dump(xgb_ns, 'model/xgb_no_show_model.pkl')
-    joblib.dump(rf_rs, 'model/rf_reschedule_model.pkl')
-    joblib.dump(xgb_rs, 'model/xgb_reschedule_model.pkl')
-    print("Models trained and saved!")
+def train_models(cpu_budget=TRAIN_CPU_BUDGET):
+    timings = {}
+    checkpoint = latest_outcome()
+    with _stage('prepare', timings):
+        X, y_no_show, y_reschedule = prepare_data()
+
+    models, test_sets, timings = fit_models(X, y_no_show, y_reschedule, cpu_budget, timings)
+
+    with _stage('evaluate', timings):
+        for target, label in [('no_show', 'No-Show'), ('reschedule', 'Reschedule')]:
+            X_test, y_test = test_sets[target]
+            rf_probs = models[f'rf_{target}'].predict_proba(X_test)[:, 1]
+            xgb_probs = models[f'xgb_{target}'].predict_proba(X_test)[:, 1]
+            _print_evaluation(label, y_test, rf_probs, xgb_probs)
+
+    # Save models, flatten the ensembles for sklearn/xgboost-free serving and pre-score the feature space
+    with _stage('publish', timings):
+        publish_models(models, checkpoint)
+    return timings
+
+# Fixed-size uniform sample over a stream of (X, labels) chunks
+class _Reservoir:
+    def __init__(self, size, n_features, n_labels, rng):
+        self.size = size
+        self.X = np.empty((size, n_features))
+        self.y = np.empty((size, n_labels), dtype=np.int64)
+        self.seen = 0
+        self.rng = rng
+
+    def add(self, X, y):
+        fill = min(max(self.size - self.seen, 0), len(X))
+        self.X[self.seen:self.seen + fill] = X[:fill]
+        self.y[self.seen:self.seen + fill] = y[:fill]
+        if fill < len(X):
+            # Row number k (0-based) replaces a random slot with probability size / (k + 1)
+            positions = self.seen + np.arange(fill, len(X))
+            slots = (self.rng.random(len(positions)) * (positions + 1)).astype(np.int64)
+            keep = slots < self.size
+            self.X[slots[keep]] = X[fill:][keep]
+            self.y[slots[keep]] = y[fill:][keep]
+        self.seen += len(X)
+
+    def arrays(self):
+        n = min(self.seen, self.size)
+        return self.X[:n], self.y[:n]
+
+def _is_holdout(ids):
+    # Deterministic 20% holdout so every pass over the stream agrees on the split
+    return ids % 5 == 0
+
+def _print_evaluation(label, y_test, rf_probs, xgb_probs):
+    from sklearn.metrics import roc_auc_score, classification_report
+
+    print(f"Sample RF {label.lower()} probabilities:", rf_probs[:5])
+    print(f"Sample XGB {label.lower()} probabilities:", xgb_probs[:5])
+    ensemble_probs = (rf_probs + xgb_probs) / 2
+    print(f"{label} Ensemble AUC: {roc_auc_score(y_test, ensemble_probs):.3f}")
+    print(f"{label} Classification Report:")
+    print(classification_report(y_test, (ensemble_probs > 0.5).astype(int)))
+
+# Bounded-memory training over the whole appointment history.
+# One streaming pass counts labels and keeps reservoir samples of the training and
+# holdout rows. Each random forest is fit on the SMOTE-balanced training sample, and
+# each XGBoost model trains on every training row through an external-memory DMatrix
+# that re-reads the database in chunks, weighted by the streamed class counts instead
+# of SMOTE. Peak memory depends on chunk_size and sample_size, not on table size.
+def train_models_streaming(chunk_size=TRAIN_CHUNK_SIZE, sample_size=TRAIN_SAMPLE_SIZE, seed=42):
+    import tempfile
+    import xgboost
+    from sklearn.ensemble import RandomForestClassifier
+    from xgboost import XGBClassifier
+    from imblearn.over_sampling import SMOTE
+
+    targets = ['no_show', 'reschedule']
+    checkpoint = latest_outcome()
+    rng = np.random.default_rng(seed)
+    train_sample = _Reservoir(sample_size, len(FEATURE_COLS), len(targets), rng)
+    test_sample = _Reservoir(max(sample_size // 4, 1), len(FEATURE_COLS), len(targets), rng)
+    positives = np.zeros(len(targets), dtype=np.int64)
+    train_rows = 0
+    for ids, X, y_no_show, y_reschedule in iter_training_chunks(chunk_size, seed):
+        X = X.to_numpy(dtype=np.float64)
+        y = np.column_stack([y_no_show, y_reschedule])
+        holdout = _is_holdout(ids)
+        train_sample.add(X[~holdout], y[~holdout])
+        test_sample.add(X[holdout], y[holdout])
+        positives += y[~holdout].sum(axis=0)
+        train_rows += int((~holdout).sum())
+    print(f"Streamed {train_sample.seen + test_sample.seen} rows in chunks of {chunk_size}")
+
+    # Feeds one target's training rows to XGBoost chunk by chunk
+    class ChunkIter(xgboost.DataIter):
+        def __init__(self, target_index, cache_dir):
+            self.target_index = target_index
+            self._chunks = None
+            super().__init__(cache_prefix=os.path.join(cache_dir, 'xgb'))
+
+        def next(self, input_data):
+            if self._chunks is None:
+                self._chunks = iter_training_chunks(chunk_size, seed)
+            for ids, X, y_no_show, y_reschedule in self._chunks:
+                train = ~_is_holdout(ids)
+                if train.any():
+                    y = (y_no_show, y_reschedule)[self.target_index]
+                    input_data(data=X[train], label=y[train])
+                    return True
+            return False
+
+        def reset(self):
+            if self._chunks is not None:
+                self._chunks.close()
+            self._chunks = None
+
+    X_train, y_train = train_sample.arrays()
+    X_test, y_test = test_sample.arrays()
+    X_train_df = pd.DataFrame(X_train, columns=FEATURE_COLS)
+    X_test_df = pd.DataFrame(X_test, columns=FEATURE_COLS)
+    models = {}
+    for i, target in enumerate(targets):
+        label = 'No-Show' if target == 'no_show' else 'Reschedule'
+
+        # Random forest on the bounded, SMOTE-balanced sample
+        X_bal, y_bal = SMOTE(random_state=seed).fit_resample(X_train_df, y_train[:, i])
+        rf = RandomForestClassifier(n_estimators=100, random_state=seed, class_weight='balanced')
+        rf.fit(X_bal, y_bal)
+
+        # XGBoost over every training row via external memory
+        scale_pos_weight = (train_rows - positives[i]) / max(positives[i], 1)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            dtrain = xgboost.ExtMemQuantileDMatrix(ChunkIter(i, cache_dir))
+            booster = xgboost.train(
+                {'objective': 'binary:logistic', 'seed': seed, 'scale_pos_weight': scale_pos_weight},
+                dtrain, num_boost_round=100
+            )
+            del dtrain
+        xgb = XGBClassifier()
+        xgb.load_model(bytearray(booster.save_raw('json')))
+
+        _print_evaluation(label, y_test[:, i], rf.predict_proba(X_test_df)[:, 1], xgb.predict_proba(X_test)[:, 1])
+        models[f'rf_{target}'] = rf
+        models[f'xgb_{target}'] = xgb
+
+    publish_models(models, checkpoint)
+
+# Features for the outcomes recorded after the checkpoint. previous_no_shows still
+# counts each patient's whole history, so those patients' earlier rows are read too.
+def load_new_outcomes(checkpoint, today=None):
+    today = today or datetime.now().date()
+    since_day = _day_number(date.fromisoformat(checkpoint['date']))
+    since = "(a.appointment_day > ? OR (a.appointment_day = ? AND a.id > ?)) AND a.appointment_day < ?"
+    params = (since_day, since_day, checkpoint['id'], _day_number(today))
+    data = read_sql(TRAINING_QUERY + f" WHERE {since} ORDER BY a.appointment_day, a.id", params)
+    history = read_sql(
+        f"""SELECT id, patient_id, appointment_day, status FROM appointments
+            WHERE patient_id IN (SELECT a.patient_id FROM appointments a WHERE {since})""",
+        params
+    )
+    if data.empty:
+        return data, None
+    history['previous_no_shows'] = count_previous_no_shows(history['patient_id'], _day_dates(history['appointment_day']), history['status'])
+    previous_no_shows = data[['id']].merge(history[['id', 'previous_no_shows']], on='id', how='left')['previous_no_shows']
+    features = build_features(
+        data, current_date=pd.to_datetime(today),
+        previous_no_shows=previous_no_shows.fillna(0).astype(np.int64).to_numpy()
+    )
+    last = data.iloc[-1]
+    return features, {'date': _day_iso(last['appointment_day']), 'id': int(last['id'])}
+
+# Scheduled job: fold the outcomes recorded since the last checkpoint into the current
+# models instead of retraining from scratch. XGBoost keeps boosting from its current
+# trees; each forest gets extra trees fit on the new rows and drops its oldest ones
+# past RETRAIN_MAX_RF_TREES. Full retrains (train_models) only run on demand.
+def retrain_incremental(min_rows=RETRAIN_MIN_ROWS):
+    from sklearn.utils.class_weight import compute_class_weight
+    from xgboost import XGBClassifier
+
+    checkpoint = read_checkpoint()
+    if checkpoint is None:
+        # Nothing recorded yet: assume the deployed models cover the history so far
+        checkpoint = latest_outcome()
+        if checkpoint is not None:
+            write_checkpoint(checkpoint)
+        print(f"No retrain checkpoint found, starting from {checkpoint}")
+        return False
+
+    features, new_checkpoint = load_new_outcomes(checkpoint)
+    if new_checkpoint is None or len(features[0]) < min_rows:
+        print(f"Only {0 if new_checkpoint is None else len(features[0])} new outcomes since {checkpoint['date']}, need {min_rows}")
+        return False
+    X, y_no_show, y_reschedule = features
+    print(f"Updating models with {len(X)} outcomes from {checkpoint['date']} to {new_checkpoint['date']}")
+
+    models = {name: joblib.load(io.BytesIO(payload)) for name, payload in _read_model_payloads(MODEL_DIR).items()}
+    for target, y in [('no_show', y_no_show), ('reschedule', y_reschedule)]:
+        if y.nunique() < 2:
+            print(f"Skipping {target}: new outcomes contain a single class")
+            continue
+
+        xgb = models[f'xgb_{target}']
+        rounds = xgb.get_booster().num_boosted_rounds()
+        if rounds + RETRAIN_XGB_ROUNDS > RETRAIN_MAX_XGB_ROUNDS:
+            print(f"xgb_{target} already has {rounds} rounds; run a full retrain to update it")
+        else:
+            updated = XGBClassifier(n_estimators=RETRAIN_XGB_ROUNDS, random_state=42,
+                                    scale_pos_weight=(y == 0).sum() / (y == 1).sum())
+            updated.fit(X, y, xgb_model=xgb.get_booster())
+            models[f'xgb_{target}'] = updated
+
+        # 'balanced' would reweight against the full history under warm_start; weight
+        # the new trees from the new rows explicitly instead
+        rf = models[f'rf_{target}']
+        class_weight = rf.class_weight
+        if class_weight == 'balanced':
+            classes = np.unique(y)
+            rf.set_params(class_weight=dict(zip(classes, compute_class_weight('balanced', classes=classes, y=y))))
+        rf.set_params(warm_start=True, n_estimators=len(rf.estimators_) + RETRAIN_RF_TREES)
+        rf.fit(X, y)
+        if len(rf.estimators_) > RETRAIN_MAX_RF_TREES:
+            rf.estimators_ = rf.estimators_[-RETRAIN_MAX_RF_TREES:]
+        rf.set_params(warm_start=False, n_estimators=len(rf.estimators_), class_weight=class_weight)
+
+    publish_models(models, new_checkpoint)
+    return True
+
+def _as_feature_matrix(features):
+    return np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_COLS))
+
+def _ensemble_proba(models, target, X):
+    rf_prob = models[f'rf_{target}'].predict_proba(X)[:, 1]
+    xgb_prob = models[f'xgb_{target}'].predict_proba(X)[:, 1]
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"RF {target} probabilities: {rf_prob}")
+        logger.debug(f"XGB {target} probabilities: {xgb_prob}")
+    return (rf_prob + xgb_prob) / 2
+
+# Both targets for feature matrix X from one snapshot, so a hot reload cannot split the
+# pair across versions. A target whose models are unavailable scores NaN.
+def _score_snapshot(snapshot, X):
+    table = snapshot.table
+    if table is None:
+        hit = np.zeros(len(X), dtype=bool)
+    else:
+        hit = table.covers(X)
+        if hit.all():
+            return table.lookup(X)
+
+    # Rows outside the table (or no table at all) go through the live ensemble
+    no_show_probs = np.empty(len(X))
+    reschedule_probs = np.empty(len(X))
+    if hit.any():
+        no_show_probs[hit], reschedule_probs[hit] = table.lookup(X[hit])
+    miss = ~hit
+    for target, probs in zip(TARGETS, (no_show_probs, reschedule_probs)):
+        if target in snapshot.unavailable:
+            probs[miss] = np.nan
+        else:
+            probs[miss] = _ensemble_proba(snapshot.models, target, X[miss]) * 100
+    return no_show_probs, reschedule_probs
+
+# Score both targets for an N x 5 feature matrix in one pass.
+# Returns (no_show_probs, reschedule_probs) as percentages; callers validate each row
+# so one bad row does not sink the whole batch. A target whose models are unavailable
+# comes back as NaN, which that validation rejects.
+def score_appointments(features):
+    X = _as_feature_matrix(features)
+    if len(X) == 0:
+        return np.empty(0), np.empty(0)
+    return _score_snapshot(model_registry.get(), X)
+
+# Score a single appointment; returns (no_show_prob, reschedule_prob) as percentages
+def score_appointment(features):
+    no_show_probs, reschedule_probs = score_appointments(features)
+    no_show_prob = float(no_show_probs[0])
+    reschedule_prob = float(reschedule_probs[0])
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Features {features}: no-show {no_show_prob}%, reschedule {reschedule_prob}%")
+    if not (0 <= no_show_prob <= 100 and 0 <= reschedule_prob <= 100):
+        raise ValueError(f"Invalid ensemble probabilities: no_show={no_show_prob}, reschedule={reschedule_prob}. Must be between 0 and 100.")
+    return no_show_prob, reschedule_prob
+
+# Score one target for a single appointment; only that target's models need to load
+def _predict_target(features, target):
+    snapshot = model_registry.get()
+    if target in snapshot.unavailable:
+        raise FileNotFoundError(f"{target} models are unavailable: {snapshot.unavailable[target]}")
+    prob = float(_score_snapshot(snapshot, _as_feature_matrix(features))[TARGETS.index(target)][0])
+    if not 0 <= prob <= 100:
+        raise ValueError(f"Invalid ensemble {target} probability {prob}. Must be between 0 and 100.")
+    return prob
 
-# Predict no-show probability
 # Predict no-show probability
 def predict_no_show(features):
-    rf_model = joblib.load('model/rf_no_show_model.pkl')
-    xgb_model = joblib.load('model/xgb_no_show_model.pkl')
-    
-    # Convert features to DataFrame with correct column names
-    feature_cols = ['previous_no_shows', 'lead_time', 'distance_>5km', 'time_of_day_morning', 'is_weekday_weekend']
-    features_df = pd.DataFrame([features], columns=feature_cols)
-    
-    # Log the input features
-    print(f"Input features for predict_no_show: {features}")
-    
-    # Predict
-    rf_prob = rf_model.predict_proba(features_df)[0][1]
-    xgb_prob = xgb_model.predict_proba(features_df)[0][1]
-    
-    # Log individual probabilities
-    print(f"RF no-show probability: {rf_prob}")
-    print(f"XGB no-show probability: {xgb_prob}")
-    
-    # Compute ensemble probability
-    ensemble_prob = (rf_prob + xgb_prob) / 2
-    
-    # Log ensemble probability before scaling
-    print(f"Ensemble no-show probability (before scaling): {ensemble_prob}")
-    
-    # Validate the ensemble probability
-    if not (0 <= ensemble_prob <= 1):
-        raise ValueError(f"Invalid ensemble probability: {ensemble_prob}. Must be between 0 and 1.")
-    
-    # Convert to percentage
-    final_prob = ensemble_prob * 100
-    
-    # Log final probability
-    print(f"Final no-show probability: {final_prob}%")
-    
-    return final_prob
+    return _predict_target(features, 'no_show')
 
 # Predict rescheduling probability
 def predict_reschedule(features):
-    rf_model = joblib.load('model/rf_reschedule_model.pkl')
-    xgb_model = joblib.load('model/xgb_reschedule_model.pkl')
-    
-    # Convert features to DataFrame with correct column names
-    feature_cols = ['previous_no_shows', 'lead_time', 'distance_>5km', 'time_of_day_morning', 'is_weekday_weekend']
-    features_df = pd.DataFrame([features], columns=feature_cols)
-    
-    # Log the input features
-    print(f"Input features for predict_reschedule: {features}")
-    
-    # Predict
-    rf_prob = rf_model.predict_proba(features_df)[0][1]
-    xgb_prob = xgb_model.predict_proba(features_df)[0][1]
-    
-    # Log individual probabilities
-    print(f"RF reschedule probability: {rf_prob}")
-    print(f"XGB reschedule probability: {xgb_prob}")
-    
-    # Compute ensemble probability
-    ensemble_prob = (rf_prob + xgb_prob) / 2
-    
-    # Log ensemble probability before scaling
-    print(f"Ensemble reschedule probability (before scaling): {ensemble_prob}")
-    
-    # Validate the ensemble probability
-    if not (0 <= ensemble_prob <= 1):
-        raise ValueError(f"Invalid ensemble probability: {ensemble_prob}. Must be between 0 and 1.")
-    
-    # Convert to percentage
-    final_prob = ensemble_prob * 100
-    
-    # Log final probability
-    print(f"Final reschedule probability: {final_prob}%")
-    
-    return final_prob
+    return _predict_target(features, 'reschedule')
+
+# Batch scoring for a single target
+def predict_no_show_batch(features):
+    return score_appointments(features)[0]
+
+def predict_reschedule_batch(features):
+    return score_appointments(features)[1]
 
 if __name__ == '__main__':
-    train_models()
\ No newline at end of file
+    import sys
+    # `python model/no_show_model.py export` compiles the current pickles without retraining,
+    # `python model/no_show_model.py stream` trains out-of-core for large histories,
+    # `python model/no_show_model.py incremental` folds in outcomes since the last checkpoint
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        export_compiled_models()
+        export_probability_table()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'stream':
+        train_models_streaming()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'incremental':
+        retrain_incremental()
+    else:
+        train_models()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import os
+import numpy as np
+from appointment_time import SLOT_MINUTES
+
+# Monte Carlo check of how a doctor-day's bookings play out. Each booking attends with
+# probability 1 - no_show_prob/100, independently of the others; one run draws an
+# outcome for every booking of the day, and all runs are drawn as one array. A slot
+# sees one patient, so in a run it is idle when nobody comes and overflows when more
+# than one does.
+SIMULATION_RUNS = int(os.getenv("OVERBOOKING_SIMULATION_RUNS", "10000"))
+# Upper bound on the runs a caller may ask for
+MAX_SIMULATION_RUNS = 100000
+# Highest chance of a slot overflowing that a recommended capacity may carry
+OVERFLOW_TARGET = float(os.getenv("OVERBOOKING_OVERFLOW_TARGET", "0.1"))
+# Recommended capacities never go above this many bookings per slot
+MAX_SLOT_CAPACITY = int(os.getenv("OVERBOOKING_MAX_SLOT_CAPACITY", "4"))
+
+SLOT_COLUMNS = {slot: col for col, slot in enumerate(SLOT_MINUTES)}
+
+# Patients arriving per slot, shape (runs, len(SLOT_MINUTES)), for bookings given as
+# slot columns and no_show_prob percentages
+def sample_attendance(cols, no_show_probs, runs, rng):
+    shows = rng.random((runs, len(cols)), dtype=np.float32) >= np.asarray(no_show_probs, dtype=np.float32) / 100.0
+    slot_of_booking = np.zeros((len(cols), len(SLOT_MINUTES)), dtype=np.float32)
+    slot_of_booking[np.arange(len(cols)), cols] = 1
+    return (shows.astype(np.float32) @ slot_of_booking).astype(np.int64)
+
+# Per slot, the share of runs in which 0, 1 and more than 1 patients arrived, as rows
+# of a (3, len(SLOT_MINUTES)) array
+def arrival_distribution(attendance):
+    keys = np.minimum(attendance, 2) * len(SLOT_MINUTES) + np.arange(len(SLOT_MINUTES))
+    return np.bincount(keys.ravel(), minlength=3 * len(SLOT_MINUTES)).reshape(3, len(SLOT_MINUTES)) / len(attendance)
+
+# The most bookings each slot can hold with its overflow probability at most target.
+# Bookings beyond the current ones are assumed to carry new_no_show_prob, so the k
+# extra patients who turn up are binomial and the overflow probability follows from
+# the simulated chances of 0 and 1 arrivals among the current bookings. A slot already
+# over the target keeps its current bookings and gets no more.
+def recommend_capacity(distribution, bookings, new_no_show_prob, target=OVERFLOW_TARGET, max_capacity=MAX_SLOT_CAPACITY):
+    none_came, one_came = distribution[0], distribution[1]
+    show = 1.0 - new_no_show_prob / 100.0
+    extra = np.arange(max_capacity + 1)
+    none_extra = (1.0 - show) ** extra
+    one_extra = extra * show * (1.0 - show) ** np.maximum(extra - 1, 0)
+    overflow = 1.0 - none_came[:, None] * (none_extra + one_extra)[None, :] - one_came[:, None] * none_extra[None, :]
+    acceptable = (overflow <= target + 1e-12) & (bookings[:, None] + extra[None, :] <= max_capacity)
+    # Overflow only grows with more bookings, so the acceptable counts are a prefix
+    room = np.where(acceptable[:, 0], acceptable.sum(axis=1) - 1, 0)
+    return bookings + room
+
+# Simulation report for one doctor-day from its bookings as (slot_minute, no_show_prob)
+# pairs. new_no_show_prob is the risk assumed for bookings not made yet; it defaults to
+# the day's mean, or 0 (every new patient attends) for an empty day.
+def simulate_day(bookings, runs=SIMULATION_RUNS, new_no_show_prob=None, seed=None, target=OVERFLOW_TARGET):
+    rng = np.random.default_rng(seed)
+    bookings = [(SLOT_COLUMNS[slot], prob or 0.0) for slot, prob in bookings if slot in SLOT_COLUMNS]
+    cols = np.array([col for col, _ in bookings], dtype=np.int64)
+    no_show_probs = np.array([prob for _, prob in bookings], dtype=float)
+    if new_no_show_prob is None:
+        new_no_show_prob = float(no_show_probs.mean()) if no_show_probs.size else 0.0
+
+    attendance = sample_attendance(cols, no_show_probs, runs, rng)
+    idle, _, overflowing = distribution = arrival_distribution(attendance)
+    slot_bookings = np.bincount(cols, minlength=len(SLOT_MINUTES))
+    slot_no_show_sums = np.bincount(cols, weights=no_show_probs, minlength=len(SLOT_MINUTES))
+    capacity = recommend_capacity(distribution, slot_bookings, new_no_show_prob, target)
+    expected_attendance = attendance.sum() / runs
+    seen = len(SLOT_MINUTES) - idle.sum()
+    # Counted per run rather than as expected_attendance - seen, which rounds to a tiny
+    # negative number on a day nobody overflows
+    expected_overflow = np.maximum(attendance - 1, 0).sum() / runs
+
+    return {
+        'runs': runs,
+        'bookings': int(cols.size),
+        'new_no_show_prob': round(new_no_show_prob, 2),
+        'expected_attendance': float(expected_attendance),
+        'expected_idle_slots': float(idle.sum()),
+        'expected_overflow_patients': float(expected_overflow),
+        'overflow_probability': float((attendance > 1).any(axis=1).mean()),
+        'utilization': float(seen / len(SLOT_MINUTES)),
+        'slots': [
+            {
+                'slot_minute': slot,
+                'bookings': int(slot_bookings[col]),
+                'combined_no_show_prob': round(float(slot_no_show_sums[col]), 2),
+                'idle_probability': float(idle[col]),
+                'overflow_probability': float(overflowing[col]),
+                'recommended_capacity': int(capacity[col]),
+            }
+            for col, slot in enumerate(SLOT_MINUTES)
+        ],
+    }
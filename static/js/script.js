@@ -92,6 +92,35 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    // Slots per date for each doctor, fetched a month at a time from /get_availability so
+    // trying one date after another does not cost a request each. The chosen slot is
+    // still confirmed with /check_slot before booking.
+    const availabilityByMonth = {};
+
+    async function fetchAvailableSlots(doctorId, date) {
+        const month = date.slice(0, 7);
+        const key = `${doctorId}:${month}`;
+        if (!availabilityByMonth[key]) {
+            const [year, monthNumber] = month.split('-').map(Number);
+            const lastDay = String(new Date(year, monthNumber, 0).getDate()).padStart(2, '0');
+            availabilityByMonth[key] = fetch(`/get_availability?doctor_id=${doctorId}&start=${month}-01&end=${month}-${lastDay}`)
+                .then(response => {
+                    if (!response.ok) throw new Error('Network response was not ok');
+                    return response.json();
+                })
+                .then(data => {
+                    if (data.error) throw new Error(data.error);
+                    return data.doctors[0].days;
+                })
+                .catch(error => {
+                    delete availabilityByMonth[key];
+                    throw error;
+                });
+        }
+        const days = await availabilityByMonth[key];
+        return days[date] || [];
+    }
+
     async function loadAvailableSlots() {
         const doctorId = doctorSelect.value;
         const date = dateInput.value;
@@ -104,16 +133,10 @@ document.addEventListener('DOMContentLoaded', function () {
 
         if (doctorId && date) {
             try {
-                const response = await fetch(`/get_available_slots?doctor_id=${doctorId}&date=${date}`);
-                if (!response.ok) throw new Error('Network response was not ok');
-                const data = await response.json();
+                const data = await fetchAvailableSlots(doctorId, date);
                 loadingSpinner.style.display = 'none';
                 timeSelect.innerHTML = '<option value="" disabled selected>Select a time</option>';
-                if (data.error) {
-                    timeSelect.innerHTML = '<option value="" disabled selected>Error loading slots</option>';
-                    slotAvailabilityDiv.textContent = data.error;
-                    slotAvailabilityDiv.className = 'error-message';
-                } else if (data.length === 0) {
+                if (data.length === 0) {
                     timeSelect.innerHTML = '<option value="" disabled selected>No available slots</option>';
                 } else {
                     data.forEach(slot => {
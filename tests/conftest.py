@@ -0,0 +1,76 @@
+import os
+import shutil
+import sys
+import joblib
+import numpy as np
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# app.py opens database.db and model/ relative to the working directory, so the tests
+# run it from a scratch directory holding a copy of the seeded database
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('app')
+    shutil.copy(os.path.join(REPO_ROOT, 'database.db'), workdir)
+    os.symlink(os.path.join(REPO_ROOT, 'model'), workdir / 'model')
+    os.chdir(workdir)
+    import app
+    # Reschedule notifications are built but never handed to the SMTP server
+    app.app.extensions['mail'].suppress = True
+    with app.app.app_context():
+        app.init_db()
+    return app
+
+@pytest.fixture
+def app_context(app_module):
+    with app_module.app.app_context():
+        yield app_module
+
+# Feature rows shaped like the real ones: previous no-shows, lead time in days and
+# three 0/1 flags, with outcomes that depend on all of them
+def synthetic_data(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.integers(0, 8, n), rng.integers(0, 120, n),
+        rng.integers(0, 2, n), rng.integers(0, 2, n), rng.integers(0, 2, n)
+    ]).astype(np.float64)
+    margin = 0.5 * X[:, 0] + 0.02 * X[:, 1] - X[:, 2] + 0.5 * X[:, 3] - 0.5 * X[:, 4] - 2
+    y = (rng.random(n) < 1 / (1 + np.exp(-margin))).astype(int)
+    return X, y
+
+# Small fitted models under their MODEL_FILES names, the reschedule target trained on
+# the opposite outcome so the two targets differ
+@pytest.fixture(scope='session')
+def synthetic_models():
+    from sklearn.ensemble import RandomForestClassifier
+    from xgboost import XGBClassifier
+    X, y = synthetic_data()
+    models = {}
+    for i, target in enumerate(['no_show', 'reschedule']):
+        target_y = y if i == 0 else 1 - y
+        models[f'rf_{target}'] = RandomForestClassifier(n_estimators=15, max_depth=8, random_state=i).fit(X, target_y)
+        models[f'xgb_{target}'] = XGBClassifier(n_estimators=20, max_depth=4, random_state=i).fit(X, target_y)
+    return models
+
+# Serve the synthetic models through the registry, for routes that score appointments
+@pytest.fixture
+def scoring_models(tmp_path, monkeypatch, synthetic_models):
+    from model import no_show_model
+    for name, model in synthetic_models.items():
+        joblib.dump(model, tmp_path / no_show_model.MODEL_FILES[name])
+    registry = no_show_model.ModelRegistry(model_dir=str(tmp_path), backend='pickle')
+    monkeypatch.setattr(no_show_model, 'model_registry', registry)
+    return registry
+
+# A test client logged in as the first user with role
+def client_for(app_module, role):
+    with app_module.app.app_context():
+        user = app_module.query_db("SELECT id FROM users WHERE role = ? ORDER BY id LIMIT 1", (role,), one=True)
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user['id']
+        sess['role'] = role
+    client.user_id = user['id']
+    return client
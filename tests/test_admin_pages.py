@@ -0,0 +1,74 @@
+import pytest
+from conftest import client_for
+
+PAGE_SIZE = 7
+
+# The busiest doctor, so every walk spans several pages and both sort keys have ties
+@pytest.fixture
+def admin_pages(app_module, monkeypatch):
+    app = app_module
+    with app.app.app_context():
+        doctor_id = app.query_db("SELECT doctor_id FROM appointments GROUP BY doctor_id ORDER BY COUNT(*) DESC, doctor_id LIMIT 1", one=True)['doctor_id']
+        rows = app.query_db("""SELECT a.id, a.appointment_day, a.status FROM appointments a
+                               JOIN users u ON a.patient_id = u.id
+                               JOIN hospitals h ON a.hospital_id = h.id
+                               JOIN departments d ON a.department_id = d.id
+                               WHERE a.doctor_id = ?""", (doctor_id,))
+    monkeypatch.setattr(app, 'ADMIN_PAGE_SIZE', PAGE_SIZE)
+    # Keep the page context render_template() is handed instead of the HTML
+    pages = []
+    def render_template(name, **context):
+        pages.append(context)
+        return ''
+    monkeypatch.setattr(app, 'render_template', render_template)
+    admin = client_for(app, 'admin')
+
+    def page(**args):
+        assert admin.get('/admin', query_string=dict(args, doctor_id=doctor_id)).status_code == 200
+        context = pages.pop()
+        return [appt[0] for appt in context['appointments']], context['next_cursor'], context['prev_cursor']
+    return page, rows
+
+def expected_order(rows, sort_by, sort_order):
+    key = 'appointment_day' if sort_by == 'date' else 'status'
+    return [row['id'] for row in sorted(rows, key=lambda row: (row[key], row['id']), reverse=sort_order == 'desc')]
+
+@pytest.mark.parametrize('sort_by', ['date', 'status'])
+@pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+def test_cursors_walk_every_row_once_both_ways(admin_pages, sort_by, sort_order):
+    page, rows = admin_pages
+    expected = expected_order(rows, sort_by, sort_order)
+    assert len(expected) > 3 * PAGE_SIZE
+    args = dict(sort_by=sort_by, sort_order=sort_order)
+
+    # Forward from the first page along next cursors
+    ids, next_cursor, prev_cursor = page(**args)
+    assert prev_cursor is None
+    forward = [ids]
+    while next_cursor:
+        ids, next_cursor, prev_cursor = page(after=next_cursor, **args)
+        assert prev_cursor
+        forward.append(ids)
+    assert [appt_id for ids in forward for appt_id in ids] == expected
+    assert all(len(ids) == PAGE_SIZE for ids in forward[:-1])
+
+    # Back from the last page along prev cursors, landing on the same pages
+    backward = [forward[-1]]
+    while prev_cursor:
+        ids, next_cursor, prev_cursor = page(before=prev_cursor, **args)
+        assert next_cursor
+        backward.append(ids)
+    backward.reverse()
+    assert [appt_id for ids in backward for appt_id in ids] == expected
+
+def test_cursor_outside_the_rows_gives_an_empty_page(admin_pages):
+    page, rows = admin_pages
+    last_day = max(row['appointment_day'] for row in rows)
+    ids, next_cursor, prev_cursor = page(sort_by='date', sort_order='asc', after=f"{last_day}:{10**9}")
+    assert (ids, next_cursor, prev_cursor) == ([], None, None)
+
+def test_unreadable_cursor_starts_from_the_first_page(admin_pages):
+    page, rows = admin_pages
+    first, _, _ = page(sort_by='date', sort_order='desc')
+    assert page(sort_by='date', sort_order='desc', after='not-a-cursor')[0] == first
+    assert first == expected_order(rows, 'date', 'desc')[:PAGE_SIZE]
@@ -0,0 +1,108 @@
+import pytest
+from appointment_time import SLOT_MINUTES
+from test_patient_stats import assert_stats_match_recount
+
+# The index's occupancy for a doctor's days against the same days read from the database
+def assert_occupancy_matches_db(app, doctor_id, first_day, last_day):
+    cached = app.slot_occupancy.get_range(doctor_id, first_day, last_day)
+    for day in range(first_day, last_day + 1):
+        stored = app.day_occupancy(app.query_db(app.DAY_APPOINTMENTS_QUERY, (doctor_id, day)))
+        assert set(cached[day]) == set(stored), day
+        for slot, (bookings, no_show_sum) in stored.items():
+            assert cached[day][slot] == (bookings, pytest.approx(no_show_sum)), (day, slot)
+
+# Book scheduled appointments for doctor_id on consecutive days from first_day, one per
+# (patient_id, slot_minute), through the same writes a booking makes
+def book_rows(app, doctor_id, first_day, bookings):
+    booked = []
+    with app.unit_of_work():
+        for i, (patient_id, slot) in enumerate(bookings):
+            day = first_day + i % 3
+            no_show_prob = 10.0 + i
+            row = app.query_db(
+                """INSERT INTO appointments (patient_id, doctor_id, appointment_day, slot_minute, no_show_prob, reschedule_prob, status, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING id""",
+                (patient_id, doctor_id, day, slot, no_show_prob, 5.0, 'scheduled', app.changed_at()), one=True, commit=True
+            )
+            app.update_patient_stats(patient_id, new=(day, 'scheduled'))
+            app.slot_occupancy.change(doctor_id, new=app.booked_slot(day, slot, no_show_prob, 'scheduled'))
+            booked.append(dict(id=row['id'], patient_id=patient_id, appointment_day=day, slot_minute=slot, no_show_prob=no_show_prob))
+    return booked
+
+def test_batch_flushes_in_chunks_and_keeps_stats_and_occupancy(app_context, monkeypatch):
+    app = app_context
+    doctor_id = app.query_db("SELECT id FROM doctors ORDER BY id DESC LIMIT 1", one=True)['id']
+    patients = [row['id'] for row in app.query_db("SELECT id FROM users WHERE role = 'patient' ORDER BY id LIMIT 3")]
+    first_day = app.today_day() + 60
+    last_day = first_day + 3
+    booked = book_rows(app, doctor_id, first_day, [(patients[i % 3], SLOT_MINUTES[i]) for i in range(8)])
+    # Warm the index so the flush has cached days to keep up to date
+    assert_occupancy_matches_db(app, doctor_id, first_day, last_day)
+
+    transactions = []
+    unit_of_work = app.unit_of_work
+    def counting_unit_of_work():
+        if app.g.get('db_conn') is None:
+            transactions.append(1)
+        return unit_of_work()
+    monkeypatch.setattr(app, 'unit_of_work', counting_unit_of_work)
+
+    batch = app.AppointmentBatch(chunk_size=3)
+    expected = {}
+    for i, appt in enumerate(booked):
+        day, slot, prob = appt['appointment_day'], appt['slot_minute'], appt['no_show_prob']
+        old = app.booked_slot(day, slot, prob, 'scheduled')
+        if i < 2:
+            batch.update(appt['id'], appt['patient_id'], (day, 'scheduled'), (day, 'closed'),
+                         slot=(doctor_id, old, None), status='closed')
+            expected[appt['id']] = ('closed', day, slot, prob)
+        elif i < 4:
+            new_day, new_slot, new_prob = last_day, SLOT_MINUTES[-1 - i], prob + 30
+            batch.update(appt['id'], appt['patient_id'], (day, 'scheduled'), (new_day, 'rescheduled'),
+                         slot=(doctor_id, old, app.booked_slot(new_day, new_slot, new_prob, 'rescheduled')),
+                         status='rescheduled', appointment_day=new_day, slot_minute=new_slot, no_show_prob=new_prob)
+            expected[appt['id']] = ('rescheduled', new_day, new_slot, new_prob)
+        elif i < 6:
+            batch.update(appt['id'], appt['patient_id'], (day, 'scheduled'), (day, 'no_show'),
+                         slot=(doctor_id, old, app.booked_slot(day, slot, prob, 'no_show')), status='no_show')
+            expected[appt['id']] = ('no_show', day, slot, prob)
+        else:
+            batch.update(appt['id'], slot=(doctor_id, old, app.booked_slot(day, slot, prob / 2, 'scheduled')), no_show_prob=prob / 2)
+            expected[appt['id']] = ('scheduled', day, slot, prob / 2)
+    # A later update to a queued appointment replaces its earlier values
+    batch.update(booked[-1]['id'], reschedule_prob=7.5)
+    assert len(batch) == len(booked)
+
+    assert batch.flush() == len(booked)
+    assert len(transactions) == 3
+    assert len(batch) == 0
+    monkeypatch.undo()
+
+    rows = app.query_db(
+        f"SELECT id, status, appointment_day, slot_minute, no_show_prob, reschedule_prob FROM appointments WHERE id IN ({', '.join('?' * len(booked))})",
+        [appt['id'] for appt in booked]
+    )
+    assert {row['id']: (row['status'], row['appointment_day'], row['slot_minute'], row['no_show_prob']) for row in rows} == expected
+    assert {row['id']: row['reschedule_prob'] for row in rows}[booked[-1]['id']] == 7.5
+    assert_stats_match_recount(app)
+    assert_occupancy_matches_db(app, doctor_id, first_day, last_day)
+
+def test_batch_rejects_unknown_columns(app_context):
+    with pytest.raises(ValueError):
+        app_context.AppointmentBatch().update(1, email='x@example.com')
+
+def test_patient_stats_delta(app_module):
+    app = app_module
+    assert app.patient_stats_delta(new=(10, 'scheduled')) == (1, 0, 1, 10)
+    assert app.patient_stats_delta((10, 'scheduled'), (10, 'no_show')) == (0, 1, -1, 10)
+    assert app.patient_stats_delta((10, 'no_show'), (14, 'rescheduled')) == (0, -1, 0, 14)
+    assert app.patient_stats_delta((10, 'scheduled'), None) == (-1, 0, -1, None)
+
+def test_execute_many_writes_every_chunk(app_context):
+    app = app_context
+    patient_id = app.query_db("SELECT id FROM users WHERE role = 'patient' ORDER BY id LIMIT 1", one=True)['id']
+    count = app.query_db("SELECT COUNT(*) AS n FROM appointments", one=True)['n']
+    rows = [(patient_id, 'closed', app.changed_at()) for _ in range(5)]
+    assert app.execute_many("INSERT INTO appointments (patient_id, status, updated_at) VALUES (?, ?, ?)", rows, chunk_size=2) == 5
+    assert app.query_db("SELECT COUNT(*) AS n FROM appointments", one=True)['n'] == count + 5
+    app.query_db("DELETE FROM appointments WHERE id IN (SELECT id FROM appointments ORDER BY id DESC LIMIT 5)", commit=True)
@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from appointment_time import SLOT_MINUTES, format_day, format_slot
+from conftest import client_for
+from test_appointment_batch import book_rows
+
+@pytest.fixture(scope='module')
+def async_api(app_module):
+    import async_api
+    yield async_api
+    asyncio.run(async_api.db.close())
+
+# Call the ASGI application with a GET and return (status, headers, body)
+def asgi_get(application, path, query_string='', headers=()):
+    messages = []
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    async def send(message):
+        messages.append(message)
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query_string.encode(), 'headers': list(headers)}
+    asyncio.run(application(scope, receive, send))
+    start, body = messages[0], b''.join(message.get('body', b'') for message in messages[1:])
+    return start['status'], {name.decode(): value.decode() for name, value in start['headers']}, body
+
+def session_cookie(app, user_id, role):
+    value = app.app.session_interface.get_signing_serializer(app.app).dumps({'user_id': user_id, 'role': role})
+    return (b'cookie', f"{app.app.config['SESSION_COOKIE_NAME']}={value}".encode())
+
+# The same GET through the ASGI app and the Flask test client, which must agree
+def assert_same_response(async_api, client, cookie, path, query_string='', headers=()):
+    status, async_headers, body = asgi_get(async_api.application, path, query_string,
+                                           [cookie, *((name.lower().encode(), value.encode()) for name, value in headers)])
+    response = client.get(path, query_string=query_string, headers=dict(headers))
+    assert status == response.status_code, (path, query_string)
+    if status == 302:
+        assert async_headers['location'] == response.headers['Location']
+        return status, body
+    assert body == response.get_data(), (path, query_string)
+    for header in ('content-type', 'etag', 'cache-control'):
+        assert async_headers.get(header) == response.headers.get(header), (path, header)
+    return status, body
+
+# A doctor and a day holding a shared slot and two single bookings, none of them the
+# first patient's, which is who client_for() logs in
+@pytest.fixture(scope='module')
+def booked_day(app_module):
+    app = app_module
+    with app.app.app_context():
+        patients = [row['id'] for row in app.query_db("SELECT id FROM users WHERE role = 'patient' ORDER BY id LIMIT 3")]
+        doctor = app.query_db("SELECT id, department_id FROM doctors ORDER BY id LIMIT 1 OFFSET 5", one=True)
+        day = app.today_day() + 50
+        book_rows(app, doctor['id'], day, [(patients[1], SLOT_MINUTES[0]), (patients[1], SLOT_MINUTES[1]),
+                                           (patients[2], SLOT_MINUTES[2]), (patients[2], SLOT_MINUTES[0])])
+    return doctor, day
+
+def test_slot_endpoints_match_the_flask_routes(app_module, async_api, booked_day):
+    app = app_module
+    doctor, day = booked_day
+    client = client_for(app, 'patient')
+    cookie = session_cookie(app, client.user_id, 'patient')
+    date = format_day(day)
+
+    cases = [
+        ('/get_available_slots', f"doctor_id={doctor['id']}&date={date}"),
+        ('/get_available_slots', f"doctor_id={doctor['id']}&date={format_day(day + 1)}"),
+        ('/get_available_slots', f"doctor_id={doctor['id']}&date=31/31/2025"),
+        ('/get_available_slots', f"doctor_id={doctor['id']}"),
+        *(('/check_slot', f"doctor_id={doctor['id']}&date={date}&time={format_slot(slot)}") for slot in SLOT_MINUTES[:4]),
+        ('/check_slot', f"doctor_id={doctor['id']}&date={date}&time=25:00"),
+        ('/check_slot', f"doctor_id={doctor['id']}&date={date}"),
+        ('/get_availability', f"doctor_id={doctor['id']}&start={format_day(day - 3)}&end={format_day(day + 3)}"),
+        ('/get_availability', f"department_id={doctor['department_id']}&start={date}&end={format_day(day + 1)}"),
+        ('/get_availability', f"doctor_id={doctor['id']}&start={date}&end={format_day(day + 400)}"),
+        ('/get_availability', f"doctor_id={doctor['id']}&start=bad"),
+        ('/get_availability', "department_id=999999"),
+        ('/get_availability', ""),
+    ]
+    statuses = set()
+    # Cold and then warm slot_occupancy: a cached day answers like a fresh read
+    for warm in (False, True):
+        if not warm:
+            app.slot_occupancy.invalidate()
+        for path, query_string in cases:
+            statuses.add(assert_same_response(async_api, client, cookie, path, query_string)[0])
+    assert statuses == {200, 400}
+
+def test_dropdowns_and_revalidation_match_the_flask_routes(app_module, async_api, booked_day):
+    app = app_module
+    doctor, _ = booked_day
+    client = app.app.test_client()
+    cookie = (b'cookie', b'')
+    for path in (f"/get_doctors/{doctor['department_id']}", "/get_doctors/999999", "/get_departments/1"):
+        status, _ = assert_same_response(async_api, client, cookie, path)
+        assert status == 200
+        etag = client.get(path).headers['ETag']
+        status, body = assert_same_response(async_api, client, cookie, path, headers=[('If-None-Match', etag)])
+        assert (status, body) == (304, b'')
+
+def test_slot_endpoints_redirect_without_a_patient_session(app_module, async_api):
+    app = app_module
+    admin = client_for(app, 'admin')
+    for client, cookie in [(app.app.test_client(), (b'cookie', b'')), (admin, session_cookie(app, admin.user_id, 'admin'))]:
+        for path in ('/get_available_slots', '/check_slot', '/get_availability'):
+            status, _ = assert_same_response(async_api, client, cookie, path, "doctor_id=1&date=2030-01-01&time=09:00")
+            assert status == 302
+
+def test_other_paths_fall_through_to_flask(app_module, async_api):
+    pytest.importorskip('asgiref')
+    status, _, body = asgi_get(async_api.application, '/login')
+    assert status == 200
+    assert body == app_module.app.test_client().get('/login').get_data()
@@ -0,0 +1,37 @@
+import pytest
+from appointment_time import format_day, today_day
+
+@pytest.fixture
+def patient_client(app_module):
+    with app_module.app.app_context():
+        patient = app_module.query_db("SELECT id FROM users WHERE role = 'patient' ORDER BY id LIMIT 1", one=True)
+        doctor = app_module.query_db("SELECT id FROM doctors ORDER BY id LIMIT 1", one=True)
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = patient['id']
+        sess['role'] = 'patient'
+    client.doctor_id = doctor['id']
+    return client
+
+def test_availability_lists_bookable_days(patient_client):
+    today = today_day()
+    response = patient_client.get('/get_availability', query_string={
+        'doctor_id': patient_client.doctor_id, 'start': format_day(today), 'end': format_day(today + 2)
+    })
+    assert response.status_code == 200
+    assert list(response.get_json()['doctors'][0]['days']) == [format_day(day) for day in range(today, today + 3)]
+
+def test_availability_rejects_range_in_the_past(patient_client):
+    today = today_day()
+    response = patient_client.get('/get_availability', query_string={
+        'doctor_id': patient_client.doctor_id, 'start': format_day(today - 10), 'end': format_day(today - 3)
+    })
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+def test_availability_rejects_unknown_doctor(patient_client, app_module):
+    with app_module.app.app_context():
+        unknown = app_module.query_db("SELECT MAX(id) AS id FROM doctors", one=True)['id'] + 1000
+    response = patient_client.get('/get_availability', query_string={'doctor_id': unknown})
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'Unknown doctor'}
@@ -0,0 +1,40 @@
+import joblib
+import numpy as np
+from conftest import synthetic_data
+from model import no_show_model
+from model.no_show_model import MODEL_FILES, compile_random_forest, compile_xgboost, export_probability_table
+
+def evaluation_rows():
+    X, _ = synthetic_data(n=500, seed=1)
+    # Values sitting on and between the split thresholds as well as outside the training range
+    edges = np.array([[0, 0, 0, 0, 0], [7, 119, 1, 1, 1], [20, 365, 1, 0, 1], [3.5, 59.5, 0, 1, 0]], dtype=np.float64)
+    return np.vstack([X, edges])
+
+def test_compiled_random_forest_matches_predict_proba(synthetic_models):
+    X = evaluation_rows()
+    for target in ('no_show', 'reschedule'):
+        rf = synthetic_models[f'rf_{target}']
+        compiled = compile_random_forest(rf)
+        np.testing.assert_allclose(compiled.predict_proba(X), rf.predict_proba(X), rtol=0, atol=1e-6)
+
+def test_compiled_xgboost_matches_predict_proba(synthetic_models):
+    X = evaluation_rows()
+    for target in ('no_show', 'reschedule'):
+        xgb = synthetic_models[f'xgb_{target}']
+        compiled = compile_xgboost(xgb)
+        np.testing.assert_allclose(compiled.predict_proba(X), xgb.predict_proba(X), rtol=0, atol=1e-6)
+
+def test_probability_table_matches_compiled_models(synthetic_models, tmp_path):
+    for name, model in synthetic_models.items():
+        joblib.dump(model, tmp_path / MODEL_FILES[name])
+    table = export_probability_table(synthetic_models, model_dir=str(tmp_path), max_no_shows=10)
+    compiled = no_show_model.compile_models(synthetic_models)
+
+    X = evaluation_rows()
+    X = X[table.covers(X)]
+    assert len(X) > 500
+    no_show_probs, reschedule_probs = table.lookup(X)
+    for target, probs in (('no_show', no_show_probs), ('reschedule', reschedule_probs)):
+        expected = (compiled[f'rf_{target}'].predict_proba(X)[:, 1] + compiled[f'xgb_{target}'].predict_proba(X)[:, 1]) / 2 * 100
+        # The table is in percent, so 1e-4 here is 1e-6 in probability
+        np.testing.assert_allclose(probs, expected, rtol=0, atol=1e-4)
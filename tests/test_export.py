@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+import pytest
+from conftest import client_for
+
+# changed_at() reads this clock, so writes and the export's settle cutoff can be placed
+# on either side of a cursor without waiting
+@pytest.fixture
+def clock(app_module, monkeypatch):
+    now = [app_module.changed_at() + 10000]
+    monkeypatch.setattr(app_module, 'changed_at', lambda: now[0])
+    return now
+
+def export(client, **args):
+    response = client.get('/export/appointments', query_string=dict(args, format='ndjson'))
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def cursor(rows):
+    return f"{rows[-1]['updated_at']}:{rows[-1]['id']}"
+
+def test_since_cursor_returns_only_rows_updated_after_it(app_module, clock):
+    app = app_module
+    admin = client_for(app, 'admin')
+    first = export(admin)
+    assert first
+    assert [(row['updated_at'], row['id']) for row in first] == sorted((row['updated_at'], row['id']) for row in first)
+    since = cursor(first)
+    assert export(admin, since=since) == []
+
+    with app.app.app_context():
+        scheduled = [row['id'] for row in app.query_db("SELECT id FROM appointments WHERE status = 'scheduled' ORDER BY id LIMIT 3")]
+    clock[0] += 1
+    admin.post(f"/mark_attended/{scheduled[0]}")
+    admin.post(f"/close_appt/{scheduled[1]}")
+    clock[0] += app.EXPORT_SETTLE_SECONDS + 1
+    # Written inside the settle window, so held back until a later run
+    admin.post(f"/mark_attended/{scheduled[2]}")
+
+    second = export(admin, since=since)
+    assert [(row['id'], row['status']) for row in second] == [(scheduled[0], 'attended'), (scheduled[1], 'closed')]
+    assert all(row['updated_at'] > first[-1]['updated_at'] for row in second)
+
+    clock[0] += app.EXPORT_SETTLE_SECONDS + 1
+    third = export(admin, since=cursor(second))
+    assert [(row['id'], row['status']) for row in third] == [(scheduled[2], 'attended')]
+    assert export(admin, since=cursor(third)) == []
+
+def test_export_filters_and_csv(app_module, clock):
+    app = app_module
+    admin = client_for(app, 'admin')
+    response = admin.get('/export/appointments', query_string={'status': 'closed'})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename="appointments.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert rows and {row['status'] for row in rows} == {'closed'}
+    assert list(rows[0]) == app.EXPORT_FIELDS
+
+@pytest.mark.parametrize('args', [{'format': 'xml'}, {'since': 'yesterday'}, {'date_from': '31/31/2025'}])
+def test_export_rejects_bad_arguments(app_module, args):
+    response = client_for(app_module, 'admin').get('/export/appointments', query_string=args)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
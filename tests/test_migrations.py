@@ -0,0 +1,88 @@
+import os
+import shutil
+import sqlite3
+import pytest
+import migrations
+from appointment_time import to_day, to_slot_minute
+from conftest import REPO_ROOT
+
+# Legacy rows added to the shipped appointments, as (date, slot_time) and the
+# (appointment_day, slot_minute) migration 2 must turn them into
+EDGE_ROWS = [
+    (('2025-05-12', '12:00 PM'), (20220, 720)),
+    (('2025-05-12', '12:00 AM'), (20220, 0)),
+    (('05/13/2025', '13:00 PM'), (20221, 780)),
+    (('2025-05-14', '1:30 PM'), (20222, 810)),
+    (('2025-05-15', '08:00'), (20223, 480)),
+    (('2025-05-16', ' 9:00 am '), (20224, 540)),
+    (('not a date', 'noon'), (None, None)),
+    (('2025-05-17', '25:00'), (20225, None)),
+    ((None, None), (None, None)),
+]
+
+# database.db as shipped holds the baseline schema; migration 1 on top gives a v1 database
+@pytest.fixture
+def v1_database(tmp_path, monkeypatch):
+    path = tmp_path / 'v1.db'
+    shutil.copy(os.path.join(REPO_ROOT, 'database.db'), path)
+    conn = sqlite3.connect(path)
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:1])
+    assert migrations.apply_migrations(conn) == [1]
+    monkeypatch.undo()
+    edge_ids = []
+    for (date_text, slot_text), _ in EDGE_ROWS:
+        cursor = conn.execute(
+            "INSERT INTO appointments (patient_id, doctor_id, date, slot_time, status) VALUES (?, ?, ?, ?, ?)",
+            (1, 1, date_text, slot_text, 'scheduled')
+        )
+        edge_ids.append(cursor.lastrowid)
+    conn.commit()
+    yield conn, edge_ids
+    conn.close()
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def test_upgrade_from_v1_backfills_days_and_slots(v1_database):
+    conn, edge_ids = v1_database
+    legacy = dict(
+        (appt_id, (date_text, slot_text))
+        for appt_id, date_text, slot_text in conn.execute("SELECT id, date, slot_time FROM appointments")
+        if appt_id not in edge_ids
+    )
+    assert legacy
+
+    assert migrations.apply_migrations(conn) == [version for version, _, _ in migrations.MIGRATIONS[1:]]
+    assert migrations.schema_version(conn) == migrations.MIGRATIONS[-1][0]
+    assert not {'date', 'slot_time'} & columns(conn, 'appointments')
+    assert {'appointment_day', 'slot_minute', 'updated_at'} <= columns(conn, 'appointments')
+
+    upgraded = {appt_id: (day, minute) for appt_id, day, minute in conn.execute("SELECT id, appointment_day, slot_minute FROM appointments")}
+    for appt_id, (date_text, slot_text) in legacy.items():
+        assert upgraded[appt_id] == (to_day(date_text), to_slot_minute(slot_text)), appt_id
+    for appt_id, (_, expected) in zip(edge_ids, EDGE_ROWS):
+        assert upgraded[appt_id] == expected, appt_id
+
+    # Migration 5 counts patient_stats from the upgraded rows
+    recount = conn.execute("""SELECT patient_id, COUNT(*), SUM(status = 'no_show'), SUM(status = 'scheduled'), MAX(appointment_day)
+                              FROM appointments WHERE patient_id IS NOT NULL GROUP BY patient_id ORDER BY patient_id""").fetchall()
+    assert conn.execute("SELECT * FROM patient_stats ORDER BY patient_id").fetchall() == recount
+
+def test_upgrade_is_a_no_op_once_applied(v1_database):
+    conn, _ = v1_database
+    migrations.apply_migrations(conn)
+    before = conn.execute("SELECT id, appointment_day, slot_minute FROM appointments ORDER BY id").fetchall()
+    assert migrations.apply_migrations(conn) == []
+    assert conn.execute("SELECT id, appointment_day, slot_minute FROM appointments ORDER BY id").fetchall() == before
+
+@pytest.mark.parametrize('text, minute', [
+    ('12:00 PM', 720), ('12:00 AM', 0), ('12:30 am', 30), ('13:00 PM', 780), ('17:00 PM', 1020),
+    ('1:00 PM', 780), ('08:00 AM', 480), ('8:00 AM', 480), ('00:15', 15), ('23:59', 1439),
+])
+def test_to_slot_minute(text, minute):
+    assert to_slot_minute(text) == minute
+
+@pytest.mark.parametrize('text', ['24:00', '12:60', '13:00 XM', '9', '', 'noon', '1:5 PM'])
+def test_to_slot_minute_rejects(text):
+    with pytest.raises(ValueError):
+        to_slot_minute(text)
@@ -0,0 +1,64 @@
+import os
+import joblib
+import numpy as np
+import pytest
+from model import no_show_model
+from model.no_show_model import MODEL_FILES, ModelRegistry
+
+FEATURES = [2, 30, 1, 0, 0]
+
+def write_models(model_dir, models, names=MODEL_FILES):
+    for name in names:
+        joblib.dump(models[name], os.path.join(model_dir, MODEL_FILES[name]))
+
+# Move a file's mtime forward so the registry sees it as rewritten
+def touch_later(path, seconds=10):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 10**9))
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = ModelRegistry(model_dir=str(tmp_path), check_interval=0, backend='pickle')
+    monkeypatch.setattr(no_show_model, 'model_registry', registry)
+    return registry
+
+def test_missing_target_leaves_the_other_serving(registry, tmp_path, synthetic_models):
+    write_models(tmp_path, synthetic_models, ['rf_reschedule', 'xgb_reschedule'])
+
+    expected = (synthetic_models['rf_reschedule'].predict_proba([FEATURES])[0, 1]
+                + synthetic_models['xgb_reschedule'].predict_proba([FEATURES])[0, 1]) / 2 * 100
+    assert no_show_model.predict_reschedule(FEATURES) == pytest.approx(expected)
+    with pytest.raises(FileNotFoundError):
+        no_show_model.predict_no_show(FEATURES)
+    no_show_probs, reschedule_probs = no_show_model.score_appointments([FEATURES, FEATURES])
+    assert np.isnan(no_show_probs).all()
+    assert reschedule_probs == pytest.approx([expected, expected])
+    assert list(registry.stats()['unavailable']) == ['no_show']
+
+    # The missing pair turning up is picked up like any other change on disk
+    write_models(tmp_path, synthetic_models, ['rf_no_show', 'xgb_no_show'])
+    assert 0 <= no_show_model.predict_no_show(FEATURES) <= 100
+    assert registry.stats()['unavailable'] == {}
+
+def test_registry_reloads_when_a_model_file_changes(registry, tmp_path, synthetic_models):
+    write_models(tmp_path, synthetic_models)
+    first = registry.get()
+    assert registry.get() is first
+    before = no_show_model.predict_no_show(FEATURES)
+
+    # Swap the no-show pair for the reschedule one; only the mtime tells them apart
+    path = os.path.join(tmp_path, MODEL_FILES['rf_no_show'])
+    joblib.dump(synthetic_models['rf_reschedule'], path)
+    touch_later(path)
+    second = registry.get()
+    assert second is not first
+    assert second.version != first.version
+    assert registry.reload_count == 2
+    assert no_show_model.predict_no_show(FEATURES) != pytest.approx(before)
+
+def test_registry_keeps_serving_a_target_whose_files_disappear(registry, tmp_path, synthetic_models):
+    write_models(tmp_path, synthetic_models)
+    loaded = registry.get()
+    os.remove(os.path.join(tmp_path, MODEL_FILES['xgb_no_show']))
+    assert registry.get() is loaded
+    assert 0 <= no_show_model.predict_no_show(FEATURES) <= 100
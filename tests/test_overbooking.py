@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from appointment_time import SLOT_MINUTES
+from overbooking import simulate_day, recommend_capacity, arrival_distribution
+
+# One booking per slot at these risks: a slot never sees more than one patient
+SINGLE_BOOKINGS = [(slot, prob) for slot, prob in zip(SLOT_MINUTES, [10.0, 35.0, 72.5, 5.0, 50.0, 20.0])]
+
+def test_no_overflow_is_reported_as_zero():
+    report = simulate_day(SINGLE_BOOKINGS, runs=3000, seed=7)
+    assert report['expected_overflow_patients'] == 0.0
+    assert report['overflow_probability'] == 0.0
+    # Attendance less the slots seen rounds to -1.2e-15 for this day
+    assert simulate_day([(SLOT_MINUTES[0], 67.1)], runs=1000, seed=52)['expected_overflow_patients'] == 0.0
+    empty = simulate_day([], runs=100, seed=7)
+    assert empty['expected_overflow_patients'] == 0.0
+    assert empty['expected_idle_slots'] == len(SLOT_MINUTES)
+
+def test_seeded_day_matches_the_expected_values():
+    first, second = SLOT_MINUTES[0], SLOT_MINUTES[1]
+    bookings = [(first, 20.0), (first, 40.0), (first, 0.0), (second, 50.0), (second, None), (SLOT_MINUTES[2], 100.0)]
+    report = simulate_day(bookings, runs=20000, seed=3)
+    assert report == simulate_day(bookings, runs=20000, seed=3)
+
+    shows = [0.8, 0.6, 1.0, 0.5, 1.0, 0.0]
+    assert report['bookings'] == 6
+    assert report['new_no_show_prob'] == round(np.mean([20, 40, 0, 50, 0, 100]), 2)
+    assert report['expected_attendance'] == pytest.approx(sum(shows), abs=0.03)
+    # Patients beyond the first in a slot: 0.8 + 0.6 in the first (someone always comes),
+    # and the half chance that the 50% booking joins the sure one in the second
+    assert report['expected_overflow_patients'] == pytest.approx(0.8 + 0.6 + 0.5, abs=0.03)
+    assert report['expected_idle_slots'] == len(SLOT_MINUTES) - 2
+    slots = {slot['slot_minute']: slot for slot in report['slots']}
+    assert slots[first]['bookings'] == 3
+    assert slots[first]['combined_no_show_prob'] == 60.0
+    assert slots[first]['overflow_probability'] == pytest.approx(1 - 0.2 * 0.4, abs=0.01)
+    assert slots[second]['overflow_probability'] == pytest.approx(0.5, abs=0.01)
+    assert slots[SLOT_MINUTES[2]]['idle_probability'] == 1.0
+    # The day overflows unless the first slot's two risky bookings and the 50% one all miss
+    assert report['overflow_probability'] == pytest.approx(1 - 0.2 * 0.4 * 0.5, abs=0.01)
+
+def test_recommended_capacity_respects_the_target():
+    # Empty slots and patients who always come: room for exactly one
+    attendance = np.zeros((10, len(SLOT_MINUTES)), dtype=np.int64)
+    bookings = np.zeros(len(SLOT_MINUTES), dtype=np.int64)
+    capacity = recommend_capacity(arrival_distribution(attendance), bookings, 0.0, target=0.1)
+    assert (capacity == 1).all()
+    # Patients who come one time in ten: a second booking overflows 1% of the time
+    capacity = recommend_capacity(arrival_distribution(attendance), bookings, 90.0, target=0.1, max_capacity=3)
+    assert (capacity == 3).all()
+    # A slot already over the target keeps its bookings
+    crowded = bookings.copy()
+    crowded[0] = 2
+    attendance[:, 0] = 2
+    assert recommend_capacity(arrival_distribution(attendance), crowded, 0.0, target=0.1)[0] == 2
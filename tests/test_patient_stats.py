@@ -0,0 +1,76 @@
+from appointment_time import format_day, format_slot, SLOT_MINUTES
+from conftest import client_for
+
+RECOUNT_QUERY = """SELECT patient_id, COUNT(*) AS total_appointments,
+                          SUM(CASE WHEN status = 'no_show' THEN 1 ELSE 0 END) AS no_show_count,
+                          SUM(CASE WHEN status = 'scheduled' THEN 1 ELSE 0 END) AS scheduled_count,
+                          MAX(appointment_day) AS last_appointment_day
+                   FROM appointments WHERE patient_id IS NOT NULL GROUP BY patient_id"""
+
+def assert_stats_match_recount(app):
+    recount = {row['patient_id']: row for row in app.query_db(RECOUNT_QUERY)}
+    stats = {row['patient_id']: row for row in app.query_db("SELECT * FROM patient_stats")}
+    assert set(stats) == set(recount)
+    for patient_id, row in recount.items():
+        kept = stats[patient_id]
+        for column in ('total_appointments', 'no_show_count', 'scheduled_count'):
+            assert kept[column] == row[column], (patient_id, column)
+        # An upper bound: moving an appointment earlier leaves it where it was
+        assert kept['last_appointment_day'] >= row['last_appointment_day'], patient_id
+
+def free_slot(app, doctor_id, day):
+    taken = {row['slot_minute'] for row in app.query_db(app.DAY_APPOINTMENTS_QUERY, (doctor_id, day))}
+    return next(slot for slot in SLOT_MINUTES if slot not in taken)
+
+def test_patient_stats_follow_appointment_writes(app_module, scoring_models):
+    app = app_module
+    patient = client_for(app, 'patient')
+    admin = client_for(app, 'admin')
+    with app.app.app_context():
+        doctor = app.query_db("SELECT id, hospital_id, department_id FROM doctors ORDER BY id LIMIT 1", one=True)
+        day = app.today_day() + 20
+        slot = free_slot(app, doctor['id'], day)
+        before = app.query_db("SELECT COUNT(*) AS n FROM appointments WHERE patient_id = ?", (patient.user_id,), one=True)['n']
+
+    patient.post('/book', data={
+        'hospital': doctor['hospital_id'], 'department': doctor['department_id'], 'doctor': doctor['id'],
+        'date': format_day(day), 'time': format_slot(slot)
+    })
+    with app.app.app_context():
+        booked = app.query_db(
+            "SELECT id FROM appointments WHERE patient_id = ? AND doctor_id = ? AND appointment_day = ? AND slot_minute = ?",
+            (patient.user_id, doctor['id'], day, slot), one=True
+        )
+        assert booked
+        assert app.query_db("SELECT total_appointments FROM patient_stats WHERE patient_id = ?", (patient.user_id,), one=True)['total_appointments'] == before + 1
+        scheduled = app.query_db("SELECT id FROM appointments WHERE status = 'scheduled' AND id != ? ORDER BY id LIMIT 2", (booked['id'],))
+        new_day = day + 3
+        new_slot = free_slot(app, doctor['id'], new_day)
+
+    admin.post(f"/mark_attended/{scheduled[0]['id']}")
+    admin.post(f"/close_appt/{scheduled[1]['id']}")
+    admin.post(f"/reschedule/{booked['id']}", data={'date': format_day(new_day), 'time': format_slot(new_slot)})
+
+    with app.app.app_context():
+        statuses = {
+            row['id']: (row['status'], row['appointment_day'])
+            for row in app.query_db("SELECT id, status, appointment_day FROM appointments WHERE id IN (?, ?, ?)",
+                                    (scheduled[0]['id'], scheduled[1]['id'], booked['id']))
+        }
+        assert statuses[scheduled[0]['id']][0] == 'attended'
+        assert statuses[scheduled[1]['id']][0] == 'closed'
+        assert statuses[booked['id']] == ('rescheduled', new_day)
+        assert_stats_match_recount(app)
+
+def test_init_db_only_rebuilds_empty_patient_stats(app_context):
+    app = app_context
+    patient_id = app.query_db("SELECT patient_id FROM patient_stats ORDER BY patient_id LIMIT 1", one=True)['patient_id']
+    app.query_db("UPDATE patient_stats SET total_appointments = total_appointments + 100 WHERE patient_id = ?", (patient_id,), commit=True)
+    app.init_db()
+    # A populated table is trusted as it is
+    assert app.query_db(RECOUNT_QUERY + " HAVING patient_id = ?", (patient_id,), one=True)['total_appointments'] + 100 == \
+        app.query_db("SELECT total_appointments FROM patient_stats WHERE patient_id = ?", (patient_id,), one=True)['total_appointments']
+
+    app.query_db("DELETE FROM patient_stats", commit=True)
+    app.init_db()
+    assert_stats_match_recount(app)
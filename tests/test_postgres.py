@@ -0,0 +1,99 @@
+import os
+import time
+import uuid
+import pytest
+from psycopg2 import pool as pg_pool
+from model import no_show_model
+
+# Runs against the PostgreSQL server named by DB_HOST and the other DB_* settings, in a
+# scratch table dropped afterwards; skipped when DB_HOST is not set
+requires_postgres = pytest.mark.skipif(not os.getenv("DB_HOST"), reason="DB_HOST and the DB_* settings name no PostgreSQL server")
+
+# dialect() caches by query text, and the SQLite tests fill that cache with queries
+# returned as they are, so it is emptied around each switch of DB_TYPE
+@pytest.fixture
+def postgres_dialect(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'DB_TYPE', 'postgresql')
+    app_module.dialect.cache_clear()
+    yield app_module
+    app_module.dialect.cache_clear()
+
+@pytest.fixture
+def pg_app(postgres_dialect, monkeypatch):
+    app = postgres_dialect
+    db_pool = app.PostgresConnectionPool(1, 2, 0.5, **app.PG_CONNECT_PARAMS)
+    monkeypatch.setattr(app, 'db_pool', db_pool)
+    table = f"pg_test_{uuid.uuid4().hex[:8]}"
+    conn = db_pool.getconn()
+    with conn.cursor() as c:
+        c.execute(f"CREATE TABLE {table} (id SERIAL PRIMARY KEY, name TEXT, note TEXT)")
+    conn.commit()
+    db_pool.putconn(conn)
+    try:
+        with app.app.app_context():
+            yield app, db_pool, table
+    finally:
+        conn = db_pool.getconn()
+        with conn.cursor() as c:
+            c.execute(f"DROP TABLE {table}")
+        conn.commit()
+        db_pool.putconn(conn)
+        db_pool.closeall()
+
+def test_dialect_translates_placeholders_outside_literals(postgres_dialect):
+    dialect = postgres_dialect.dialect
+    assert dialect("SELECT * FROM t WHERE a = ? AND b IN (?, ?)") == "SELECT * FROM t WHERE a = %s AND b IN (%s, %s)"
+    assert dialect("SELECT * FROM t WHERE note = '?' AND a = ?") == "SELECT * FROM t WHERE note = '?' AND a = %s"
+    assert dialect("SELECT * FROM t WHERE name LIKE 'x%' AND a = ?") == "SELECT * FROM t WHERE name LIKE 'x%%' AND a = %s"
+    assert dialect('SELECT "odd?col" FROM t WHERE a = ?') == 'SELECT "odd?col" FROM t WHERE a = %s'
+
+@requires_postgres
+def test_insert_returning_id(pg_app):
+    app, _, table = pg_app
+    row = app.query_db(f"INSERT INTO {table} (name, note) VALUES (?, ?) RETURNING id", ('a', 'n'), one=True, commit=True)
+    assert isinstance(row['id'], int)
+    assert app.query_db(f"SELECT name FROM {table} WHERE id = ?", (row['id'],), one=True) == {'name': 'a'}
+
+@requires_postgres
+def test_translated_query_runs(pg_app):
+    app, _, table = pg_app
+    for name, note in [('x1', '?'), ('x2', 'plain'), ('y1', '?')]:
+        app.query_db(f"INSERT INTO {table} (name, note) VALUES (?, ?)", (name, note), commit=True)
+    rows = app.query_db(f"SELECT name FROM {table} WHERE name LIKE 'x%' AND note = '?' AND id > ?", (0,))
+    assert rows == [{'name': 'x1'}]
+
+@requires_postgres
+def test_pool_waits_then_times_out_when_exhausted(pg_app):
+    _, db_pool, _ = pg_app
+    held = [db_pool.getconn(), db_pool.getconn()]
+    start = time.monotonic()
+    with pytest.raises(pg_pool.PoolError):
+        db_pool.getconn()
+    assert time.monotonic() - start >= 0.4
+    db_pool.putconn(held.pop())
+    held.append(db_pool.getconn())
+    for conn in held:
+        db_pool.putconn(conn)
+
+@requires_postgres
+def test_iter_query_streams_through_a_server_side_cursor(pg_app):
+    app, _, table = pg_app
+    app.execute_many(f"INSERT INTO {table} (name, note) VALUES (?, ?)", [(f"r{i:02d}", 'n') for i in range(25)])
+    with app.unit_of_work() as conn:
+        rows = app.iter_query(f"SELECT id, name FROM {table} ORDER BY id", chunk_size=10)
+        first = next(rows)
+        with conn.cursor() as c:
+            c.execute("SELECT name FROM pg_cursors WHERE name LIKE 'stream_%'")
+            assert c.fetchall()
+        names = [first['name']] + [row['name'] for row in rows]
+    assert names == [f"r{i:02d}" for i in range(25)]
+
+@requires_postgres
+def test_read_sql_chunks_reads_in_chunks(pg_app, monkeypatch):
+    app, _, table = pg_app
+    app.execute_many(f"INSERT INTO {table} (name, note) VALUES (?, ?)", [(f"r{i:02d}", 'n') for i in range(25)])
+    monkeypatch.setattr(no_show_model, 'DB_TYPE', 'postgresql')
+    frames = list(no_show_model.read_sql_chunks(f"SELECT name FROM {table} WHERE id > ? ORDER BY id", (0,), chunksize=10))
+    assert [len(frame) for frame in frames] == [10, 10, 5]
+    empty = list(no_show_model.read_sql_chunks(f"SELECT name FROM {table} WHERE id < ?", (0,), chunksize=10))
+    assert len(empty) == 1 and empty[0].empty
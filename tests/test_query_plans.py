@@ -0,0 +1,17 @@
+import os
+import pytest
+from conftest import REPO_ROOT
+import check_query_plans
+
+# Every hot query must be served by an index on the shipped database once migrated
+@pytest.fixture(scope='module')
+def plans():
+    conn, explain = check_query_plans.open_database("sqlite", os.path.join(REPO_ROOT, "database.db"))
+    try:
+        return {name: scans for name, _, scans in check_query_plans.check_plans(conn, explain)}
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize('name', [name for name, _, _ in check_query_plans.QUERIES])
+def test_query_uses_an_index(plans, name):
+    assert not plans[name], f"{name} scans {plans[name]}"
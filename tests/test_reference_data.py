@@ -0,0 +1,77 @@
+import json
+from conftest import client_for
+
+def first_department(app):
+    with app.app.app_context():
+        return app.query_db("SELECT id, hospital_id FROM departments ORDER BY id LIMIT 1", one=True)
+
+def test_dropdowns_answer_304_for_a_matching_etag(app_module):
+    app = app_module
+    client = app.app.test_client()
+    department = first_department(app)
+    for url in (f"/get_departments/{department['hospital_id']}", f"/get_doctors/{department['id']}", "/get_departments/999999"):
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert etag
+        assert 'max-age' in response.headers['Cache-Control']
+
+        cached = client.get(url, headers={'If-None-Match': etag})
+        assert cached.status_code == 304
+        assert cached.get_data() == b''
+        assert cached.headers['ETag'] == etag
+        assert client.get(url, headers={'If-None-Match': '"stale"'}).status_code == 200
+
+def test_dropdowns_match_the_database(app_module):
+    app = app_module
+    client = app.app.test_client()
+    department = first_department(app)
+    with app.app.app_context():
+        doctors = app.query_db("SELECT id, name FROM doctors WHERE department_id = ? ORDER BY id", (department['id'],))
+    assert json.loads(client.get(f"/get_doctors/{department['id']}").get_data()) == [[doc['id'], doc['name']] for doc in doctors]
+
+def test_admin_reload_serves_changed_reference_data(app_module):
+    app = app_module
+    client = app.app.test_client()
+    admin = client_for(app, 'admin')
+    department = first_department(app)
+    url = f"/get_doctors/{department['id']}"
+    response = client.get(url)
+    etag = response.headers['ETag']
+
+    with app.app.app_context(), app.unit_of_work():
+        doctor_id = app.query_db(
+            "INSERT INTO doctors (hospital_id, department_id, name) VALUES (?, ?, ?) RETURNING id",
+            (department['hospital_id'], department['id'], 'Dr Added'), one=True, commit=True
+        )['id']
+    try:
+        # Until the cache is told, the dropdown keeps its snapshot and its ETag
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        loads = app.reference_data.load_count
+        stats = admin.get('/debug_reference_data?reload=1').get_json()
+        assert stats['load_count'] == loads + 1
+        refreshed = client.get(url, headers={'If-None-Match': etag})
+        assert refreshed.status_code == 200
+        assert refreshed.headers['ETag'] != etag
+        assert [doctor_id, 'Dr Added'] in json.loads(refreshed.get_data())
+        assert doctor_id in app.reference_data.get().known_doctor_ids
+    finally:
+        with app.app.app_context():
+            app.query_db("DELETE FROM doctors WHERE id = ?", (doctor_id,), commit=True)
+        app.reference_data.invalidate()
+
+    restored = client.get(url, headers={'If-None-Match': etag})
+    assert restored.status_code == 304
+
+def test_invalidate_reloads_once_on_next_use(app_context):
+    app = app_context
+    cache = app.ReferenceDataCache(ttl=300)
+    first = cache.get()
+    assert cache.get() is first
+    cache.invalidate()
+    assert cache.current() is None
+    second = cache.get()
+    assert second is not first
+    assert cache.get() is second
+    assert cache.load_count == 2
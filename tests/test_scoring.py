@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from conftest import synthetic_data
+from model import no_show_model
+
+def scoring_rows():
+    X, _ = synthetic_data(n=300, seed=2)
+    return X
+
+def ensemble_percent(models, target, X):
+    return (models[f'rf_{target}'].predict_proba(X)[:, 1] + models[f'xgb_{target}'].predict_proba(X)[:, 1]) / 2 * 100
+
+def test_batch_scores_match_per_row_scores(scoring_models, synthetic_models):
+    X = scoring_rows()
+    no_show_probs, reschedule_probs = no_show_model.score_appointments(X)
+    assert no_show_probs.shape == reschedule_probs.shape == (len(X),)
+
+    per_row = np.array([no_show_model.score_appointment(row) for row in X.tolist()])
+    np.testing.assert_allclose(no_show_probs, per_row[:, 0], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(reschedule_probs, per_row[:, 1], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(no_show_probs, ensemble_percent(synthetic_models, 'no_show', X), rtol=0, atol=1e-9)
+    np.testing.assert_allclose(reschedule_probs, ensemble_percent(synthetic_models, 'reschedule', X), rtol=0, atol=1e-9)
+
+    # The single-target batch helpers and plain lists give the same numbers
+    np.testing.assert_array_equal(no_show_model.predict_no_show_batch(X.tolist()), no_show_probs)
+    np.testing.assert_array_equal(no_show_model.predict_reschedule_batch(X), reschedule_probs)
+
+def test_batch_scoring_accepts_empty_and_single_rows(scoring_models):
+    no_show_probs, reschedule_probs = no_show_model.score_appointments([])
+    assert no_show_probs.shape == reschedule_probs.shape == (0,)
+    row = scoring_rows()[0].tolist()
+    single = no_show_model.score_appointments(row)
+    assert [float(probs[0]) for probs in single] == pytest.approx(no_show_model.score_appointment(row))
+
+def test_one_pass_scores_both_targets_quietly(scoring_models, capsys):
+    X = scoring_rows()
+    snapshot = scoring_models.get()
+    calls = {}
+    for name, model in snapshot.models.items():
+        def counted(X, name=name, predict_proba=model.predict_proba):
+            calls[name] = calls.get(name, 0) + 1
+            return predict_proba(X)
+        model.predict_proba = counted
+    try:
+        no_show_model.score_appointments(X)
+        # Each of the four models sees the whole batch once
+        assert calls == dict.fromkeys(no_show_model.MODEL_FILES, 1)
+
+        row = X[0].tolist()
+        assert no_show_model.score_appointment(row) == pytest.approx(
+            (no_show_model.predict_no_show(row), no_show_model.predict_reschedule(row)))
+    finally:
+        for model in snapshot.models.values():
+            del model.predict_proba
+    assert capsys.readouterr() == ('', '')
+
+# Registry serving exported artifacts: compiled arrays plus a probability table capped
+# at 10 previous no-shows
+@pytest.fixture
+def table_models(tmp_path, monkeypatch, synthetic_models):
+    import joblib
+    for name, model in synthetic_models.items():
+        joblib.dump(model, tmp_path / no_show_model.MODEL_FILES[name])
+    no_show_model.export_compiled_models(synthetic_models, model_dir=str(tmp_path))
+    no_show_model.export_probability_table(synthetic_models, model_dir=str(tmp_path), max_no_shows=10)
+    registry = no_show_model.ModelRegistry(model_dir=str(tmp_path), backend='auto')
+    monkeypatch.setattr(no_show_model, 'model_registry', registry)
+    return registry
+
+def test_table_and_live_rows_score_alike(table_models, synthetic_models):
+    snapshot = table_models.get()
+    assert snapshot.backend == 'compiled'
+    assert snapshot.table is not None
+
+    # Rows the table answers mixed with rows past its bounds that fall back to the ensemble
+    outside = np.array([[3, 400, 1, 0, 1], [2.5, 30, 0, 1, 0], [0, 30, 0.5, 1, 0], [25, 10, 1, 1, 1]], dtype=np.float64)
+    X = np.vstack([scoring_rows(), outside])
+    covered = snapshot.table.covers(X)
+    assert covered[:-len(outside)].all() and not covered[-len(outside):-1].any()
+
+    no_show_probs, reschedule_probs = no_show_model.score_appointments(X)
+    np.testing.assert_allclose(no_show_probs, ensemble_percent(synthetic_models, 'no_show', X), rtol=0, atol=1e-4)
+    np.testing.assert_allclose(reschedule_probs, ensemble_percent(synthetic_models, 'reschedule', X), rtol=0, atol=1e-4)
+    per_row = np.array([no_show_model.score_appointments(row) for row in X.tolist()])[:, :, 0]
+    np.testing.assert_allclose(per_row[:, 0], no_show_probs, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(per_row[:, 1], reschedule_probs, rtol=0, atol=1e-9)
@@ -0,0 +1,61 @@
+from appointment_time import format_day, format_slot
+from conftest import client_for
+from test_appointment_batch import assert_occupancy_matches_db, book_rows
+from test_patient_stats import free_slot
+
+def test_occupancy_follows_book_close_and_reschedule(app_module, scoring_models):
+    app = app_module
+    patient = client_for(app, 'patient')
+    admin = client_for(app, 'admin')
+    with app.app.app_context():
+        doctor = app.query_db("SELECT id, hospital_id, department_id FROM doctors ORDER BY id LIMIT 1 OFFSET 1", one=True)
+        first_day = app.today_day() + 30
+        last_day = first_day + 5
+        # Cache every day the writes below touch before making them
+        assert_occupancy_matches_db(app, doctor['id'], first_day, last_day)
+
+    booked = []
+    for day in (first_day, first_day, first_day + 1):
+        with app.app.app_context():
+            slot = free_slot(app, doctor['id'], day)
+        patient.post('/book', data={
+            'hospital': doctor['hospital_id'], 'department': doctor['department_id'], 'doctor': doctor['id'],
+            'date': format_day(day), 'time': format_slot(slot)
+        })
+        with app.app.app_context():
+            booked.append(app.query_db(
+                "SELECT id FROM appointments WHERE doctor_id = ? AND appointment_day = ? AND slot_minute = ? AND patient_id = ?",
+                (doctor['id'], day, slot, patient.user_id), one=True
+            )['id'])
+            assert_occupancy_matches_db(app, doctor['id'], first_day, last_day)
+
+    admin.post(f"/close_appt/{booked[0]}")
+    with app.app.app_context():
+        assert_occupancy_matches_db(app, doctor['id'], first_day, last_day)
+        new_day = last_day
+        new_slot = free_slot(app, doctor['id'], new_day)
+    admin.post(f"/reschedule/{booked[1]}", data={'date': format_day(new_day), 'time': format_slot(new_slot)})
+    with app.app.app_context():
+        assert app.query_db("SELECT appointment_day FROM appointments WHERE id = ?", (booked[1],), one=True)['appointment_day'] == new_day
+        assert_occupancy_matches_db(app, doctor['id'], first_day, last_day)
+
+def test_probability_backfill_keeps_occupancy_in_sync(app_module, scoring_models):
+    import fix_appointments
+    app = app_module
+    with app.app.app_context():
+        doctor_id = app.query_db("SELECT id FROM doctors ORDER BY id LIMIT 1 OFFSET 2", one=True)['id']
+        hospital_id = app.query_db("SELECT id FROM hospitals ORDER BY id LIMIT 1", one=True)['id']
+        patient_id = app.query_db("SELECT id FROM users WHERE role = 'patient' ORDER BY id LIMIT 1", one=True)['id']
+        first_day = app.today_day() + 40
+        booked = book_rows(app, doctor_id, first_day, [(patient_id, free_slot(app, doctor_id, first_day))])
+        app.query_db("UPDATE appointments SET hospital_id = ?, no_show_prob = NULL, reschedule_prob = NULL WHERE id = ?",
+                     (hospital_id, booked[0]['id']), commit=True)
+        # Cache the day while the appointment counts no no-show chance; the backfill has to add it
+        app.slot_occupancy.get(doctor_id, first_day)
+
+    fix_appointments.recalculate_probabilities()
+
+    with app.app.app_context():
+        row = app.query_db("SELECT no_show_prob FROM appointments WHERE id = ?", (booked[0]['id'],), one=True)
+        assert row['no_show_prob'] is not None
+        assert_occupancy_matches_db(app, doctor_id, first_day, first_day)
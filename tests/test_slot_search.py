@@ -0,0 +1,108 @@
+from appointment_time import SLOT_MINUTES
+
+# Reference for find_available_slot's placements: the slot-by-slot search it replaced,
+# one query and one history read per day and slot, with the reschedule rules. The first
+# slot in day and slot order a patient may take is the answer, wherever in the horizon
+# it falls.
+def per_slot_search(app, doctor_id, current_day, patient_id, max_attempts=7, pending=None):
+    max_appointments_per_slot = 2
+    combined_no_show_threshold = 50.0
+    priority_threshold = 0.7
+    for days_ahead in range(1, max_attempts + 1):
+        new_day = current_day + days_ahead
+        existing_appts = app.query_db(
+            "SELECT slot_minute, patient_id, no_show_prob FROM appointments WHERE doctor_id = ? AND appointment_day = ? AND status != 'closed'",
+            (doctor_id, new_day)
+        )
+        if pending:
+            existing_appts = existing_appts + pending.get((doctor_id, new_day), [])
+        booked_slots = {}
+        for appt in existing_appts:
+            booked_slots.setdefault(appt['slot_minute'], []).append(appt)
+        priority_score = app.calculate_priority_score(app.patient_no_show_history(patient_id, new_day))
+        if priority_score < priority_threshold:
+            continue
+        for slot in SLOT_MINUTES:
+            if slot not in booked_slots:
+                return new_day, slot
+            combined = sum(appt['no_show_prob'] or 0.0 for appt in booked_slots[slot])
+            if len(existing_appts) < max_appointments_per_slot and combined < combined_no_show_threshold:
+                return new_day, slot
+    return None, None
+
+def sample_appointments(app, step=7):
+    return app.query_db(
+        "SELECT doctor_id, appointment_day, patient_id, no_show_prob FROM appointments WHERE id % ? = 0 ORDER BY id",
+        (step,)
+    )
+
+def test_find_available_slot_matches_per_slot_search(app_context):
+    app = app_context
+    appts = sample_appointments(app)
+    assert appts
+    mismatches = []
+    for appt in appts:
+        for max_attempts in (1, 7):
+            args = (appt['doctor_id'], appt['appointment_day'], appt['patient_id'], max_attempts)
+            expected = per_slot_search(app, *args)
+            if app.find_available_slot(*args) != expected:
+                mismatches.append((args, expected))
+    assert not mismatches, mismatches[:5]
+
+def test_find_available_slot_matches_with_pending_slots(app_context):
+    app = app_context
+    # Hand out slots the way a sweep does, each search seeing the ones before it
+    expected_pending, pending = {}, {}
+    for appt in sample_appointments(app, step=3)[:300]:
+        args = (appt['doctor_id'], appt['appointment_day'], appt['patient_id'])
+        expected = per_slot_search(app, *args, pending=expected_pending)
+        placed = app.find_available_slot(*args, pending=pending)
+        assert placed == expected, args
+        if placed[0] is not None:
+            booking = {'slot_minute': placed[1], 'patient_id': appt['patient_id'], 'no_show_prob': appt['no_show_prob'] or 0.0}
+            for slots in (expected_pending, pending):
+                slots.setdefault((appt['doctor_id'], placed[0]), []).append(dict(booking))
+
+def test_find_available_slot_looks_past_a_taken_first_slot(app_context):
+    app = app_context
+    checked = 0
+    for appt in sample_appointments(app)[:200]:
+        day = appt['appointment_day'] + 1
+        if app.calculate_priority_score(app.patient_no_show_history(appt['patient_id'], day)) < app.PRIORITY_THRESHOLD:
+            continue
+        # Two bookings on the first slot fill the day's shared capacity, so the
+        # patient goes to the next free slot
+        pending = {(appt['doctor_id'], day): [
+            {'slot_minute': SLOT_MINUTES[0], 'patient_id': 0, 'no_show_prob': 10.0},
+            {'slot_minute': SLOT_MINUTES[0], 'patient_id': 0, 'no_show_prob': 10.0},
+        ]}
+        args = (appt['doctor_id'], appt['appointment_day'], appt['patient_id'])
+        placed = app.find_available_slot(*args, pending=pending)
+        assert placed == per_slot_search(app, *args, pending=pending)
+        assert placed[0] is not None and placed != (day, SLOT_MINUTES[0])
+        checked += 1
+    assert checked
+
+def test_batch_assignment_keeps_reschedule_rules(app_context):
+    app = app_context
+    today = app.today_day()
+    appts = app.query_db(
+        f"""SELECT a.id, a.patient_id, a.doctor_id, a.no_show_prob, {app.PATIENT_STATS_COLUMNS}
+            FROM appointments a LEFT JOIN patient_stats ps ON ps.patient_id = a.patient_id
+            WHERE a.id % 5 = 0 ORDER BY a.id LIMIT 400"""
+    )
+    for appt in appts:
+        appt['appointment_day'] = today + 30
+    assignments = app.assign_reschedule_slots(appts, today)
+    assert assignments
+    by_id = {appt['id']: appt for appt in appts}
+    for appt_id, (day, slot) in assignments.items():
+        appt = by_id[appt_id]
+        assert 1 <= day - appt['appointment_day'] <= app.SLOT_SEARCH_HORIZON_DAYS
+        assert app.calculate_priority_score(app.patient_no_show_history(appt['patient_id'], day)) >= app.PRIORITY_THRESHOLD
+    low_priority = [
+        appt['id'] for appt in appts
+        if app.calculate_priority_score(app.patient_no_show_history(appt['patient_id'], appt['appointment_day'] + 1)) < app.PRIORITY_THRESHOLD
+    ]
+    assert low_priority
+    assert not set(low_priority) & set(assignments)
@@ -0,0 +1,166 @@
+import os
+import shutil
+import sqlite3
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+import migrations
+from conftest import REPO_ROOT, synthetic_data
+from model import no_show_model
+from model.no_show_model import MODEL_FILES, ModelRegistry
+
+# Training reads database.db and writes model/ relative to the working directory (the
+# export defaults are bound to "model" at import), so each test runs in a scratch
+# directory holding a migrated copy of the seeded database
+@pytest.fixture
+def training_dir(tmp_path, monkeypatch):
+    shutil.copy(os.path.join(REPO_ROOT, 'database.db'), tmp_path)
+    conn = sqlite3.connect(tmp_path / 'database.db')
+    migrations.apply_migrations(conn)
+    conn.close()
+    (tmp_path / 'model').mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(no_show_model, 'DB_TYPE', 'sqlite')
+    return tmp_path
+
+def chunked(chunk_size):
+    chunks = list(no_show_model.iter_training_chunks(chunk_size=chunk_size))
+    ids = np.concatenate([ids for ids, _, _, _ in chunks])
+    X = pd.concat([X for _, X, _, _ in chunks], ignore_index=True)
+    y_no_show = np.concatenate([y for _, _, y, _ in chunks])
+    return chunks, ids, X, y_no_show
+
+def test_chunks_carry_patient_history_across_boundaries(training_dir):
+    chunks, ids, X, y_no_show = chunked(700)
+    assert len(chunks) > 3
+    assert all(len(chunk_ids) == 700 for chunk_ids, _, _, _ in chunks[:-1])
+
+    # One chunk holding everything is the reference for the history counts and labels
+    _, whole_ids, whole_X, whole_y = chunked(10**6)
+    np.testing.assert_array_equal(ids, whole_ids)
+    np.testing.assert_array_equal(X['previous_no_shows'], whole_X['previous_no_shows'])
+    np.testing.assert_array_equal(X.drop(columns='lead_time'), whole_X.drop(columns='lead_time'))
+    np.testing.assert_array_equal(y_no_show, whole_y)
+
+    data = no_show_model.load_data_from_db().sort_values(['patient_id', 'appointment_day', 'id'])
+    expected = no_show_model.count_previous_no_shows(data['patient_id'], no_show_model._day_dates(data['appointment_day']), data['status'])
+    np.testing.assert_array_equal(X['previous_no_shows'], expected)
+
+    # Lead times are seeded per chunk, so a second pass reads the same rows
+    np.testing.assert_array_equal(chunked(700)[2]['lead_time'], X['lead_time'])
+
+def test_streaming_training_publishes_servable_models(training_dir):
+    no_show_model.train_models_streaming(chunk_size=1500, sample_size=1500)
+
+    for filename in [*MODEL_FILES.values(), no_show_model.COMPILED_MODELS_FILE, no_show_model.PROBABILITY_TABLE_FILE]:
+        assert os.path.exists(training_dir / 'model' / filename), filename
+    assert no_show_model.read_checkpoint()['date'] == no_show_model.latest_outcome()['date']
+
+    snapshot = ModelRegistry(model_dir='model', backend='auto').get()
+    assert snapshot.backend == 'compiled'
+    assert snapshot.table is not None
+    assert not snapshot.unavailable
+    no_show_probs, reschedule_probs = no_show_model._score_snapshot(snapshot, np.array([[0, 10, 0, 1, 0], [5, 400, 1, 0, 1]], dtype=np.float64))
+    assert ((0 <= no_show_probs) & (no_show_probs <= 100)).all()
+    assert ((0 <= reschedule_probs) & (reschedule_probs <= 100)).all()
+
+def synthetic_frame(n=600):
+    X, y = synthetic_data(n=n, seed=4)
+    return pd.DataFrame(X, columns=no_show_model.FEATURE_COLS), pd.Series(y), pd.Series(1 - y)
+
+@pytest.mark.parametrize('cpu_budget, plan', [(1, (1, 1)), (3, (3, 1)), (8, (4, 2)), (16, (4, 4))])
+def test_worker_plan_stays_within_the_budget(cpu_budget, plan):
+    assert no_show_model._plan_workers(4, cpu_budget) == plan
+
+def test_parallel_fit_matches_the_in_process_fit():
+    X, y_no_show, y_reschedule = synthetic_frame()
+    serial, serial_tests, serial_timings = no_show_model.fit_models(X, y_no_show, y_reschedule, cpu_budget=1)
+    parallel, parallel_tests, parallel_timings = no_show_model.fit_models(X, y_no_show, y_reschedule, cpu_budget=2)
+
+    assert set(serial) == set(parallel) == set(MODEL_FILES)
+    for timings in (serial_timings, parallel_timings):
+        assert {'resample', 'fit', *(f'fit:{name}' for name in MODEL_FILES)} <= set(timings)
+    for target in ('no_show', 'reschedule'):
+        X_test, y_test = parallel_tests[target]
+        np.testing.assert_array_equal(X_test, serial_tests[target][0])
+        for kind in ('rf', 'xgb'):
+            name = f'{kind}_{target}'
+            np.testing.assert_allclose(parallel[name].predict_proba(X_test), serial[name].predict_proba(X_test), rtol=0, atol=1e-6)
+
+# The synthetic models deployed in the scratch model/, with a checkpoint 20 days before
+# the last outcome so a retrain has rows to fold in; returns the checkpoint
+@pytest.fixture
+def deployed(training_dir, synthetic_models):
+    for name, model in synthetic_models.items():
+        joblib.dump(model, training_dir / 'model' / MODEL_FILES[name])
+    conn = sqlite3.connect(training_dir / 'database.db')
+    last_day = conn.execute("SELECT MAX(appointment_day) FROM appointments").fetchone()[0]
+    day, appt_id = conn.execute(
+        "SELECT appointment_day, id FROM appointments WHERE appointment_day < ? ORDER BY appointment_day DESC, id DESC LIMIT 1",
+        (last_day - 20,)
+    ).fetchone()
+    conn.close()
+    no_show_model.write_checkpoint({'date': no_show_model._day_iso(day), 'id': appt_id})
+    return no_show_model._day_iso(day), appt_id
+
+# (date, id) of the checkpoint each retrain read from, and the outcomes it read after it
+def ingested_rows(monkeypatch):
+    counts = []
+    load_new_outcomes = no_show_model.load_new_outcomes
+    def counting(checkpoint, today=None):
+        features, new_checkpoint = load_new_outcomes(checkpoint, today)
+        counts.append(((checkpoint['date'], checkpoint['id']), 0 if new_checkpoint is None else len(features[0])))
+        return features, new_checkpoint
+    monkeypatch.setattr(no_show_model, 'load_new_outcomes', counting)
+    return counts
+
+# Training rows after a (date, id) checkpoint
+def rows_after(checkpoint):
+    conn = sqlite3.connect('database.db')
+    day = no_show_model._day_number(no_show_model.date.fromisoformat(checkpoint[0]))
+    try:
+        return conn.execute("""SELECT COUNT(*) FROM appointments a
+                               JOIN users u ON a.patient_id = u.id JOIN hospitals h ON a.hospital_id = h.id
+                               WHERE a.appointment_day > ? OR (a.appointment_day = ? AND a.id > ?)""",
+                            (day, day, checkpoint[1])).fetchone()[0]
+    finally:
+        conn.close()
+
+def test_incremental_retrain_only_ingests_new_outcomes(deployed, synthetic_models, monkeypatch):
+    counts = ingested_rows(monkeypatch)
+    new_rows = rows_after(deployed)
+    assert new_rows > 20
+
+    assert no_show_model.retrain_incremental(min_rows=10)
+    checkpoint = no_show_model.read_checkpoint()
+    checkpoint = (checkpoint['date'], checkpoint['id'])
+    assert checkpoint == tuple(no_show_model.latest_outcome().values())
+    assert counts == [(deployed, new_rows)]
+
+    models = {name: joblib.load(os.path.join('model', filename)) for name, filename in MODEL_FILES.items()}
+    for target in ('no_show', 'reschedule'):
+        assert len(models[f'rf_{target}'].estimators_) == len(synthetic_models[f'rf_{target}'].estimators_) + no_show_model.RETRAIN_RF_TREES
+        assert models[f'xgb_{target}'].get_booster().num_boosted_rounds() == \
+            synthetic_models[f'xgb_{target}'].get_booster().num_boosted_rounds() + no_show_model.RETRAIN_XGB_ROUNDS
+    assert ModelRegistry(model_dir='model', backend='auto').get().backend == 'compiled'
+
+    # A second run starts from the advanced checkpoint and finds nothing to add
+    published = {name: os.stat(os.path.join('model', filename)).st_mtime_ns for name, filename in MODEL_FILES.items()}
+    assert not no_show_model.retrain_incremental(min_rows=1)
+    assert counts[1] == (checkpoint, 0)
+    assert no_show_model.read_checkpoint()['id'] == checkpoint[1]
+    assert {name: os.stat(os.path.join('model', filename)).st_mtime_ns for name, filename in MODEL_FILES.items()} == published
+
+def test_too_few_new_outcomes_leave_the_checkpoint(deployed, monkeypatch):
+    counts = ingested_rows(monkeypatch)
+    assert not no_show_model.retrain_incremental(min_rows=10**6)
+    assert counts[0][1] == rows_after(deployed)
+    assert (no_show_model.read_checkpoint()['date'], no_show_model.read_checkpoint()['id']) == deployed
+
+def test_first_run_only_records_a_checkpoint(training_dir):
+    assert no_show_model.read_checkpoint() is None
+    assert not no_show_model.retrain_incremental(min_rows=1)
+    checkpoint = no_show_model.read_checkpoint()
+    assert {key: checkpoint[key] for key in ('date', 'id')} == no_show_model.latest_outcome()
+    assert set(os.listdir('model')) == {no_show_model.RETRAIN_CHECKPOINT_FILE}
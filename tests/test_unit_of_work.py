@@ -0,0 +1,48 @@
+import pytest
+from appointment_time import format_day, format_slot
+from conftest import client_for
+from test_patient_stats import free_slot
+
+def test_failed_booking_rolls_back_the_insert_and_patient_stats(app_module, scoring_models, monkeypatch):
+    app = app_module
+    patient = client_for(app, 'patient')
+    with app.app.app_context():
+        doctor = app.query_db("SELECT id, hospital_id, department_id FROM doctors ORDER BY id LIMIT 1", one=True)
+        day = app.today_day() + 25
+        slot = free_slot(app, doctor['id'], day)
+        stats_before = app.query_db("SELECT * FROM patient_stats WHERE patient_id = ?", (patient.user_id,), one=True)
+        occupancy_before = app.slot_occupancy.get(doctor['id'], day)
+
+    # The stats update runs and then fails, after the appointment row is already written
+    update_patient_stats = app.update_patient_stats
+    def failing_update(*args, **kwargs):
+        update_patient_stats(*args, **kwargs)
+        raise RuntimeError("patient_stats write failed")
+    monkeypatch.setattr(app, 'update_patient_stats', failing_update)
+
+    response = patient.post('/book', data={
+        'hospital': doctor['hospital_id'], 'department': doctor['department_id'], 'doctor': doctor['id'],
+        'date': format_day(day), 'time': format_slot(slot)
+    })
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/book')
+
+    with app.app.app_context():
+        assert app.query_db(
+            "SELECT id FROM appointments WHERE patient_id = ? AND doctor_id = ? AND appointment_day = ? AND slot_minute = ?",
+            (patient.user_id, doctor['id'], day, slot)
+        ) == []
+        assert app.query_db("SELECT * FROM patient_stats WHERE patient_id = ?", (patient.user_id,), one=True) == stats_before
+        assert app.slot_occupancy.get(doctor['id'], day) == occupancy_before
+
+def test_unit_of_work_commits_nothing_when_the_block_raises(app_context):
+    app = app_context
+    patient_id = app.query_db("SELECT id FROM users WHERE role = 'patient' ORDER BY id LIMIT 1", one=True)['id']
+    count = app.query_db("SELECT COUNT(*) AS n FROM appointments", one=True)['n']
+    with pytest.raises(RuntimeError):
+        with app.unit_of_work():
+            app.query_db("INSERT INTO appointments (patient_id, status, updated_at) VALUES (?, ?, ?)",
+                         (patient_id, 'scheduled', app.changed_at()), commit=True)
+            assert app.query_db("SELECT COUNT(*) AS n FROM appointments", one=True)['n'] == count + 1
+            raise RuntimeError("abort")
+    assert app.query_db("SELECT COUNT(*) AS n FROM appointments", one=True)['n'] == count